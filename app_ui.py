@@ -6,7 +6,6 @@ import threading
 import time
 import backend
 import json
-import wave
 import tempfile
 
 
@@ -42,6 +41,10 @@ class MusicControlApp:
         self.log_frame = ttk.Frame(self.notebook)
         self.notebook.add(self.log_frame, text="日誌")
         
+        # 創建延遲頁
+        self.latency_frame = ttk.Frame(self.notebook)
+        self.notebook.add(self.latency_frame, text="延遲")
+        
         # 設置主控制頁
         self.setup_control_tab()
         
@@ -51,6 +54,9 @@ class MusicControlApp:
         # 設置日誌頁
         self.setup_log_tab()
         
+        # 設置延遲頁
+        self.setup_latency_tab()
+        
         # 設置狀態欄
         self.status_bar = ttk.Label(root, text="就緒", relief=tk.SUNKEN, anchor=tk.W)
         self.status_bar.pack(side=tk.BOTTOM, fill=tk.X)
@@ -123,11 +129,17 @@ class MusicControlApp:
         control_paned.add(music_frame, weight=1)
         
         # 設備連接區域內容
-        self.device_tree = ttk.Treeview(device_frame, columns=("Status",), height=10)
+        self.device_tree = ttk.Treeview(device_frame, columns=("Status", "Adapter", "Uptime", "Reconnects"), height=10)
         self.device_tree.heading("#0", text="設備名稱")
         self.device_tree.heading("Status", text="連接狀態")
+        self.device_tree.heading("Adapter", text="適配器")
+        self.device_tree.heading("Uptime", text="連線時間")
+        self.device_tree.heading("Reconnects", text="重新連線")
         self.device_tree.column("#0", width=180)
         self.device_tree.column("Status", width=100)
+        self.device_tree.column("Adapter", width=60)
+        self.device_tree.column("Uptime", width=80)
+        self.device_tree.column("Reconnects", width=70)
         self.device_tree.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
         
         # 新增設備框架
@@ -267,34 +279,25 @@ class MusicControlApp:
         horn_files_frame = ttk.LabelFrame(scrollable_frame, text="喇叭音效設定")
         horn_files_frame.pack(fill=tk.X, padx=10, pady=10)
         
-        # 喇叭音效前後設定
-        self.horn_file_vars = {}
-        
-        # 喇叭音效 (按壓前)
-        horn_before_frame = ttk.Frame(horn_files_frame)
-        horn_before_frame.pack(fill=tk.X, padx=5, pady=5)
-        
-        ttk.Label(horn_before_frame, text="喇叭音效 (按壓前):").pack(side=tk.LEFT, padx=5)
-        
-        self.horn_file_vars["before"] = tk.StringVar(value=backend.horn_audio_file_before)
-        entry = ttk.Entry(horn_before_frame, textvariable=self.horn_file_vars["before"], width=50)
-        entry.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
-        
-        ttk.Button(horn_before_frame, text="瀏覽", 
-                command=lambda: self.browse_file(self.horn_file_vars["before"])).pack(side=tk.LEFT, padx=5)
+        # 喇叭音效前後設定，每一組各有按壓前與按壓後的音效
+        self.horn_file_vars = {"before": {}, "after": {}}
+        horn_items = [("before", backend.horn_audio_file_before, "按壓前"),
+                      ("after", backend.horn_audio_file_after, "按壓後")]
         
-        # 喇叭音效 (按壓後)
-        horn_after_frame = ttk.Frame(horn_files_frame)
-        horn_after_frame.pack(fill=tk.X, padx=5, pady=5)
-        
-        ttk.Label(horn_after_frame, text="喇叭音效 (按壓後):").pack(side=tk.LEFT, padx=5)
-        
-        self.horn_file_vars["after"] = tk.StringVar(value=backend.horn_audio_file_after)
-        entry = ttk.Entry(horn_after_frame, textvariable=self.horn_file_vars["after"], width=50)
-        entry.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
-        
-        ttk.Button(horn_after_frame, text="瀏覽", 
-                command=lambda: self.browse_file(self.horn_file_vars["after"])).pack(side=tk.LEFT, padx=5)
+        for horn_set in sorted(backend.horn_audio_file_before):
+            for stage, files, stage_label in horn_items:
+                horn_frame = ttk.Frame(horn_files_frame)
+                horn_frame.pack(fill=tk.X, padx=5, pady=5)
+                
+                ttk.Label(horn_frame, text=f"喇叭第{horn_set}組 ({stage_label}):").pack(side=tk.LEFT, padx=5)
+                
+                var = tk.StringVar(value=files.get(horn_set, ""))
+                self.horn_file_vars[stage][horn_set] = var
+                entry = ttk.Entry(horn_frame, textvariable=var, width=50)
+                entry.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
+                
+                ttk.Button(horn_frame, text="瀏覽", 
+                        command=lambda v=var: self.browse_file(v)).pack(side=tk.LEFT, padx=5)
         
         # ========== 輪子音效設定區域 ==========
         wheel_files_frame = ttk.LabelFrame(scrollable_frame, text="輪子音效設定")
@@ -443,95 +446,35 @@ class MusicControlApp:
         messagebox.showinfo("成功", "歌單控制器已重新啟動")
 
     def save_all_settings(self):
-        """儲存所有音訊檔案設定"""
+        """儲存所有音訊檔案設定，檔案在背景載入完成後才會替換，不會卡住介面"""
         success = True
+        scheduled = 0
+        # 背景載入的結果由 _on_asset_saved 在介面執行緒中彙整
+        batch = {"remaining": 0, "failed": []}
+        on_loaded = lambda file_path, error: self.root.after(0, self._on_asset_saved, batch, file_path, error)
+        
+        # 各組設定：(登錄表組名, UI 變數, 目前的設定)
+        setting_groups = [
+            ("music", self.music_file_vars, backend.music_files),
+            ("horn_before", self.horn_file_vars["before"], backend.horn_audio_file_before),
+            ("horn_after", self.horn_file_vars["after"], backend.horn_audio_file_after),
+            ("wheel", self.wheel_file_vars, backend.wheel_audio_file),
+            ("rdp", self.rdp_file_vars, backend.rdp_audio_files)
+        ]
         
-        # 更新音樂檔案路徑
-        for idx, var in self.music_file_vars.items():
-            new_path = var.get().strip()
-            if new_path and new_path != backend.music_files.get(idx, ""):
-                if not backend.set_music_file_path(idx, new_path):
-                    success = False
-                    messagebox.showerror("錯誤", f"無法設置音樂 {idx} 的路徑: {new_path}")
-        
-        # 更新喇叭音效檔案路徑
-        if self.horn_file_vars["before"].get() != backend.horn_audio_file_before:
-            backend.horn_audio_file_before = self.horn_file_vars["before"].get()
-            try:
-                # 重新加載音訊文件
-                wf = wave.open(backend.horn_audio_file_before, 'rb')
-                audio_data = {
-                    'format': wf.getsampwidth(),
-                    'channels': wf.getnchannels(),
-                    'rate': wf.getframerate(),
-                    'frames': wf.readframes(wf.getnframes())
-                }
-                backend.loaded_audio_data[backend.horn_audio_file_before] = audio_data
-                wf.close()
-                self.update_status(f"已更新喇叭前置音效")
-            except Exception as e:
-                success = False
-                messagebox.showerror("錯誤", f"加載喇叭前置音效失敗: {e}")
-        
-        if self.horn_file_vars["after"].get() != backend.horn_audio_file_after:
-            backend.horn_audio_file_after = self.horn_file_vars["after"].get()
-            try:
-                # 重新加載音訊文件
-                wf = wave.open(backend.horn_audio_file_after, 'rb')
-                audio_data = {
-                    'format': wf.getsampwidth(),
-                    'channels': wf.getnchannels(),
-                    'rate': wf.getframerate(),
-                    'frames': wf.readframes(wf.getnframes())
-                }
-                backend.loaded_audio_data[backend.horn_audio_file_after] = audio_data
-                wf.close()
-                self.update_status(f"已更新喇叭後置音效")
-            except Exception as e:
-                success = False
-                messagebox.showerror("錯誤", f"加載喇叭後置音效失敗: {e}")
-        
-        # 更新輪子音效檔案路徑
-        for key, var in self.wheel_file_vars.items():
-            new_path = var.get().strip()
-            if new_path and new_path != backend.wheel_audio_file.get(key, ""):
-                backend.wheel_audio_file[key] = new_path
-                try:
-                    # 重新加載音訊文件
-                    wf = wave.open(new_path, 'rb')
-                    audio_data = {
-                        'format': wf.getsampwidth(),
-                        'channels': wf.getnchannels(),
-                        'rate': wf.getframerate(),
-                        'frames': wf.readframes(wf.getnframes())
-                    }
-                    backend.loaded_audio_data[new_path] = audio_data
-                    wf.close()
-                    self.update_status(f"已更新輪子音效 {key}")
-                except Exception as e:
+        for group, file_vars, current_files in setting_groups:
+            for key, var in file_vars.items():
+                new_path = var.get().strip()
+                if not new_path or new_path == current_files.get(key, ""):
+                    continue
+                if backend.request_asset_path(group, key, new_path, callback=on_loaded):
+                    scheduled += 1
+                else:
                     success = False
-                    messagebox.showerror("錯誤", f"加載輪子音效 {key} 失敗: {e}")
+                    messagebox.showerror("錯誤", f"找不到音效檔案: {new_path}")
         
-        # 更新RDP音效檔案路徑
-        for key, var in self.rdp_file_vars.items():
-            new_path = var.get().strip()
-            if new_path and new_path != backend.rdp_audio_files.get(key, ""):
-                backend.rdp_audio_files[key] = new_path
-                try:
-                    # 重新加載音訊文件
-                    wf = wave.open(new_path, 'rb')
-                    audio_data = {
-                        'format': wf.getsampwidth(),
-                        'channels': wf.getnchannels(),
-                        'rate': wf.getframerate(),
-                        'frames': wf.readframes(wf.getnframes())
-                    }
-                    backend.loaded_audio_data[new_path] = audio_data
-                    wf.close()
-                    self.update_status(f"已更新RDP音效 {key}")
-                except Exception as e:
-                    success = False
-                    messagebox.showerror("錯誤", f"加載RDP音效 {key} 失敗: {e}")
+        batch["remaining"] = scheduled
+        batch["success"] = success
         
         # 發送更新命令給歌單控制器
         if success:
@@ -541,8 +484,30 @@ class MusicControlApp:
             }
             # 發送配置更新命令
             backend.send_command_to_songlist("UPDATE_CONFIG", songlist_config)
-            
-            # 顯示成功訊息
+        
+        if scheduled:
+            # 背景載入完成後才顯示儲存結果
+            self.update_status(f"已排程在背景載入 {scheduled} 個音效檔案")
+        elif success:
+            self.update_status("所有設定已儲存")
+            messagebox.showinfo("成功", "所有設定已成功儲存")
+        else:
+            self.update_status("部分設定儲存失敗")
+    
+    def _on_asset_saved(self, batch, file_path, error):
+        """背景載入一個音效結束 (在介面執行緒中執行)，全部結束後顯示儲存結果"""
+        if error is not None:
+            batch["failed"].append(f"{file_path}: {error}")
+        batch["remaining"] -= 1
+        
+        if batch["remaining"] > 0:
+            self.update_status(f"背景載入音效中... 尚有 {batch['remaining']} 個")
+            return
+        
+        if batch["failed"]:
+            self.update_status("部分設定儲存失敗")
+            messagebox.showerror("錯誤", "以下音效檔案載入失敗:\n" + "\n".join(batch["failed"]))
+        elif batch["success"]:
             self.update_status("所有設定已儲存")
             messagebox.showinfo("成功", "所有設定已成功儲存")
         else:
@@ -557,6 +522,48 @@ class MusicControlApp:
         # 清除按鈕
         ttk.Button(self.log_frame, text="清除日誌", command=self.clear_log).pack(side=tk.RIGHT, padx=10, pady=5)
     
+    def setup_latency_tab(self):
+        # 各裝置觸發到發聲的延遲統計 (毫秒)
+        columns = ("stage", "count", "p50", "p95", "p99", "max")
+        self.latency_tree = ttk.Treeview(self.latency_frame, columns=columns)
+        self.latency_tree.heading("#0", text="裝置")
+        self.latency_tree.heading("stage", text="階段")
+        self.latency_tree.heading("count", text="次數")
+        self.latency_tree.heading("p50", text="p50 (ms)")
+        self.latency_tree.heading("p95", text="p95 (ms)")
+        self.latency_tree.heading("p99", text="p99 (ms)")
+        self.latency_tree.heading("max", text="最大 (ms)")
+        self.latency_tree.column("#0", width=180)
+        for column in columns:
+            self.latency_tree.column(column, width=80, anchor=tk.E)
+        self.latency_tree.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+        
+        # 重設按鈕
+        ttk.Button(self.latency_frame, text="重設統計", command=self.reset_latency_stats).pack(side=tk.RIGHT, padx=10, pady=5)
+    
+    def refresh_latency_stats(self):
+        """更新延遲統計表"""
+        stats = backend.get_latency_stats()
+        
+        for item in self.latency_tree.get_children():
+            self.latency_tree.delete(item)
+        
+        for device_name, stages in sorted(stats.items()):
+            for stage in backend.LATENCY_STAGES:
+                if stage not in stages:
+                    continue
+                values = stages[stage]
+                self.latency_tree.insert("", tk.END, text=device_name,
+                                         values=(stage, values['count'],
+                                                 f"{values['p50']:.1f}", f"{values['p95']:.1f}",
+                                                 f"{values['p99']:.1f}", f"{values['max']:.1f}"))
+    
+    def reset_latency_stats(self):
+        """清除延遲統計"""
+        backend.reset_latency_stats()
+        self.refresh_latency_stats()
+        self.update_status("已重設延遲統計")
+    
     def start_backend(self):
         """啟動後端服務"""
         self.backend_thread = backend.start_backend()
@@ -594,13 +601,25 @@ class MusicControlApp:
         for item in self.device_tree.get_children():
             self.device_tree.delete(item)
         
-        # 獲取設備連接狀態
+        # 獲取設備連接狀態與連線健康狀態
         status_dict = backend.get_connection_status()
+        health_dict = backend.get_device_health()
+        state_texts = {"scanning": "搜尋中", "connecting": "連接中", "backoff": "等待重連"}
         
         # 填充樹形列表
         for device_name, connected in status_dict.items():
-            status_text = "已連接" if connected else "未連接"
-            self.device_tree.insert("", "end", text=device_name, values=(status_text,))
+            health = health_dict.get(device_name)
+            if connected:
+                status_text = "已連接"
+            elif health is not None and health["state"] in state_texts:
+                status_text = state_texts[health["state"]]
+            else:
+                status_text = "未連接"
+            uptime_text = time.strftime("%H:%M:%S", time.gmtime(health["uptime"])) if health else "-"
+            reconnects_text = health["reconnects"] if health else "-"
+            adapter_text = (health["adapter"] or "-") if health else "-"
+            self.device_tree.insert("", "end", text=device_name,
+                                    values=(status_text, adapter_text, uptime_text, reconnects_text))
     
         # 添加歌單控制器顯示
         songlist_status = backend.get_songlist_controller_status()
@@ -691,6 +710,15 @@ class MusicControlApp:
                 if int(time.time()) % 5 == 0:
                     self.refresh_devices()
                 
+                # 預加載進行中時在狀態欄顯示進度
+                progress = backend.get_preload_progress()
+                if progress["total"] and progress["finished_at"] is None:
+                    self.update_status(f"預加載音效中... {progress['loaded'] + progress['failed']}/{progress['total']}")
+                
+                # 延遲頁顯示時才更新統計
+                if self.notebook.select() == str(self.latency_frame):
+                    self.refresh_latency_stats()
+                
                 time.sleep(0.5)  # 短暫休眠以降低CPU使用率
             except Exception as e:
                 print(f"UI更新錯誤: {e}")
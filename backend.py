@@ -1,34 +1,77 @@
+import time
+_import_started = time.perf_counter()  # 模組開始載入的時間，啟動計時報告以此為起點
 import asyncio
 import numpy as np
-from bleak import BleakClient, BleakScanner
-import pyaudio
-import time
 import wave
+import mmap
+import struct
+import hashlib
 import threading
 import os
-import pyaudio
-import numpy as np
-from scipy import signal
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from google.auth.transport.requests import Request
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaFileUpload
-import qrcode
-import os
+import importlib
+import contextlib
+from numpy.lib.stride_tricks import sliding_window_view
+from fractions import Fraction
+from collections import OrderedDict, deque
+import concurrent.futures
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 import pickle
 import json
+import queue
+import random
 import tempfile
-import sounddevice as sd
-import scipy.io.wavfile as wavfile
-import serial
-import threading
-from multiprocessing import Process
-import pygame
 import sys
+import atexit
+
+# ========== 延遲載入與啟動計時 ==========
+# 藍牙、串口、音訊輸出、WAV 解碼、上傳與 QR Code 套件都在第一次使用時才載入，
+# 選用套件沒有安裝時模組仍可匯入，只有用到的功能會失敗
+
+lazy_modules = {}                # 模組名稱 -> 已載入的模組
+startup_timings = OrderedDict()  # 階段名稱 -> {"seconds": 耗時, "at": 完成時距模組載入的秒數}
+startup_timings_lock = threading.Lock()
+
+def record_startup_stage(stage, seconds):
+    """記錄一個啟動階段的耗時 (秒)，同名階段只保留第一次"""
+    with startup_timings_lock:
+        if stage not in startup_timings:
+            startup_timings[stage] = {
+                "seconds": seconds,
+                "at": time.perf_counter() - _import_started
+            }
+
+@contextlib.contextmanager
+def startup_stage(stage):
+    """以 with 區塊計時一個啟動階段"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_startup_stage(stage, time.perf_counter() - started)
 
-serial_device = None
-serial_connected = False
+def lazy_import(module_name):
+    """第一次使用時才載入模組並記錄耗時，未安裝時拋出 ImportError"""
+    module = lazy_modules.get(module_name)
+    if module is None:
+        # importlib 本身對同一模組有鎖，不同模組可以在不同執行緒同時載入
+        started = time.perf_counter()
+        module = importlib.import_module(module_name)
+        record_startup_stage(f"import {module_name}", time.perf_counter() - started)
+        lazy_modules[module_name] = module
+    return module
+
+def get_startup_report():
+    """回傳啟動計時報告：自模組載入起經過的秒數與依完成順序排列的各階段"""
+    with startup_timings_lock:
+        stages = [dict(stage=name, **timing) for name, timing in startup_timings.items()]
+    return {"elapsed": time.perf_counter() - _import_started, "stages": stages}
+
+def log_startup_report():
+    """把啟動計時報告輸出到訊息記錄"""
+    report = get_startup_report()
+    log_message(f"啟動計時報告 (自載入模組起 {report['elapsed']:.2f} 秒):")
+    for stage in report["stages"]:
+        log_message(f"  {stage['stage']}: {stage['seconds'] * 1000:.1f} ms (於 {stage['at']:.2f} 秒完成)")
 
 audio_mixer = None
 
@@ -91,13 +134,13 @@ current_horn_set = {
     "ESP32_HornBLE_2": "3"   # 默認使用第一組
 }
 
-# 裝置與適配器的映射關係
+# 裝置偏好的適配器，實際使用哪個適配器由適配器排程依負載與健康狀態決定
 DEVICE_ADAPTER_MAP = {
     "ESP32_MusicSensor_BLE": "hci0",  # 音樂控制器走主適配器
     "ESP32_HornBLE": "hci0",          # 喇叭控制器也走主適配器
     "ESP32_HornBLE_2": "hci0",
-    "ESP32_RDP_BLE": "hci0",          # RDP控制器走外接適配器
-    "ESP32_Wheelspeed2_BLE": "hci0",  # 輪子速度控制器走外接適配器
+    "ESP32_RDP_BLE": "hci1",          # RDP控制器走外接適配器
+    "ESP32_Wheelspeed2_BLE": "hci1",  # 輪子速度控制器走外接適配器
     "ESP32_test_remote":"hci0"
 }
 
@@ -180,25 +223,6 @@ rdp_audio_files = {
     "RDP_record": "C:/Users/maboo/yzu_2025/yzu_2025_2/audio/RDP_record.wav"
 }
 
-# 原始裝置的頻道映射
-device_channel_mapping = {
-    "ESP32_HornBLE": 0,
-    "ESP32_HornBLE_2": 1,
-    "ESP32_Wheelspeed2_BLE": 2,
-    "ESP32_RDP_BLE": 3,
-    "ESP32_MusicSensor_BLE": 4,
-    "ESP32_test_remote": 5,
-    "Serial_Device": 6
-}
-
-# 循環播放時使用的頻道映射 (使用更高的頻道號碼避免衝突)
-device_loop_channel_mapping = {
-    "ESP32_HornBLE": 10,
-    "ESP32_HornBLE_2": 11,
-    "ESP32_Wheelspeed2_BLE": 12,
-    "ESP32_RDP_BLE": 13
-}
-
 # 設定ESP32裝置的UUID
 ESP32_DEVICES = [
     #"ESP32_HornBLE",           # 喇叭控制器
@@ -233,8 +257,8 @@ TOKEN_PATH = os.path.join(STORAGE_DIR, 'token.pickle')
 def auto_detect_serial_port():
     """自動偵測可用的串口"""
     try:
-        import serial.tools.list_ports
-        ports = list(serial.tools.list_ports.comports())
+        list_ports = lazy_import("serial.tools.list_ports")
+        ports = list(list_ports.comports())
         available_ports = []
         
         for port in ports:
@@ -374,7 +398,7 @@ def play_device_commands_thread():
 
 def replay_device_command(device_name, command_data):
     """使用專用頻道重放設備命令"""
-    global device_loop_channel_mapping, audio_mixer
+    global audio_mixer
     
     # 先記錄原始命令資料以便調試
     log_message(f"嘗試重放命令: 設備={device_name}, 命令資料類型={type(command_data)}, 值={command_data}")
@@ -532,41 +556,22 @@ def songlist_stop_music():
     return True
 
 def auto_connect_serial_device(preferred_ports=None):
-    
+    """立即連接所有可用的串口 (優先串口先連接)，至少連接一個時回傳 True"""
     all_ports = auto_detect_serial_port()
     if not all_ports:
         log_message("未發現可用串口")
         return False
     
-    # 如果有指定優先埠，先嘗試連接這些埠
-    if preferred_ports:
-        for port in preferred_ports:
-            if port in all_ports:
-                try:
-                    log_message(f"嘗試連接指定的優先串口: {port}")
-                    if connect_serial_device(port):
-                        log_message(f"成功連接到指定串口: {port}")
-                        return True
-                except Exception as e:
-                    log_message(f"連接串口 {port} 時發生錯誤: {e}")
-    
-    # 如果沒有指定優先埠或優先埠連接失敗，嘗試連接所有可用的埠
-    for port in all_ports:
-        # 如果是優先埠，已經嘗試過了，跳過
-        if preferred_ports and port in preferred_ports:
-            continue
-            
-        try:
-            log_message(f"嘗試連接串口: {port}")
-            if connect_serial_device(port):
-                log_message(f"成功自動連接串口: {port}")
-                return True
-            time.sleep(0.5)  # 短暫延遲避免太快重試
-        except Exception as e:
-            log_message(f"連接串口 {port} 時發生錯誤: {e}")
+    preferred_ports = preferred_ports or []
+    connected = 0
+    for port in sorted(all_ports, key=lambda port: port not in preferred_ports):
+        log_message(f"嘗試連接串口: {port}")
+        if connect_serial_device(port):
+            connected += 1
     
-    log_message("無法自動連接到有線裝置")
-    return False
+    if connected == 0:
+        log_message("無法自動連接到有線裝置")
+    return connected > 0
 
 def start_rdp_recording(selected_device_index=None):
     """開始錄製 RDP 專用音效"""
@@ -646,7 +651,9 @@ def start_rdp_recording(selected_device_index=None):
                     # 將浮點數組轉換為 16 位整數
                     int_data = (combined_data * 32767).astype(np.int16)
                     
-                    # 保存 WAV 文件
+                    # 保存 WAV 文件 (先釋放舊檔案的記憶體映射)
+                    if not release_audio_asset(rdp_audio_file_path):
+                        log_message("舊的RDP錄音檔案仍被映射，覆寫可能會失敗")
                     wavfile.write(rdp_audio_file_path, sample_rate, int_data)
                     
                     log_message(f"RDP錄音完成，檔案已保存到: {rdp_audio_file_path}")
@@ -659,15 +666,7 @@ def start_rdp_recording(selected_device_index=None):
                     
                     # 重新載入音訊檔案
                     try:
-                        wf = wave.open(rdp_audio_file_path, 'rb')
-                        audio_data = {
-                            'format': wf.getsampwidth(),
-                            'channels': wf.getnchannels(),
-                            'rate': wf.getframerate(),
-                            'frames': wf.readframes(wf.getnframes())
-                        }
-                        loaded_audio_data[rdp_audio_file_path] = audio_data
-                        wf.close()
+                        register_asset("rdp:RDP_record", processed_file)
                         log_message("RDP錄音檔案已成功載入")
                     except Exception as e:
                         log_message(f"載入RDP錄音檔案失敗: {e}")
@@ -728,19 +727,13 @@ def stop_rdp_recording():
         # 當錄音完成後，處理音檔移除開頭靜音
         if os.path.exists(rdp_audio_file_path):
             log_message("正在處理RDP錄音檔案，移除開頭靜音部分...")
+            if not release_audio_asset(rdp_audio_file_path):
+                log_message("RDP錄音檔案仍被映射，移除靜音後可能無法覆寫")
             processed_file = trim_silence_from_audio(rdp_audio_file_path)
             
             # 重新載入處理後的音訊檔案
             try:
-                wf = wave.open(processed_file, 'rb')
-                audio_data = {
-                    'format': wf.getsampwidth(),
-                    'channels': wf.getnchannels(),
-                    'rate': wf.getframerate(),
-                    'frames': wf.readframes(wf.getnframes())
-                }
-                loaded_audio_data[processed_file] = audio_data
-                wf.close()
+                register_asset("rdp:RDP_record", processed_file)
                 log_message("處理後的RDP錄音檔案已成功載入")
             except Exception as e:
                 log_message(f"載入處理後的RDP錄音檔案失敗: {e}")
@@ -780,12 +773,738 @@ def start_songlist_controller():
 
 def initialize_audio_system():
     global audio_mixer
-    # 使用 pygame 的混音模組 - 較容易實現多聲道混音
-    import pygame
-    pygame.mixer.init(frequency=44100, size=-16, channels=2, buffer=512)
-    pygame.mixer.set_num_channels(16)  # 支援最多16個同時播放的聲音
-    audio_mixer = pygame.mixer
-    log_message("初始化音訊系統完成 (使用 pygame 混音器)")
+    with startup_stage("initialize_audio_system"):
+        # 優先使用單一輸出串流的 NumPy 混音器，所有裝置共用同一個回調
+        if start_audio_mixer():
+            log_message("初始化音訊系統完成 (使用 NumPy 回調混音器)")
+            return
+        
+        # 無法開啟 PyAudio 輸出串流時，改用 pygame 的混音模組
+        try:
+            pygame = lazy_import("pygame")
+        except ImportError as e:
+            log_message(f"無法初始化音訊系統，pygame 未安裝: {e}")
+            return
+        pygame.mixer.init(frequency=44100, size=-16, channels=2, buffer=512)
+        pygame.mixer.set_num_channels(PYGAME_NUM_CHANNELS)  # 頻道由語音分配器管理
+        audio_mixer = pygame.mixer
+        log_message("初始化音訊系統完成 (使用 pygame 混音器)")
+
+def ensure_audio_system():
+    """確保音訊系統已初始化 (NumPy 混音器或 pygame 備援)"""
+    if mixer_stream is None and audio_mixer is None:
+        initialize_audio_system()
+
+# ========== PyAudio 主機與輸出串流池 ==========
+# 整個程式只初始化一次 PyAudio，輸出串流依 (取樣寬度, 聲道數, 採樣率) 重複使用
+
+OUTPUT_STREAM_POOL_MAX_IDLE = 2  # 每種格式最多保留的閒置串流數
+
+pyaudio_host = None
+pyaudio_host_lock = threading.Lock()
+output_stream_pool = {}  # (取樣寬度, 聲道數, 採樣率) -> 閒置串流列表
+output_stream_pool_lock = threading.Lock()
+
+def get_pyaudio_host():
+    """取得整個程式共用的 PyAudio 主機"""
+    global pyaudio_host
+    
+    with pyaudio_host_lock:
+        if pyaudio_host is None:
+            pyaudio_host = lazy_import("pyaudio").PyAudio()
+        return pyaudio_host
+
+def borrow_output_stream(sample_width, channels, rate):
+    """從串流池借出一個已開啟的輸出串流，沒有閒置串流時才開新的"""
+    key = (sample_width, channels, rate)
+    stream = None
+    
+    with output_stream_pool_lock:
+        idle_streams = output_stream_pool.get(key)
+        if idle_streams:
+            stream = idle_streams.pop()
+    
+    if stream is None:
+        host = get_pyaudio_host()
+        stream = host.open(format=host.get_format_from_width(sample_width),
+                           channels=channels,
+                           rate=rate,
+                           output=True)
+    elif stream.is_stopped():
+        stream.start_stream()
+    
+    return stream
+
+def return_output_stream(stream, sample_width, channels, rate):
+    """把輸出串流歸還到串流池，超過保留數量時才關閉"""
+    key = (sample_width, channels, rate)
+    
+    with output_stream_pool_lock:
+        idle_streams = output_stream_pool.setdefault(key, [])
+        if len(idle_streams) < OUTPUT_STREAM_POOL_MAX_IDLE:
+            idle_streams.append(stream)
+            return
+    
+    try:
+        stream.stop_stream()
+        stream.close()
+    except Exception as e:
+        print(f"關閉輸出串流時發生錯誤: {e}")
+
+def prewarm_output_streams(formats):
+    """預先開啟指定格式的輸出串流，formats 為 (取樣寬度, 聲道數, 採樣率) 的集合"""
+    for sample_width, channels, rate in formats:
+        try:
+            stream = borrow_output_stream(sample_width, channels, rate)
+            return_output_stream(stream, sample_width, channels, rate)
+        except Exception as e:
+            log_message(f"預先開啟輸出串流 {sample_width}/{channels}/{rate} 失敗: {e}")
+
+def close_output_stream_pool():
+    """關閉串流池中所有閒置串流"""
+    with output_stream_pool_lock:
+        streams = [stream for idle_streams in output_stream_pool.values() for stream in idle_streams]
+        output_stream_pool.clear()
+    
+    for stream in streams:
+        try:
+            stream.stop_stream()
+            stream.close()
+        except Exception as e:
+            print(f"關閉輸出串流時發生錯誤: {e}")
+
+# ========== 統一混音器 ==========
+# 一個常駐的 PyAudio 輸出串流，由回調函數把所有正在播放的聲音混成一個區塊
+
+MIXER_RATE = 44100        # 混音器輸出採樣率
+MIXER_CHANNELS = 2        # 混音器輸出聲道數
+MIXER_BLOCK_SIZE = 512    # 每次回調處理的幀數
+MIXER_MASTER_GAIN = 1.0   # 總音量
+SPEED_GLIDE_TIME = 0.03   # 速度變化的平滑時間常數 (秒)
+
+mixer_stream = None
+mixer_lock = threading.Lock()
+mixer_voices = {}          # 語音編號 -> 語音狀態
+mixer_next_voice_id = 1
+device_gains = {}          # 裝置名稱 -> 音量
+mixer_stats = {
+    "blocks": 0,               # 已輸出的區塊數
+    "underflows": 0,           # 輸出緩衝區欠載次數
+    "voices_started": 0,
+    "voices_finished": 0,
+    "callback_time_last": 0.0,  # 最近一次回調耗時 (秒)
+    "callback_time_max": 0.0    # 回調最長耗時 (秒)
+}
+
+def start_audio_mixer():
+    """開啟常駐的混音輸出串流，成功時回傳 True"""
+    global mixer_stream
+    
+    if mixer_stream is not None:
+        return True
+    
+    try:
+        mixer_stream = get_pyaudio_host().open(format=lazy_import("pyaudio").paInt16,
+                                               channels=MIXER_CHANNELS,
+                                               rate=MIXER_RATE,
+                                               output=True,
+                                               frames_per_buffer=MIXER_BLOCK_SIZE,
+                                               stream_callback=_mixer_callback)
+        mixer_stream.start_stream()
+        return True
+    except Exception as e:
+        log_message(f"無法開啟混音器輸出串流: {e}")
+        mixer_stream = None
+        return False
+
+def stop_audio_mixer():
+    """關閉混音輸出串流並清除所有語音"""
+    global mixer_stream
+    
+    with mixer_lock:
+        mixer_voices.clear()
+    
+    if mixer_stream is not None:
+        try:
+            mixer_stream.stop_stream()
+            mixer_stream.close()
+        except Exception as e:
+            log_message(f"關閉混音器串流時發生錯誤: {e}")
+        mixer_stream = None
+
+def _get_mixer_samples(audio_data):
+    """取得音效的 int16 樣本陣列 (幀數 x 聲道)，16 位元音效直接使用原始緩衝區不複製"""
+    samples = audio_data.get('samples')
+    if samples is not None:
+        return samples
+    
+    width = audio_data['format']
+    raw = audio_data['frames']
+    if width == 2:
+        samples = np.frombuffer(raw, dtype=np.int16)
+    elif width == 1:
+        # 8 位元 WAV 為無號數
+        samples = (np.frombuffer(raw, dtype=np.uint8).astype(np.int16) - 128) << 8
+    elif width == 4:
+        samples = (np.frombuffer(raw, dtype=np.int32) >> 16).astype(np.int16)
+    else:
+        raise ValueError(f"不支援的取樣寬度: {width} bytes")
+    
+    channels = audio_data['channels']
+    samples = samples[:len(samples) - len(samples) % channels].reshape(-1, channels)
+    audio_data['samples'] = samples
+    return samples
+
+def _render_voice(voice, frame_count):
+    """串流重取樣階段：依語音的位置與速度產生一個區塊 (float32)，回傳 (區塊, 有效幀數, 是否播放完畢)
+    
+    每個區塊都會讀取一次 target_speed，速度會平滑滑動到目標值，不需要重開串流。
+    """
+    if voice.get('scrub'):
+        return _render_scrub_voice(voice, frame_count)
+    
+    pending = voice.pop('pending_variant', None)
+    if pending is not None:
+        # 切換到另一個預先渲染的速度版本，位置與步進量依兩個版本的速度比例換算
+        variant_samples, variant_speed = pending
+        scale = voice['variant_speed'] / variant_speed
+        voice['samples'] = variant_samples
+        voice['variant_speed'] = variant_speed
+        voice['rate_ratio'] *= scale
+        voice['position'] = min(voice['position'] * scale, float(len(variant_samples)))
+    
+    samples = voice['samples']
+    total = len(samples)
+    position = voice['position']
+    start_speed = voice['speed']
+    target_speed = voice['target_speed']
+    
+    if start_speed != target_speed:
+        # 速度以指數曲線滑向目標值，區塊內每個樣本的步進量線性變化，避免突然跳動
+        alpha = 1.0 - float(np.exp(-frame_count / (SPEED_GLIDE_TIME * MIXER_RATE)))
+        end_speed = start_speed + (target_speed - start_speed) * alpha
+        if abs(target_speed - end_speed) < 1e-4:
+            end_speed = target_speed
+        voice['speed'] = end_speed
+        
+        steps = np.linspace(start_speed, end_speed, frame_count, endpoint=False) * voice['rate_ratio']
+        offsets = np.concatenate(([0.0], np.cumsum(steps[:-1])))
+        advance = offsets[-1] + steps[-1]
+        step = None
+    else:
+        step = start_speed * voice['rate_ratio']
+        offsets = None
+        advance = step * frame_count
+    
+    if step == 1.0 and position.is_integer():
+        # 原速播放：直接切片，不需要內插
+        start = int(position)
+        if voice['loop']:
+            indices = np.arange(start, start + frame_count) % total
+            block = samples[indices].astype(np.float32)
+        else:
+            block = samples[start:start + frame_count].astype(np.float32)
+    else:
+        # 變速或採樣率不同：以線性內插讀取
+        if offsets is None:
+            offsets = step * np.arange(frame_count)
+        positions = position + offsets
+        if voice['loop']:
+            positions = np.mod(positions, total)
+        else:
+            positions = positions[:int(np.searchsorted(positions, total))]
+        index0 = positions.astype(np.int64)
+        index1 = index0 + 1
+        if voice['loop']:
+            index1[index1 >= total] = 0
+        else:
+            np.minimum(index1, total - 1, out=index1)
+        frac = (positions - index0).astype(np.float32)[:, None]
+        sample0 = samples[index0].astype(np.float32)
+        block = sample0 + (samples[index1].astype(np.float32) - sample0) * frac
+    
+    valid = len(block)
+    new_position = float(position + advance)
+    if voice['loop']:
+        voice['position'] = new_position % total
+        finished = False
+    else:
+        voice['position'] = new_position
+        finished = new_position >= total
+    
+    return block, valid, finished
+
+def _mixer_callback(in_data, frame_count, time_info, status):
+    """PyAudio 回調：把所有語音混成一個輸出區塊"""
+    callback_start = time.perf_counter()
+    pyaudio = lazy_modules["pyaudio"]  # 串流開啟前已載入，回調中直接查表
+    
+    if status & pyaudio.paOutputUnderflow:
+        mixer_stats["underflows"] += 1
+    
+    out = np.zeros((frame_count, MIXER_CHANNELS), dtype=np.float32)
+    
+    with mixer_lock:
+        voices = list(mixer_voices.values())
+    
+    finished_ids = []
+    for voice in voices:
+        try:
+            block, valid, finished = _render_voice(voice, frame_count)
+            gain = voice['gain'] * device_gains.get(voice['device'], 1.0) * MIXER_MASTER_GAIN
+            
+            if voice['stopping']:
+                # 停止時在一個區塊內淡出，避免爆音
+                block = block * np.linspace(1.0, 0.0, valid, dtype=np.float32)[:, None]
+                finished = True
+            
+            if valid > 0:
+                out[:valid] += block[:, :MIXER_CHANNELS] * gain
+            
+            trace = voice.get('trace')
+            if trace is not None:
+                voice['trace'] = None
+                finish_latency_trace(trace, callback_start)
+        except Exception as e:
+            print(f"混音器處理 {voice['device']} 時發生錯誤: {e}")
+            finished = True
+        
+        if finished:
+            finished_ids.append(voice['id'])
+    
+    if finished_ids:
+        with mixer_lock:
+            for voice_id in finished_ids:
+                if mixer_voices.pop(voice_id, None) is not None:
+                    mixer_stats["voices_finished"] += 1
+    
+    np.clip(out, -32768, 32767, out=out)
+    out_bytes = out.astype(np.int16).tobytes()
+    
+    # 在錄音模式下收集混音後的輸出
+    if is_recording:
+        audio_buffer.append(out_bytes)
+    
+    elapsed = time.perf_counter() - callback_start
+    mixer_stats["blocks"] += 1
+    mixer_stats["callback_time_last"] = elapsed
+    if elapsed > mixer_stats["callback_time_max"]:
+        mixer_stats["callback_time_max"] = elapsed
+    
+    return (out_bytes, pyaudio.paContinue)
+
+def mixer_play(device_name, file_path, loop=False, gain=1.0, speed=1.0, exclusive=True, priority=None):
+    """在混音器上為裝置播放音效，回傳語音編號 (失敗時回傳 None)
+    
+    Args:
+        exclusive: 為 True 時先停止該裝置其他正在播放的聲音
+        priority: 語音優先權，預設依裝置的類別決定
+    """
+    voice = _build_mixer_voice(device_name, file_path, loop, gain, speed, priority)
+    if voice is None:
+        return None
+    return _add_mixer_voice(voice, exclusive)
+
+def _add_mixer_voice(voice, exclusive=True):
+    """向語音分配器取得位置並把語音加入混音器，回傳語音編號 (語音已滿時回傳 None)"""
+    global mixer_next_voice_id
+    
+    device_name = voice['device']
+    with mixer_lock:
+        if not _allocate_mixer_voice(device_name, voice['priority'], exclusive):
+            log_message(f"語音已滿，放棄 {device_name} 的音效: {voice['file_path']}")
+            return None
+        voice['id'] = mixer_next_voice_id
+        mixer_next_voice_id += 1
+        mixer_voices[voice['id']] = voice
+        mixer_stats["voices_started"] += 1
+    
+    return voice['id']
+
+def _build_mixer_voice(device_name, file_path, loop=False, gain=1.0, speed=1.0, priority=None):
+    """取得音效資料並建立語音狀態 (尚未加入混音器)，無法播放時回傳 None"""
+    try:
+        audio_data = wait_for_asset(file_path)
+    except TimeoutError as e:
+        log_message(f"放棄播放 {device_name} 的音效: {e}")
+        return None
+    
+    samples = _get_mixer_samples(audio_data)
+    if len(samples) == 0:
+        log_message(f"音效檔案沒有任何樣本: {file_path}")
+        return None
+    
+    # 有預先渲染好的速度版本時直接使用，原速播放不需要內插
+    variant_speed = 1.0
+    if speed != 1.0:
+        variant = get_speed_variant(file_path, speed)
+        if variant is not None:
+            samples = variant
+            variant_speed = _speed_key(speed)
+    
+    voice = {
+        'device': device_name,
+        'file_path': file_path,
+        'samples': samples,
+        'source_samples': _get_mixer_samples(audio_data),
+        'variant_speed': variant_speed,
+        'rate_ratio': audio_data['rate'] / MIXER_RATE / variant_speed,
+        'position': 0.0,
+        'loop': loop,
+        'gain': gain,
+        'speed': speed,
+        'target_speed': speed,
+        'stopping': False,
+        'priority': get_device_priority(device_name) if priority is None else priority,
+        'started_at': time.time(),
+        'trace': mark_latency_play()   # 觸發延遲追蹤，第一次混音時完成
+    }
+    return voice
+
+def mixer_stop(device_name, voice_id=None):
+    """淡出並停止裝置的聲音 (指定 voice_id 時只停止該語音)"""
+    stopped = 0
+    with mixer_lock:
+        for voice in mixer_voices.values():
+            if voice['device'] == device_name and (voice_id is None or voice['id'] == voice_id):
+                voice['stopping'] = True
+                stopped += 1
+    return stopped
+
+def mixer_stop_all():
+    """淡出並停止所有聲音"""
+    with mixer_lock:
+        for voice in mixer_voices.values():
+            voice['stopping'] = True
+
+def mixer_set_gain(device_name, gain):
+    """設定裝置的音量 (1.0 為原始音量)"""
+    device_gains[device_name] = gain
+
+def mixer_set_speed(device_name, speed):
+    """設定裝置的播放速度，正在播放的聲音會在下一個區塊開始平滑滑動到新速度
+    
+    只更新目標值，可以依感測器的頻率連續呼叫。新速度有預先渲染的版本時，
+    語音會在下一個區塊切換過去。
+    """
+    device_playback_speeds[device_name] = speed
+    with mixer_lock:
+        voices = [voice for voice in mixer_voices.values() if voice['device'] == device_name]
+    
+    for voice in voices:
+        if 'variant_speed' in voice and _speed_key(speed) != voice['variant_speed']:
+            if _speed_key(speed) == 1.0:
+                voice['pending_variant'] = (voice['source_samples'], 1.0)
+            else:
+                variant = get_speed_variant(voice['file_path'], speed)
+                if variant is not None:
+                    voice['pending_variant'] = (variant, _speed_key(speed))
+        voice['target_speed'] = speed
+
+def mixer_set_loop(device_name, loop):
+    """切換裝置正在播放的聲音是否循環"""
+    with mixer_lock:
+        for voice in mixer_voices.values():
+            if voice['device'] == device_name:
+                voice['loop'] = loop
+
+def mixer_is_playing(device_name):
+    """檢查裝置是否有正在播放的聲音"""
+    with mixer_lock:
+        return any(voice['device'] == device_name and not voice['stopping']
+                   for voice in mixer_voices.values())
+
+def get_mixer_stats():
+    """取得混音器的統計資料"""
+    with mixer_lock:
+        active = len(mixer_voices)
+    stats = dict(mixer_stats)
+    stats["active_voices"] = active
+    stats["block_duration"] = MIXER_BLOCK_SIZE / MIXER_RATE
+    return stats
+
+# ========== 位置拖曳語音 ==========
+# 讀取頭不依速度前進，而是跟著控制器送來的位置移動 (例如喇叭的彎曲程度)。
+# 兩次位置更新之間，目標位置依上一次更新的間隔線性內插；讀取頭再以單極點低通逐樣本追隨目標，
+# 音量依讀取頭移動的速度決定，停住時淡成靜音，不會輸出固定的直流值。
+
+SCRUB_SMOOTHING_TIME = 0.003     # 讀取頭追隨目標的平滑時間常數 (秒)
+SCRUB_MIN_RAMP = 0.005           # 目標位置內插的最短時間 (秒)
+SCRUB_MAX_RAMP = 0.1             # 更新間隔超過此值時視為重新開始移動，以最短時間內插
+SCRUB_FULL_GAIN_SPEED = 0.25     # 讀取頭速度達到原速的這個比例時為完整音量
+SCRUB_GAIN_TIME = 0.01           # 音量的平滑時間常數 (秒)
+SCRUB_SMOOTH_CHUNK = 128         # 濾波器一次計算的樣本數，避免衰減係數的次方溢位
+
+def _one_pole(start, goal, time_constant):
+    """單極點低通：y[n] = y[n-1] + alpha * (goal[n] - y[n-1])，y[-1] = start，回傳 float64 陣列"""
+    alpha = 1.0 - float(np.exp(-1.0 / max(time_constant * MIXER_RATE, 1e-9)))
+    decay = 1.0 - alpha
+    if decay <= 0.0:
+        return np.asarray(goal, dtype=np.float64).copy()
+    
+    output = np.empty(len(goal), dtype=np.float64)
+    powers = decay ** np.arange(1, SCRUB_SMOOTH_CHUNK + 1)
+    for begin in range(0, len(goal), SCRUB_SMOOTH_CHUNK):
+        chunk = goal[begin:begin + SCRUB_SMOOTH_CHUNK]
+        weights = powers[:len(chunk)]
+        # y[n] = decay^(n+1) * (start + alpha * sum(goal[k] / decay^(k+1)))
+        values = weights * (start + alpha * np.cumsum(chunk / weights))
+        output[begin:begin + len(chunk)] = values
+        start = values[-1]
+    return output
+
+def _render_scrub_voice(voice, frame_count):
+    """產生拖曳語音的一個區塊，回傳 (區塊, 有效幀數, 是否播放完畢)"""
+    voice.pop('pending_variant', None)  # 拖曳語音固定使用原始樣本
+    
+    samples = voice['samples']
+    total = len(samples)
+    target = voice['scrub_target']
+    goal = voice['scrub_goal']
+    ramp = voice['scrub_ramp']
+    
+    # 目標位置在更新間隔內線性內插，區塊之間接續
+    if ramp > 0:
+        progress = np.minimum(np.arange(1, frame_count + 1) / ramp, 1.0)
+        goals = goal + (target - goal) * progress
+        voice['scrub_goal'] = float(goals[-1])
+        voice['scrub_ramp'] = max(0.0, ramp - frame_count)
+    else:
+        goals = np.full(frame_count, target)
+        voice['scrub_goal'] = target
+    
+    previous = voice['position']
+    positions = _one_pole(previous, goals, SCRUB_SMOOTHING_TIME)
+    np.clip(positions, 0.0, total - 1, out=positions)
+    
+    # 讀取頭速度 (1.0 為原速) 決定音量
+    speeds = np.abs(np.diff(positions, prepend=previous)) / voice['rate_ratio']
+    gains = _one_pole(voice['scrub_gain'], np.minimum(speeds / SCRUB_FULL_GAIN_SPEED, 1.0), SCRUB_GAIN_TIME)
+    voice['scrub_gain'] = float(gains[-1])
+    voice['position'] = float(positions[-1])
+    
+    index0 = positions.astype(np.int64)
+    index1 = np.minimum(index0 + 1, total - 1)
+    frac = (positions - index0).astype(np.float32)[:, None]
+    sample0 = samples[index0].astype(np.float32)
+    block = sample0 + (samples[index1].astype(np.float32) - sample0) * frac
+    block *= gains.astype(np.float32)[:, None]
+    
+    return block, frame_count, False
+
+def mixer_play_scrub(device_name, file_path, position=0.0, gain=1.0, exclusive=True, priority=None):
+    """為裝置建立拖曳語音，讀取頭從 position (0.0 到 1.0) 開始，回傳語音編號 (失敗時回傳 None)"""
+    voice = _build_mixer_voice(device_name, file_path, gain=gain, priority=priority)
+    if voice is None:
+        return None
+    
+    start = min(max(position, 0.0), 1.0) * (len(voice['samples']) - 1)
+    voice.update({
+        'scrub': True,
+        'position': start,
+        'scrub_target': start,
+        'scrub_goal': start,
+        'scrub_ramp': 0.0,
+        'scrub_gain': 0.0,
+        'scrub_updated': time.perf_counter(),
+        'scrub_updates': 0
+    })
+    return _add_mixer_voice(voice, exclusive)
+
+def mixer_set_position(device_name, position):
+    """設定裝置拖曳語音的目標位置 (0.0 到 1.0)，回傳更新的語音數
+    
+    只更新目標值，可以依感測器的頻率連續呼叫，讀取頭會在下一個區塊開始移動。
+    """
+    position = min(max(position, 0.0), 1.0)
+    now = time.perf_counter()
+    with mixer_lock:
+        voices = [voice for voice in mixer_voices.values()
+                  if voice['device'] == device_name and voice.get('scrub') and not voice['stopping']]
+    
+    for voice in voices:
+        interval = now - voice['scrub_updated']
+        if interval > SCRUB_MAX_RAMP:
+            interval = SCRUB_MIN_RAMP
+        # 先設定內插長度再設定目標，回調不會以舊的長度跳到新目標
+        voice['scrub_ramp'] = max(interval, SCRUB_MIN_RAMP) * MIXER_RATE
+        voice['scrub_target'] = position * (len(voice['samples']) - 1)
+        voice['scrub_updated'] = now
+        voice['scrub_updates'] += 1
+        if voice['trace'] is None:
+            voice['trace'] = mark_latency_play()
+    return len(voices)
+
+def mixer_has_scrub(device_name):
+    """檢查裝置是否有正在播放的拖曳語音"""
+    with mixer_lock:
+        return any(voice['device'] == device_name and voice.get('scrub') and not voice['stopping']
+                   for voice in mixer_voices.values())
+
+# ========== 語音分配器 ==========
+# 取代固定頻道：每個裝置有同時發聲數上限，整體語音滿了時依優先權搶走
+# 優先權最低的語音 (同優先權時依 VOICE_STEAL_POLICY 選最舊或最小聲的)。
+# 混音器中被搶走的語音會在一個區塊內淡出，不會產生爆音。
+
+MIXER_MAX_VOICES = 32          # 混音器同時發聲的語音上限
+PYGAME_NUM_CHANNELS = 16       # pygame 備援模式的頻道數
+DEFAULT_DEVICE_POLYPHONY = 2   # 未設定的裝置最多同時發聲數
+VOICE_STEAL_POLICY = "oldest"  # "oldest" 搶最舊的語音，"quietest" 搶最小聲的語音
+
+# 優先權類別，數字越大越重要
+VOICE_PRIORITY_CLASSES = {
+    "music": 0,
+    "effect": 1,
+    "wheel": 2,
+    "horn": 3
+}
+
+DEVICE_VOICE_CLASS = {
+    "ESP32_HornBLE": "horn",
+    "ESP32_HornBLE_2": "horn",
+    "ESP32_Wheelspeed2_BLE": "wheel",
+    "ESP32_RDP_BLE": "effect",
+    "ESP32_MusicSensor_BLE": "music",
+    "ESP32_test_remote": "effect",
+    "Serial_Device": "music"
+}
+
+DEVICE_POLYPHONY = {
+    "ESP32_Wheelspeed2_BLE": 8,   # 輪子音效常常重疊
+    "ESP32_MusicSensor_BLE": 1,
+    "Serial_Device": 1
+}
+
+pygame_channel_voices = {}     # pygame 頻道編號 -> 語音資訊 (備援模式)
+voice_allocator_stats = {
+    "stolen_polyphony": 0,   # 因為裝置發聲數上限被搶走的語音
+    "stolen_priority": 0,    # 因為整體語音已滿被搶走的語音
+    "rejected": 0            # 沒有可搶的語音而放棄播放的次數
+}
+
+def _base_device_name(device_name):
+    """循環重放使用 Loop_ 前綴的裝置名稱，設定沿用原始裝置"""
+    return device_name[5:] if device_name.startswith("Loop_") else device_name
+
+def get_device_priority(device_name):
+    """取得裝置的語音優先權"""
+    voice_class = DEVICE_VOICE_CLASS.get(_base_device_name(device_name), "effect")
+    return VOICE_PRIORITY_CLASSES.get(voice_class, 1)
+
+def get_device_polyphony(device_name):
+    """取得裝置最多同時發聲數"""
+    return DEVICE_POLYPHONY.get(_base_device_name(device_name), DEFAULT_DEVICE_POLYPHONY)
+
+def _pick_voice_to_steal(candidates):
+    """依優先權與 VOICE_STEAL_POLICY 選出要被搶走的語音"""
+    if VOICE_STEAL_POLICY == "quietest":
+        return min(candidates, key=lambda v: (v['priority'],
+                                              v['gain'] * device_gains.get(v['device'], 1.0),
+                                              v['started_at']))
+    return min(candidates, key=lambda v: (v['priority'], v['started_at']))
+
+def _allocate_mixer_voice(device_name, priority, exclusive):
+    """為新語音騰出空間 (呼叫前須持有 mixer_lock)，回傳 False 表示沒有可用的語音"""
+    active = [v for v in mixer_voices.values() if not v['stopping']]
+    own = [v for v in active if v['device'] == device_name]
+    
+    if exclusive:
+        for voice in own:
+            voice['stopping'] = True
+        active = [v for v in active if v['device'] != device_name]
+    else:
+        limit = get_device_polyphony(device_name)
+        while own and len(own) >= limit:
+            victim = _pick_voice_to_steal(own)
+            victim['stopping'] = True
+            own.remove(victim)
+            active.remove(victim)
+            voice_allocator_stats["stolen_polyphony"] += 1
+    
+    while len(active) >= MIXER_MAX_VOICES:
+        candidates = [v for v in active if v['priority'] <= priority]
+        if not candidates:
+            voice_allocator_stats["rejected"] += 1
+            return False
+        victim = _pick_voice_to_steal(candidates)
+        victim['stopping'] = True
+        active.remove(victim)
+        voice_allocator_stats["stolen_priority"] += 1
+    
+    return True
+
+def allocate_pygame_channel(device_name, exclusive=True):
+    """pygame 備援模式：為裝置分配一個頻道，沒有可用頻道時回傳 None
+    
+    pygame 的頻道無法交叉淡出，被搶走的頻道會直接停止。
+    """
+    priority = get_device_priority(device_name)
+    
+    # 清掉已經播完的頻道
+    for index in list(pygame_channel_voices):
+        if not audio_mixer.Channel(index).get_busy():
+            del pygame_channel_voices[index]
+    
+    own = [v for v in pygame_channel_voices.values() if v['device'] == device_name]
+    if exclusive:
+        victims = own
+    else:
+        victims = []
+        limit = get_device_polyphony(device_name)
+        while own and len(own) - len(victims) >= limit:
+            victim = _pick_voice_to_steal([v for v in own if v not in victims])
+            victims.append(victim)
+            voice_allocator_stats["stolen_polyphony"] += 1
+    
+    for victim in victims:
+        audio_mixer.Channel(victim['channel']).stop()
+        del pygame_channel_voices[victim['channel']]
+    
+    free = [index for index in range(PYGAME_NUM_CHANNELS) if index not in pygame_channel_voices]
+    if free:
+        index = free[0]
+    else:
+        candidates = [v for v in pygame_channel_voices.values() if v['priority'] <= priority]
+        if not candidates:
+            voice_allocator_stats["rejected"] += 1
+            return None
+        victim = _pick_voice_to_steal(candidates)
+        audio_mixer.Channel(victim['channel']).stop()
+        index = victim['channel']
+        voice_allocator_stats["stolen_priority"] += 1
+    
+    pygame_channel_voices[index] = {
+        'device': device_name,
+        'channel': index,
+        'priority': priority,
+        'gain': 1.0,
+        'started_at': time.time()
+    }
+    return audio_mixer.Channel(index)
+
+def stop_pygame_channels(device_name):
+    """pygame 備援模式：停止裝置佔用的所有頻道"""
+    for index, voice in list(pygame_channel_voices.items()):
+        if voice['device'] == device_name:
+            audio_mixer.Channel(index).stop()
+            del pygame_channel_voices[index]
+
+def get_voice_allocator_stats():
+    """取得語音分配器的統計資料 (各裝置的發聲數與被搶走的次數)"""
+    active_by_device = {}
+    if mixer_stream is not None:
+        with mixer_lock:
+            voices = [v for v in mixer_voices.values() if not v['stopping']]
+    else:
+        voices = list(pygame_channel_voices.values())
+    for voice in voices:
+        active_by_device[voice['device']] = active_by_device.get(voice['device'], 0) + 1
+    
+    stats = dict(voice_allocator_stats)
+    stats["active_voices"] = len(voices)
+    stats["active_by_device"] = active_by_device
+    stats["max_voices"] = MIXER_MAX_VOICES if mixer_stream is not None else PYGAME_NUM_CHANNELS
+    return stats
 
 # 新增到 backend.py 中
 async def _disconnect_device(client):
@@ -803,63 +1522,266 @@ async def _disconnect_device(client):
     except Exception as e:
         log_message(f"斷開連接時發生錯誤: {e}")
 
-def connect_serial_device(port, baudrate=9600):
-    """連接有線裝置"""
-    global serial_device, serial_connected
+# ========== 有線串口裝置 ==========
+# 每個串口一個監聽執行緒，以阻塞讀取等待資料 (逾時只用來檢查是否要停止)，收到的位元組依換行切成命令，
+# 和藍牙裝置一樣放進分派佇列，閒置時不佔用 CPU，也不會有輪詢間隔造成的延遲。
+# 背景的串口管理執行緒定期列舉串口，新插入 (或重新插上) 的串口會自動連接。
+# 連接後送出身分詢問，裝置回覆 "ID:<裝置名稱>" 後，該串口的命令改以這個名稱分派。
+
+SERIAL_DEVICE_NAME = "Serial_Device"   # 沒有宣告身分的有線裝置使用的名稱
+SERIAL_BAUDRATE = 9600
+SERIAL_READ_TIMEOUT = 0.5              # 阻塞讀取的逾時 (秒)
+SERIAL_MAX_LINE_LENGTH = 256           # 超過此長度仍沒有換行時捨棄緩衝區
+SERIAL_SCAN_INTERVAL = 2.0             # 背景列舉串口的間隔 (秒)
+SERIAL_IDENTIFY_REQUEST = b"IDENTIFY\n"  # 連接後送給裝置的身分詢問
+SERIAL_IDENTITY_PREFIX = b"ID:"        # 裝置宣告身分的命令前綴
+SERIAL_USB_ONLY = True                 # 背景管理只自動連接 USB 串口 (略過內建與藍牙序列埠)
+
+# 串口 -> 固定的裝置名稱 (例如 {"COM11": "Serial_Device"})，指定的串口一定會被自動連接
+SERIAL_PORT_DEVICES = {}
+
+serial_ports = {}                # 串口 -> 連接狀態
+serial_ports_lock = threading.Lock()  # 保護 serial_ports 與 serial_port_failures
+serial_port_failures = {}        # 串口 -> 連續開啟失敗次數 (只記錄第一次失敗的訊息)
+serial_manager_thread = None
+serial_manager_stop = threading.Event()
+serial_stats = {
+    "lines": 0,        # 已放入分派佇列的命令數
+    "bytes": 0,        # 已讀取的位元組數
+    "overflows": 0,    # 因為沒有換行而捨棄緩衝區的次數
+    "errors": 0,       # 讀取錯誤次數
+    "connects": 0,     # 成功開啟串口的次數 (包含重新插上)
+    "scans": 0         # 背景列舉串口的次數
+}
+
+def connect_serial_device(port, baudrate=SERIAL_BAUDRATE):
+    """連接一個串口並啟動該串口的監聽執行緒，已連接時直接回傳 True"""
+    with serial_ports_lock:
+        if port in serial_ports:
+            return True
     
     try:
-        import serial
-        serial_device = serial.Serial(port, baudrate, timeout=1)
-        serial_connected = True
-        log_message(f"已連接到有線裝置，端口: {port}, 波特率: {baudrate}")
-        
-        # 啟動串口監聽線程
-        serial_thread = threading.Thread(target=serial_listener)
-        serial_thread.daemon = True
-        serial_thread.start()
-        
-        return True
+        serial = lazy_import("serial")
+        device = serial.Serial(port, baudrate, timeout=SERIAL_READ_TIMEOUT)
     except Exception as e:
-        log_message(f"連接有線裝置失敗: {e}")
-        serial_connected = False
+        with serial_ports_lock:
+            failures = serial_port_failures.get(port, 0)
+            serial_port_failures[port] = failures + 1
+        if failures == 0:
+            log_message(f"連接有線裝置 {port} 失敗: {e}")
         return False
+    
+    entry = {
+        'port': port,
+        'device': device,
+        'name': SERIAL_PORT_DEVICES.get(port, SERIAL_DEVICE_NAME),
+        'identified': port in SERIAL_PORT_DEVICES,
+        'connected_at': time.time(),
+        'lines': 0,
+        'thread': None
+    }
+    with serial_ports_lock:
+        if port in serial_ports:
+            # 另一個執行緒已經先連接了這個串口
+            device.close()
+            return True
+        serial_ports[port] = entry
+        serial_port_failures.pop(port, None)
+    
+    serial_stats["connects"] += 1
+    log_message(f"已連接到有線裝置，端口: {port}, 波特率: {baudrate}")
+    
+    if not entry['identified']:
+        try:
+            device.write(SERIAL_IDENTIFY_REQUEST)
+        except Exception as e:
+            log_message(f"向 {port} 送出身分詢問失敗: {e}")
+    
+    entry['thread'] = threading.Thread(target=serial_listener, args=(entry,), daemon=True)
+    entry['thread'].start()
+    return True
 
-def disconnect_serial_device():
-    """斷開有線裝置連接"""
-    global serial_device, serial_connected
+def disconnect_serial_device(port=None):
+    """斷開有線裝置 (不指定串口時斷開全部)，並等待監聽執行緒結束"""
+    with serial_ports_lock:
+        if port is None:
+            entries = list(serial_ports.values())
+            serial_ports.clear()
+        else:
+            entry = serial_ports.pop(port, None)
+            entries = [entry] if entry is not None else []
     
-    if serial_device and serial_connected:
+    for entry in entries:
         try:
-            serial_device.close()
-            log_message("已斷開有線裝置連接")
+            # 關閉串口會讓阻塞中的讀取立即返回 (最晚在讀取逾時後)
+            entry['device'].close()
+            log_message(f"已斷開有線裝置 {entry['name']} ({entry['port']})")
         except Exception as e:
-            log_message(f"斷開有線裝置時發生錯誤: {e}")
-        finally:
-            serial_connected = False
-            serial_device = None
+            log_message(f"斷開有線裝置 {entry['port']} 時發生錯誤: {e}")
+        
+        thread = entry['thread']
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout=SERIAL_READ_TIMEOUT + 0.5)
+
+def _split_serial_lines(buffer):
+    """從緩衝區取出所有完整的行 (會修改緩衝區)，回傳去除空白後的非空行"""
+    lines = []
+    while True:
+        end = buffer.find(b'\n')
+        if end < 0:
+            break
+        line = bytes(buffer[:end]).strip()
+        del buffer[:end + 1]
+        if line:
+            lines.append(line)
+    return lines
 
-def serial_listener():
-    """監聽串口數據"""
-    global serial_device, serial_connected
+def _handle_serial_line(entry, line):
+    """處理一行串口資料：身分宣告更新串口的裝置名稱，其他的放入分派佇列"""
+    if line.startswith(SERIAL_IDENTITY_PREFIX):
+        name = line[len(SERIAL_IDENTITY_PREFIX):].strip().decode('utf-8', errors='replace')
+        if name and name != entry['name']:
+            log_message(f"串口 {entry['port']} 的裝置宣告身分: {name}")
+            entry['name'] = name
+        entry['identified'] = True
+        return
     
-    log_message("開始監聽有線裝置...")
+    entry['lines'] += 1
+    serial_stats["lines"] += 1
+    enqueue_device_data(entry['name'], line)
+
+def serial_listener(entry):
+    """監聽一個串口：阻塞等待第一個位元組，再一次讀完已收到的資料"""
+    port = entry['port']
+    device = entry['device']
+    log_message(f"開始監聽有線裝置 {port}...")
+    buffer = bytearray()
     
-    while serial_connected and serial_device:
+    while serial_ports.get(port) is entry:
         try:
-            if serial_device.in_waiting > 0:
-                data = serial_device.readline().decode('utf-8').strip()
-                log_message(f"從有線裝置接收: {data}")
-                
-                # 處理來自有線裝置的命令，與RFID邏輯相同
-                process_data("Serial_Device", data.encode('utf-8'))
+            chunk = device.read(1)
+            if not chunk:
+                continue  # 讀取逾時，重新檢查是否要停止
+            waiting = device.in_waiting
+            if waiting:
+                chunk += device.read(waiting)
+        except Exception as e:
+            if serial_ports.get(port) is entry:
+                serial_stats["errors"] += 1
+                log_message(f"讀取串口 {port} 數據時發生錯誤: {e}")
+            break
+        
+        serial_stats["bytes"] += len(chunk)
+        buffer.extend(chunk)
+        for line in _split_serial_lines(buffer):
+            _handle_serial_line(entry, line)
+        
+        if len(buffer) > SERIAL_MAX_LINE_LENGTH:
+            serial_stats["overflows"] += 1
+            buffer.clear()
+    
+    # 串口被拔除或讀取失敗時釋放連接，重新插上後由串口管理執行緒重新連接
+    if serial_ports.get(port) is entry:
+        disconnect_serial_device(port)
+    log_message(f"有線裝置 {port} 監聽已停止")
+
+def _enumerate_serial_ports(preferred_ports=()):
+    """列出可以自動連接的串口 (指定或優先的串口不受 USB 限制)"""
+    list_ports = lazy_import("serial.tools.list_ports")
+    ports = []
+    for info in list_ports.comports():
+        if (info.device in SERIAL_PORT_DEVICES or info.device in preferred_ports
+                or not SERIAL_USB_ONLY or info.vid is not None):
+            ports.append(info.device)
+    return ports
+
+def _serial_manager_loop(preferred_ports):
+    """背景串口管理：定期列舉串口並連接新出現的串口"""
+    known_ports = set()
+    
+    while not serial_manager_stop.is_set():
+        try:
+            ports = _enumerate_serial_ports(preferred_ports)
         except Exception as e:
-            log_message(f"讀取串口數據時發生錯誤: {e}")
-            time.sleep(1)
+            log_message(f"串口管理無法列舉串口，停止背景偵測: {e}")
+            return
+        serial_stats["scans"] += 1
+        
+        present = set(ports)
+        for port in present - known_ports:
+            log_message(f"發現串口: {port}")
+        for port in known_ports - present:
+            # 沒有讀取錯誤就消失的串口也要釋放，重新出現時才會重新連接
+            with serial_ports_lock:
+                serial_port_failures.pop(port, None)
+            disconnect_serial_device(port)
+        known_ports = present
+        
+        # 優先串口先連接
+        for port in sorted(present, key=lambda port: port not in preferred_ports):
+            if serial_manager_stop.is_set():
+                break
+            if port not in serial_ports:
+                connect_serial_device(port)
+        
+        serial_manager_stop.wait(SERIAL_SCAN_INTERVAL)
+
+def start_serial_manager(preferred_ports=None):
+    """啟動背景串口管理執行緒"""
+    global serial_manager_thread
+    
+    if serial_manager_thread is not None and serial_manager_thread.is_alive():
+        return serial_manager_thread
+    
+    serial_manager_stop.clear()
+    serial_manager_thread = threading.Thread(target=_serial_manager_loop,
+                                             args=(list(preferred_ports or []),), daemon=True)
+    serial_manager_thread.start()
+    return serial_manager_thread
+
+def stop_serial_manager():
+    """停止背景串口管理並斷開所有有線裝置"""
+    global serial_manager_thread
+    
+    serial_manager_stop.set()
+    thread = serial_manager_thread
+    serial_manager_thread = None
+    if thread is not None and thread is not threading.current_thread():
+        thread.join(timeout=SERIAL_READ_TIMEOUT + 1.0)
+    disconnect_serial_device()
+
+def get_serial_stats():
+    """取得有線裝置的讀取統計與各串口的狀態"""
+    stats = dict(serial_stats)
+    now = time.time()
+    with serial_ports_lock:
+        stats["ports"] = {
+            port: {
+                'device': entry['name'],
+                'identified': entry['identified'],
+                'uptime': now - entry['connected_at'],
+                'lines': entry['lines']
+            }
+            for port, entry in serial_ports.items()
+        }
+    stats["manager_running"] = serial_manager_thread is not None and serial_manager_thread.is_alive()
+    return stats
 
 def disconnect_all_devices():
     """安全斷開所有裝置的連接"""
     log_message("正在斷開所有藍牙連接...")
     
+    loop = ble_loop
+    if loop is not None and loop.is_running():
+        # 連線屬於藍牙服務的事件迴圈，交由監督任務在該迴圈中斷線，且不再重新連線
+        try:
+            asyncio.run_coroutine_threadsafe(stop_device_supervisors(), loop).result(timeout=5.0)
+        except Exception as e:
+            log_message(f"停止藍牙連線監督時發生錯誤: {e}")
+        stop_serial_manager()
+        log_message("所有藍牙和串口連接已斷開")
+        return
+    
     # 建立一個新的事件循環來執行異步斷開連接操作
     loop = asyncio.new_event_loop()
     asyncio.set_event_loop(loop)
@@ -883,8 +1805,8 @@ def disconnect_all_devices():
     # 關閉事件循環
     loop.close()
     
-    # 斷開串口連接
-    disconnect_serial_device()
+    # 停止串口管理並斷開所有串口連接
+    stop_serial_manager()
     
     log_message("所有藍牙和串口連接已斷開")
 
@@ -900,10 +1822,10 @@ def get_credentials():
     # 如果沒有可用的憑證或已過期，則進行新的授權流程
     if not creds or not creds.valid:
         if creds and creds.expired and creds.refresh_token:
-            creds.refresh(Request())
+            creds.refresh(lazy_import("google.auth.transport.requests").Request())
         else:
             # 使用 credentials.json 啟動授權流程
-            flow = InstalledAppFlow.from_client_secrets_file(
+            flow = lazy_import("google_auth_oauthlib.flow").InstalledAppFlow.from_client_secrets_file(
                 'credentials.json', SCOPES)
             
             # 在本地伺服器上運行授權流程
@@ -932,7 +1854,7 @@ def authenticate_google_drive():
                 token_valid = True
             elif creds and creds.expired and creds.refresh_token:
                 try:
-                    creds.refresh(Request())
+                    creds.refresh(lazy_import("google.auth.transport.requests").Request())
                     token_valid = True
                 except Exception as e:
                     log_message(f"令牌刷新失敗: {e}")
@@ -951,7 +1873,7 @@ def authenticate_google_drive():
                 log_message(f"找不到 Google API 憑證文件: {CREDENTIALS_PATH}")
                 return None
                 
-            flow = InstalledAppFlow.from_client_secrets_file(
+            flow = lazy_import("google_auth_oauthlib.flow").InstalledAppFlow.from_client_secrets_file(
                 CREDENTIALS_PATH, SCOPES)
             creds = flow.run_local_server(port=0)
             
@@ -1016,7 +1938,7 @@ def upload_to_google_drive(file_path, folder_id="1H9Mp6ctGRFP0_PXRZ8ugjIJWVJu-lc
         else:
             file_name = os.path.basename(file_path)
         
-        service = build('drive', 'v3', credentials=creds)
+        service = lazy_import("googleapiclient.discovery").build('drive', 'v3', credentials=creds)
         
         # 檢查是否已存在同名檔案
         existing_file_id = None
@@ -1046,7 +1968,7 @@ def upload_to_google_drive(file_path, folder_id="1H9Mp6ctGRFP0_PXRZ8ugjIJWVJu-lc
             log_message(f"將檔案上傳到指定資料夾，資料夾 ID: {folder_id}")
         
         # 上傳媒體文件
-        media = MediaFileUpload(file_path, resumable=True)
+        media = lazy_import("googleapiclient.http").MediaFileUpload(file_path, resumable=True)
         
         if existing_file_id:
             # 更新現有檔案
@@ -1104,6 +2026,7 @@ def upload_to_google_drive(file_path, folder_id="1H9Mp6ctGRFP0_PXRZ8ugjIJWVJu-lc
 def generate_qr_code(url, filename="download_link"):
     """生成 QR Code 並保存為圖片"""
     try:
+        qrcode = lazy_import("qrcode")
         qr = qrcode.QRCode(
             version=1,
             error_correction=qrcode.constants.ERROR_CORRECT_L,
@@ -1124,21 +2047,272 @@ def generate_qr_code(url, filename="download_link"):
         log_message(f"生成 QR Code 時發生錯誤: {e}")
         return None
 
-def change_playback_speed(audio_data, speed):
-    """改變音訊資料的播放速度"""
-    if speed == 1.0:
-        return audio_data  # 速度不變，直接返回原始資料
-        
-    # 將位元組資料轉換為 numpy 陣列
-    audio_array = np.frombuffer(audio_data, dtype=np.int16)
+# ========== 多相重取樣器 ==========
+# 以視窗化 sinc 設計的多相濾波器組做變速，各聲道分開處理，可一次處理整首或分區塊串流處理
+
+RESAMPLE_HALF_TAPS = 16          # 濾波器單側長度 (輸入樣本數)
+RESAMPLE_MAX_DENOMINATOR = 100   # 速度比例化為分數時允許的最大分母
+
+resample_filter_cache = {}       # (up, down) -> (濾波器組, 單側長度)
+resample_filter_cache_lock = threading.Lock()
+
+def _get_resample_filter_bank(up, down):
+    """取得 (並快取) 指定比例的多相濾波器組，形狀為 (up, 濾波器長度)"""
+    key = (up, down)
+    with resample_filter_cache_lock:
+        cached = resample_filter_cache.get(key)
+    if cached is not None:
+        return cached
+    
+    # 降低採樣率時截止頻率跟著降低，濾波器加長以維持相同的過渡帶
+    cutoff = min(1.0, up / down)
+    half = int(np.ceil(RESAMPLE_HALF_TAPS / cutoff))
+    
+    # 第 p 個相位對應輸出位置的小數部分 p / up，濾波器覆蓋 base-half+1 ~ base+half
+    offsets = np.arange(up)[:, None] / up - np.arange(-half + 1, half + 1)[None, :]
+    window = 0.42 + 0.5 * np.cos(np.pi * offsets / half) + 0.08 * np.cos(2 * np.pi * offsets / half)
+    window[np.abs(offsets) >= half] = 0.0
+    bank = cutoff * np.sinc(cutoff * offsets) * window
+    # 每個相位正規化為單位直流增益
+    bank /= bank.sum(axis=1, keepdims=True)
+    
+    cached = (bank.astype(np.float32), half)
+    with resample_filter_cache_lock:
+        resample_filter_cache[key] = cached
+    return cached
+
+def create_resampler(speed, channels, max_denominator=RESAMPLE_MAX_DENOMINATOR):
+    """建立串流重取樣器狀態，speed > 1 時加速 (樣本數變少)"""
+    ratio = Fraction(speed).limit_denominator(max_denominator)
+    up, down = ratio.denominator, ratio.numerator
+    bank, half = _get_resample_filter_bank(up, down)
+    return {
+        'up': up,
+        'down': down,
+        'bank': bank,
+        'half': half,
+        'channels': channels,
+        # 緩衝區開頭補上 half - 1 個靜音，讓第一個輸出樣本也有完整的歷史資料
+        'buffer': np.zeros((half - 1, channels), dtype=np.float32),
+        'buffer_start': -(half - 1),  # 緩衝區第一個樣本的絕對輸入索引
+        'next_output': 0,             # 下一個輸出樣本的絕對索引
+        'input_total': 0              # 已輸入的幀數
+    }
+
+def resample_block(state, block):
+    """把一個區塊 (幀數 x 聲道) 送進重取樣器，回傳目前可以輸出的 float32 幀"""
+    up, down, half = state['up'], state['down'], state['half']
+    block = np.asarray(block, dtype=np.float32).reshape(-1, state['channels'])
+    state['input_total'] += len(block)
+    
+    buffer = np.concatenate((state['buffer'], block)) if len(block) else state['buffer']
+    buffer_start = state['buffer_start']
+    buffer_end = buffer_start + len(buffer)
+    
+    # 輸出 n 需要輸入索引 base-half+1 ~ base+half，其中 base = n * down // up
+    first = state['next_output']
+    last = ((buffer_end - half) * up - 1) // down
+    count = max(0, last - first + 1)
+    output = np.empty((count, state['channels']), dtype=np.float32)
+    
+    if count > 0:
+        # 每個輸入視窗都是緩衝區的視圖，不複製資料：(視窗數, 聲道, 濾波器長度)
+        windows = sliding_window_view(buffer, 2 * half, axis=0)
+        for residue in range(min(up, count)):
+            # 同一個相位的輸出彼此相隔 up 幀，對應的輸入視窗相隔 down 幀
+            n0 = first + residue
+            phase = (n0 * down) % up
+            start = (n0 * down) // up - half + 1 - buffer_start
+            selected = windows[start::down][:len(range(residue, count, up))]
+            output[residue::up] = selected @ state['bank'][phase]
+    
+    state['next_output'] = first + count
+    
+    # 只保留下一個輸出還需要用到的輸入樣本
+    keep_from = (state['next_output'] * down) // up - half + 1
+    drop = min(max(0, keep_from - buffer_start), len(buffer))
+    state['buffer'] = buffer[drop:]
+    state['buffer_start'] = buffer_start + drop
+    
+    return output
+
+def flush_resampler(state):
+    """輸入結束時補上靜音，輸出剩餘的樣本"""
+    input_total = state['input_total']
+    tail = resample_block(state, np.zeros((state['half'], state['channels']), dtype=np.float32))
+    
+    # 總輸出幀數 = ceil(輸入幀數 * up / down)
+    expected_total = -(-input_total * state['up'] // state['down'])
+    emitted_before = state['next_output'] - len(tail)
+    return tail[:max(0, expected_total - emitted_before)]
+
+def resample_frames(samples, speed, max_denominator=RESAMPLE_MAX_DENOMINATOR):
+    """一次重取樣整段樣本 (幀數 x 聲道)，回傳 float32 陣列"""
+    state = create_resampler(speed, samples.shape[1], max_denominator)
+    head = resample_block(state, samples)
+    return np.concatenate((head, flush_resampler(state)))
+
+def change_playback_speed(audio_data, speed, channels=2):
+    """改變音訊資料 (16 位元 PCM bytes) 的播放速度，各聲道分開重取樣"""
+    if speed == 1.0:
+        return audio_data  # 速度不變，直接返回原始資料
+    
+    # 將位元組資料轉換為 (幀數 x 聲道) 的 numpy 陣列
+    audio_array = np.frombuffer(audio_data, dtype=np.int16)
+    audio_array = audio_array[:len(audio_array) - len(audio_array) % channels].reshape(-1, channels)
     
-    # 使用 resample 函數來改變速度
     # 速度增加，樣本數減少；速度減少，樣本數增加
-    new_length = int(len(audio_array) / speed)
-    new_audio = signal.resample(audio_array, new_length)
+    new_audio = resample_frames(audio_array, speed)
     
     # 將處理後的資料轉回位元組格式
-    return new_audio.astype(np.int16).tobytes()
+    return np.clip(np.rint(new_audio), -32768, 32767).astype(np.int16).tobytes()
+
+# ========== 速度版本庫 ==========
+# 預加載時在背景行程池中把短音效渲染成幾個常用速度，切換到這些速度時只需要查表
+
+SPEED_VARIANT_LADDER = [0.5, 0.75, 1.25, 1.5, 2.0]   # 預先產生的速度 (空清單表示停用)
+SPEED_VARIANT_MAX_ASSET_SECONDS = 30.0               # 超過此長度的音效 (例如整首音樂) 不產生速度版本
+SPEED_VARIANT_MEMORY_LIMIT = 256 * 1024 * 1024       # 速度版本庫的記憶體上限 (bytes)
+SPEED_VARIANT_WORKERS = 2                            # 背景渲染行程數
+
+speed_variant_bank = OrderedDict()   # (檔案路徑, 速度) -> int16 樣本陣列，依最近使用排序
+speed_variant_lock = threading.Lock()
+speed_variant_executor = None
+speed_variant_pending = {}           # (檔案路徑, 速度) -> Future
+speed_variant_stats = {
+    "bytes": 0,          # 目前佔用的記憶體
+    "hits": 0,
+    "misses": 0,
+    "rendered": 0,
+    "evicted": 0,
+    "errors": 0
+}
+
+def _speed_key(speed):
+    """速度版本庫的鍵值，避免浮點誤差造成查不到"""
+    return round(float(speed), 4)
+
+def _render_speed_variant(samples, speed):
+    """在背景行程中把樣本陣列渲染成指定速度，回傳 int16 陣列"""
+    rendered = resample_frames(samples, speed)
+    return np.clip(np.rint(rendered), -32768, 32767).astype(np.int16)
+
+def _get_speed_variant_executor():
+    """取得 (必要時建立) 背景渲染用的行程池"""
+    global speed_variant_executor
+    if speed_variant_executor is None:
+        speed_variant_executor = ProcessPoolExecutor(max_workers=SPEED_VARIANT_WORKERS)
+    return speed_variant_executor
+
+def build_speed_variants(file_paths, ladder=None):
+    """在背景行程池中為音效產生速度版本，立即返回，完成的版本會自動存入版本庫"""
+    if ladder is None:
+        ladder = SPEED_VARIANT_LADDER
+    if not ladder:
+        return 0
+    
+    submitted = 0
+    for file_path in file_paths:
+        audio_data = loaded_audio_data.get(file_path)
+        if audio_data is None:
+            continue
+        
+        try:
+            samples = _get_mixer_samples(audio_data)
+        except Exception as e:
+            log_message(f"無法為 {file_path} 產生速度版本: {e}")
+            continue
+        
+        if len(samples) == 0 or len(samples) / audio_data['rate'] > SPEED_VARIANT_MAX_ASSET_SECONDS:
+            continue
+        
+        for speed in ladder:
+            key = (file_path, _speed_key(speed))
+            if key[1] == 1.0:
+                continue
+            with speed_variant_lock:
+                if key in speed_variant_bank or key in speed_variant_pending:
+                    continue
+                # 送出複本，等待中的工作不會持有記憶體映射的視圖
+                future = _get_speed_variant_executor().submit(_render_speed_variant, np.array(samples), key[1])
+                speed_variant_pending[key] = future
+            future.add_done_callback(lambda f, key=key, source=audio_data: _store_speed_variant(key, source, f))
+            submitted += 1
+    
+    return submitted
+
+def _store_speed_variant(key, source, future):
+    """背景渲染完成後把結果存入版本庫"""
+    with speed_variant_lock:
+        speed_variant_pending.pop(key, None)
+        
+        if future.cancelled():
+            return
+        try:
+            variant = future.result()
+        except Exception as e:
+            speed_variant_stats["errors"] += 1
+            print(f"產生速度版本 {key} 時發生錯誤: {e}")
+            return
+        
+        # 渲染期間檔案可能已重新載入或釋放，舊的結果直接丟棄
+        if loaded_audio_data.get(key[0]) is not source or 'samples' not in source:
+            return
+        
+        variant.setflags(write=False)
+        speed_variant_bank[key] = variant
+        speed_variant_stats["bytes"] += variant.nbytes
+        speed_variant_stats["rendered"] += 1
+        _evict_speed_variants_over_limit()
+
+def _evict_speed_variants_over_limit():
+    """超過記憶體上限時移除最久沒使用的版本 (呼叫前須持有 speed_variant_lock)"""
+    while speed_variant_bank and speed_variant_stats["bytes"] > SPEED_VARIANT_MEMORY_LIMIT:
+        _, variant = speed_variant_bank.popitem(last=False)
+        speed_variant_stats["bytes"] -= variant.nbytes
+        speed_variant_stats["evicted"] += 1
+
+def get_speed_variant(file_path, speed):
+    """查詢預先渲染好的速度版本，沒有時回傳 None"""
+    key = (file_path, _speed_key(speed))
+    with speed_variant_lock:
+        variant = speed_variant_bank.get(key)
+        if variant is None:
+            speed_variant_stats["misses"] += 1
+            return None
+        speed_variant_bank.move_to_end(key)
+        speed_variant_stats["hits"] += 1
+        return variant
+
+def evict_speed_variants(file_path=None):
+    """移除速度版本 (指定 file_path 時只移除該檔案的版本)，回傳移除的數量"""
+    removed = 0
+    with speed_variant_lock:
+        for key in list(speed_variant_bank):
+            if file_path is None or key[0] == file_path:
+                speed_variant_stats["bytes"] -= speed_variant_bank.pop(key).nbytes
+                removed += 1
+        for key in list(speed_variant_pending):
+            if file_path is None or key[0] == file_path:
+                speed_variant_pending.pop(key).cancel()
+        speed_variant_stats["evicted"] += removed
+    return removed
+
+def get_speed_variant_stats():
+    """取得速度版本庫的統計資料"""
+    with speed_variant_lock:
+        stats = dict(speed_variant_stats)
+        stats["entries"] = len(speed_variant_bank)
+        stats["pending"] = len(speed_variant_pending)
+    stats["memory_limit"] = SPEED_VARIANT_MEMORY_LIMIT
+    return stats
+
+def shutdown_speed_variants():
+    """關閉背景渲染行程池"""
+    global speed_variant_executor
+    if speed_variant_executor is not None:
+        speed_variant_executor.shutdown(wait=False, cancel_futures=True)
+        speed_variant_executor = None
 
 def set_ui_update_callback(callback):
     """設置UI更新回調函數"""
@@ -1159,155 +2333,886 @@ def log_message(message):
     if ui_update_callback:
         ui_update_callback(formatted_message)
 
-def preload_audio_files():
-    """預先加載所有音效檔案到記憶體中"""
+# ========== 標準格式轉檔快取 ==========
+# 不是 44.1kHz / 16 位元 / 立體聲 PCM 的檔案，在行程內解碼並重取樣後存到磁碟快取，
+# 重新啟動後直接載入快取檔，不必再轉檔，pygame 也不需要在載入時轉換格式。
+# 快取以來源檔的內容雜湊命名；路徑、大小、修改時間 -> 雜湊的對應存在 index.json，
+# 檔案沒有改變時不必重新計算雜湊。已經是標準格式的檔案也複製一份快照，記憶體映射的一律是
+# 快取中不會被原地改寫的檔案，來源檔被覆寫時正在播放的語音不會讀到改變中的資料。
+
+TRANSCODE_RATE = 44100
+TRANSCODE_CHANNELS = 2
+TRANSCODE_CACHE_DIR = os.path.join(STORAGE_DIR, "pcm_cache")
+TRANSCODE_INDEX_PATH = os.path.join(TRANSCODE_CACHE_DIR, "index.json")
+TRANSCODE_WORKERS = 2   # 同時轉檔的執行緒數 (轉檔很吃 CPU，與預加載分開限制)
+
+transcode_lock = threading.Lock()
+transcode_executor = None
+transcode_futures = {}          # 內容雜湊 -> 轉檔中的 Future
+transcode_index_loaded = False
+transcode_index_dirty = False   # asset_hash_cache 有尚未寫回磁碟的變更
+transcode_stats = {
+    "snapshots": 0,     # 已經是標準格式，只複製快照
+    "hits": 0,          # 使用磁碟快取
+    "converted": 0,     # 這次執行時轉檔
+    "errors": 0
+}
+
+def _load_transcode_index():
+    """從磁碟讀取路徑與內容雜湊的對應，放進 asset_hash_cache"""
+    global transcode_index_loaded
+    
+    with transcode_lock:
+        if transcode_index_loaded:
+            return
+        transcode_index_loaded = True
+    
+    try:
+        with open(TRANSCODE_INDEX_PATH, 'r', encoding='utf-8') as f:
+            for file_path, (size, mtime_ns, content_hash) in json.load(f).items():
+                asset_hash_cache.setdefault(file_path, (size, mtime_ns, content_hash))
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        log_message(f"讀取轉檔快取索引失敗，將重新計算: {e}")
+
+def _save_transcode_index():
+    """把路徑與內容雜湊的對應寫回磁碟 (先寫暫存檔再替換)"""
+    try:
+        os.makedirs(TRANSCODE_CACHE_DIR, exist_ok=True)
+        temp_path = TRANSCODE_INDEX_PATH + ".tmp"
+        with transcode_lock:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump({path: list(entry) for path, entry in list(asset_hash_cache.items())}, f)
+            os.replace(temp_path, TRANSCODE_INDEX_PATH)
+    except Exception as e:
+        log_message(f"寫入轉檔快取索引失敗: {e}")
+
+def flush_transcode_index():
+    """索引有變更時寫回磁碟 (預加載或背景重新載入一批檔案後，以及程式結束時呼叫)"""
+    global transcode_index_dirty
+    
+    if not transcode_index_dirty:
+        return
+    transcode_index_dirty = False
+    _save_transcode_index()
+
+atexit.register(flush_transcode_index)
+
+def is_standard_wav(file_path):
+    """檢查檔案是否已經是 44.1kHz / 16 位元 / 立體聲 PCM WAV"""
+    try:
+        with wave.open(file_path, 'rb') as wf:
+            return (wf.getframerate() == TRANSCODE_RATE and
+                    wf.getsampwidth() == 2 and
+                    wf.getnchannels() == TRANSCODE_CHANNELS)
+    except Exception:
+        return False  # 非 PCM 的 WAV (例如浮點數) 或其他格式
+
+def decode_audio_file(file_path):
+    """在行程內解碼 WAV 檔，回傳 (採樣率, float32 樣本陣列 (幀數 x 聲道)，範圍同 int16)"""
+    rate, data = lazy_import("scipy.io.wavfile").read(file_path)
+    if data.ndim == 1:
+        data = data[:, None]
+    
+    if data.dtype == np.int16:
+        samples = data.astype(np.float32)
+    elif data.dtype == np.uint8:
+        samples = (data.astype(np.float32) - 128.0) * 256.0
+    elif data.dtype == np.int32:
+        samples = data.astype(np.float32) / 65536.0  # 24/32 位元都是靠左對齊
+    elif data.dtype.kind == 'f':
+        samples = data.astype(np.float32) * 32767.0
+    else:
+        raise ValueError(f"不支援的樣本格式: {data.dtype}")
+    return rate, samples
+
+def _transcode_to_cache(file_path, cache_path):
+    """把檔案轉成標準格式並寫入快取 (在轉檔執行緒池中執行)"""
+    temp_path = cache_path + ".tmp"
+    try:
+        rate, samples = decode_audio_file(file_path)
+    except (ValueError, ImportError):
+        # 行程內無法解碼的格式 (例如 mp3) 或沒有安裝 scipy 時才交給 ffmpeg
+        log_message(f"無法在行程內解碼 {file_path}，改用 ffmpeg 轉檔")
+        if standardize_audio_file(file_path, temp_path + ".wav") == file_path:
+            raise
+        os.replace(temp_path + ".wav", cache_path)
+        return cache_path
+    
+    # 聲道：單聲道複製成立體聲，超過兩個聲道只保留前兩個
+    if samples.shape[1] == 1:
+        samples = np.repeat(samples, TRANSCODE_CHANNELS, axis=1)
+    elif samples.shape[1] > TRANSCODE_CHANNELS:
+        samples = samples[:, :TRANSCODE_CHANNELS]
+    
+    if rate != TRANSCODE_RATE:
+        # 以精確的分數比例重取樣 (例如 48000 -> 44100 為 160/147)
+        samples = resample_frames(samples, Fraction(rate, TRANSCODE_RATE), max_denominator=TRANSCODE_RATE)
+    
+    pcm = np.clip(np.rint(samples), -32768, 32767).astype(np.int16)
+    with wave.open(temp_path, 'wb') as wf:
+        wf.setnchannels(TRANSCODE_CHANNELS)
+        wf.setsampwidth(2)
+        wf.setframerate(TRANSCODE_RATE)
+        wf.writeframes(pcm.tobytes())
+    os.replace(temp_path, cache_path)
+    return cache_path
+
+def _snapshot_to_cache(file_path, cache_path, content_hash):
+    """把已經是標準格式的檔案複製到快取 (在轉檔執行緒池中執行)，複製期間內容改變時放棄"""
+    fd, temp_path = tempfile.mkstemp(suffix=".tmp", dir=TRANSCODE_CACHE_DIR)
+    try:
+        digest = hashlib.sha1()
+        with open(file_path, 'rb') as src, os.fdopen(fd, 'wb') as dst:
+            for block in iter(lambda: src.read(1 << 20), b''):
+                digest.update(block)
+                dst.write(block)
+        if digest.hexdigest() != content_hash:
+            raise ValueError("檔案在複製快照時被修改")
+        os.replace(temp_path, cache_path)
+    except Exception:
+        with contextlib.suppress(OSError):
+            os.remove(temp_path)
+        raise
+    return cache_path
+
+def get_normalized_path(file_path, content_hash=None):
+    """取得檔案的標準格式版本在快取中的路徑，必要時轉檔 (標準格式的檔案則複製快照)
+    
+    回傳的檔案以內容雜湊命名，只會被整個替換，不會被原地改寫，可以安全地記憶體映射。
+    需要轉檔時會等待轉檔完成才返回。轉檔執行緒池不會讓單一呼叫變快，而是限制多個預加載執行緒
+    同時轉檔的數量，並讓同時要求相同內容的呼叫共用同一次轉檔。
+    """
+    if content_hash is None:
+        content_hash = file_content_hash(file_path)
+    cache_path = os.path.join(TRANSCODE_CACHE_DIR, f"{content_hash}.wav")
+    if os.path.exists(cache_path):
+        transcode_stats["hits"] += 1
+        return cache_path
+    
+    standard = is_standard_wav(file_path)
+    
+    global transcode_executor
+    with transcode_lock:
+        future = transcode_futures.get(content_hash)
+        if future is None:
+            os.makedirs(TRANSCODE_CACHE_DIR, exist_ok=True)
+            if transcode_executor is None:
+                transcode_executor = ThreadPoolExecutor(max_workers=TRANSCODE_WORKERS, thread_name_prefix="transcode")
+            if standard:
+                future = transcode_executor.submit(_snapshot_to_cache, file_path, cache_path, content_hash)
+            else:
+                future = transcode_executor.submit(_transcode_to_cache, file_path, cache_path)
+            transcode_futures[content_hash] = future
+    
+    try:
+        result = future.result()
+        if standard:
+            transcode_stats["snapshots"] += 1
+        else:
+            transcode_stats["converted"] += 1
+            log_message(f"已轉換為標準格式並存入快取: {file_path}")
+        return result
+    except Exception as e:
+        transcode_stats["errors"] += 1
+        raise ValueError(f"轉換 {file_path} 失敗: {e}")
+    finally:
+        with transcode_lock:
+            transcode_futures.pop(content_hash, None)
+
+def get_transcode_stats():
+    """取得轉檔快取的統計資料"""
+    return dict(transcode_stats)
+
+# ========== 內容定址音效登錄表 ==========
+# 邏輯名稱 (例如 "rdp:default") 對應到檔案內容的雜湊值，內容相同的檔案只存一份 PCM。
+# 每份內容記錄被多少個邏輯名稱參照，從 UI 重新指定路徑後沒有名稱參照的內容會被釋放。
+
+ASSET_RELEASE_TIMEOUT = 1.0   # 釋放記憶體映射時等待最後一個樣本視圖被丟棄的時間上限 (秒)
+
+asset_names = {}         # 邏輯名稱 -> 內容雜湊
+asset_store = {}         # 內容雜湊 -> 音效資料
+asset_refcounts = {}     # 內容雜湊 -> 參照的邏輯名稱數
+asset_hash_cache = {}    # 檔案路徑 -> (大小, 修改時間, 內容雜湊)，檔案沒變時不必重新計算
+asset_registry_lock = threading.RLock()
+
+def _asset_groups():
+    """各組音效設定的字典，鍵值加上組名就是邏輯名稱"""
+    return {
+        "music": music_files,
+        "rdp": rdp_audio_files,
+        "wheel": wheel_audio_file,
+        "horn_before": horn_audio_file_before,
+        "horn_after": horn_audio_file_after
+    }
+
+def file_content_hash(file_path):
+    """計算檔案內容的 SHA-1，依檔案大小與修改時間快取結果 (由 flush_transcode_index 保存在磁碟上)"""
+    global transcode_index_dirty
+    
+    _load_transcode_index()
+    stat = os.stat(file_path)
+    cached = asset_hash_cache.get(file_path)
+    if cached is not None and cached[:2] == (stat.st_size, stat.st_mtime_ns):
+        return cached[2]
+    
+    digest = hashlib.sha1()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    content_hash = digest.hexdigest()
+    
+    asset_hash_cache[file_path] = (stat.st_size, stat.st_mtime_ns, content_hash)
+    transcode_index_dirty = True
+    return content_hash
+
+def _detach_asset_path(file_path):
+    """路徑改為指向其他內容時，從舊內容的路徑集合中移除 (呼叫前須持有 asset_registry_lock)"""
+    audio_data = loaded_audio_data.pop(file_path, None)
+    if audio_data is None or 'hash' not in audio_data:
+        return
+    audio_data['paths'].discard(file_path)
+    if not audio_data['paths'] and asset_refcounts.get(audio_data['hash'], 0) == 0:
+        asset_store.pop(audio_data['hash'], None)
+        _close_asset_mapping(audio_data)
+
+def _close_asset_mapping(audio_data):
+    """關閉已經沒有路徑或名稱參照的內容的記憶體映射，映射已關閉 (或沒有映射) 時回傳 True
+    
+    播放中的語音仍持有樣本視圖時回傳 False，映射會在最後一個視圖被丟棄時由 mmap 物件自行釋放。
+    """
+    mm = audio_data.get('mmap')
+    if mm is None:
+        return True
+    
+    audio_data.pop('samples', None)
+    try:
+        audio_data['frames'].release()
+        mm.close()
+    except BufferError:
+        return False
+    audio_data['mmap'] = None
+    return True
+
+def _drop_asset_content(content_hash):
+    """從登錄表移除一份內容及所有指向它的路徑 (呼叫前須持有 asset_registry_lock)"""
+    audio_data = asset_store.pop(content_hash, None)
+    asset_refcounts.pop(content_hash, None)
+    if audio_data is None:
+        return None
+    
+    for file_path in audio_data['paths']:
+        if loaded_audio_data.get(file_path) is audio_data:
+            del loaded_audio_data[file_path]
+        evict_speed_variants(file_path)
+    return audio_data
+
+def register_asset(name, file_path):
+    """把邏輯名稱指向檔案 (必要時載入)，名稱原本指向的內容沒有其他參照時會被釋放"""
+    audio_data = load_audio_asset(file_path)
+    
+    with asset_registry_lock:
+        new_hash = audio_data['hash']
+        old_hash = asset_names.get(name)
+        if old_hash == new_hash:
+            return audio_data
+        
+        asset_names[name] = new_hash
+        asset_refcounts[new_hash] = asset_refcounts.get(new_hash, 0) + 1
+        if old_hash is not None:
+            _unref_asset(old_hash)
+    
+    return audio_data
+
+def unregister_asset(name):
+    """移除邏輯名稱"""
+    with asset_registry_lock:
+        content_hash = asset_names.pop(name, None)
+        if content_hash is not None:
+            _unref_asset(content_hash)
+
+def _unref_asset(content_hash):
+    """減少內容的參照數，歸零時釋放 (呼叫前須持有 asset_registry_lock)"""
+    count = asset_refcounts.get(content_hash, 0) - 1
+    if count > 0:
+        asset_refcounts[content_hash] = count
+        return
+    
+    audio_data = _drop_asset_content(content_hash)
+    if audio_data is not None:
+        _close_asset_mapping(audio_data)
+        log_message(f"已釋放沒有使用的音效: {', '.join(sorted(audio_data['paths']))}")
+
+def get_asset(name):
+    """以邏輯名稱取得音效資料，沒有登錄時回傳 None"""
+    return asset_store.get(asset_names.get(name))
+
+def set_asset_path(group, key, new_path):
+    """重新指定某組音效的檔案路徑，載入新檔案並釋放不再使用的舊檔案"""
+    files = _asset_groups().get(group)
+    if files is None or not os.path.exists(new_path):
+        return False
+    
+    try:
+        register_asset(f"{group}:{key}", new_path)
+    except Exception as e:
+        log_message(f"加載 {new_path} 時發生錯誤: {e}")
+        return False
+    
+    files[key] = new_path
+    log_message(f"已更新並加載 {group} 音效 {key}: {new_path}")
+    return True
+
+def sync_asset_registry():
+    """依目前的音效設定登錄所有邏輯名稱"""
+    for group, files in _asset_groups().items():
+        for key, file_path in list(files.items()):
+            try:
+                register_asset(f"{group}:{key}", file_path)
+            except Exception as e:
+                print(f"登錄音效 {group}:{key} 時發生錯誤: {e}")
+
+def get_asset_registry_stats():
+    """取得登錄表的統計資料"""
+    with asset_registry_lock:
+        return {
+            "names": len(asset_names),
+            "assets": len(asset_store),
+            "paths": len(loaded_audio_data),
+            "bytes": sum(len(audio_data['frames']) for audio_data in asset_store.values()),
+            "shared_names": len(asset_names) - len(set(asset_names.values()))
+        }
+
+def load_audio_asset(file_path, reload=False):
+    """將音效檔案解碼一次並存入共用的音效儲存區 (pygame 與 PyAudio 共用同一份資料)
+    
+    內容相同的檔案 (依內容雜湊判斷) 共用同一份 PCM。
+    """
     global loaded_audio_data
     
-    print("預加載音效檔案...")
+    if not reload and file_path in loaded_audio_data:
+        return loaded_audio_data[file_path]
+    
+    if reload:
+        # 舊的速度版本已經不對應新的內容
+        evict_speed_variants(file_path)
     
-    # 加載音樂檔案
-    for key, file_path in music_files.items():
+    content_hash = file_content_hash(file_path)
+    with asset_registry_lock:
+        audio_data = asset_store.get(content_hash)
+        if audio_data is not None:
+            # 相同內容已經載入過 (例如 RDP.wav 同時是 "3" 與 "default")
+            if loaded_audio_data.get(file_path) is not audio_data:
+                _detach_asset_path(file_path)
+                audio_data['paths'].add(file_path)
+                loaded_audio_data[file_path] = audio_data
+            return audio_data
+    
+    # 使用轉檔快取中的版本：非標準格式載入時不必再轉換，標準格式則映射不會被改寫的快照
+    pcm_path = get_normalized_path(file_path, content_hash)
+    
+    audio_data = map_wav_file(pcm_path)
+    if audio_data is None:
+        # 無法映射的檔案 (例如空檔案) 才整個讀進記憶體
+        wf = wave.open(pcm_path, 'rb')
         try:
-            wf = wave.open(file_path, 'rb')
             audio_data = {
                 'format': wf.getsampwidth(),
                 'channels': wf.getnchannels(),
                 'rate': wf.getframerate(),
-                'frames': wf.readframes(wf.getnframes())  # 讀取整個檔案
+                'frames': wf.readframes(wf.getnframes()),  # 讀取整個檔案
+                'mmap': None
             }
-            loaded_audio_data[file_path] = audio_data
+        finally:
             wf.close()
-            print(f"已加載: {file_path}")
-        except Exception as e:
-            print(f"加載 {file_path} 時發生錯誤: {e}")
+    audio_data['sound'] = None  # 由 frames 建立的 pygame Sound，只建立一次
+    audio_data['pcm_path'] = pcm_path
+    
+    # 混音器已就緒時立即建立 Sound，觸發時就不必再做任何轉換
+    if audio_mixer is not None:
+        audio_data['sound'] = _build_sound_from_audio_data(file_path, audio_data)
     
-    # 加載 RDP 音效
-    for key, file_path in rdp_audio_files.items():
+    audio_data['hash'] = content_hash
+    audio_data['paths'] = set()
+    
+    with asset_registry_lock:
+        _detach_asset_path(file_path)
+        existing = asset_store.get(content_hash)
+        if existing is not None:
+            # 另一個執行緒同時載入了相同內容，使用先完成的那份並關閉這次建立的映射
+            _close_asset_mapping(audio_data)
+            audio_data = existing
+        else:
+            asset_store[content_hash] = audio_data
+        audio_data['paths'].add(file_path)
+        loaded_audio_data[file_path] = audio_data
+    return audio_data
+
+def map_wav_file(file_path):
+    """以記憶體映射開啟 WAV 檔，frames 是 PCM 資料區段的唯讀 memoryview，不會複製資料
+    
+    只用於轉檔快取中的檔案 (來源檔可能被原地改寫)。不是 PCM 格式或無法映射時回傳 None。
+    """
+    with open(file_path, 'rb') as f:
         try:
-            wf = wave.open(file_path, 'rb')
-            audio_data = {
-                'format': wf.getsampwidth(),
-                'channels': wf.getnchannels(),
-                'rate': wf.getframerate(),
-                'frames': wf.readframes(wf.getnframes())
-            }
-            loaded_audio_data[file_path] = audio_data
-            wf.close()
-            print(f"已加載 RDP 音效: {file_path}")
-        except Exception as e:
-            print(f"加載 {file_path} 時發生錯誤: {e}")
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            return None  # 空檔案無法映射
+    
+    try:
+        if mm[0:4] != b'RIFF' or mm[8:12] != b'WAVE':
+            raise ValueError("不是 RIFF/WAVE 檔案")
         
-    # 加載 Wheel 音效
-    for key, file_path in wheel_audio_file.items():
-        try:
-            wf = wave.open(file_path, 'rb')
-            audio_data = {
-                'format': wf.getsampwidth(),
-                'channels': wf.getnchannels(),
-                'rate': wf.getframerate(),
-                'frames': wf.readframes(wf.getnframes())
-            }
-            loaded_audio_data[file_path] = audio_data
-            wf.close()
-            print(f"已加載饅頭音效: {file_path}")
-        except Exception as e:
-            print(f"加載 {file_path} 時發生錯誤: {e}")
+        fmt = None
+        offset = 12
+        while offset + 8 <= len(mm):
+            chunk_id = mm[offset:offset + 4]
+            chunk_size = struct.unpack_from('<I', mm, offset + 4)[0]
+            body = offset + 8
             
-    # 加載 horn_before 音效集
-    for key, file_path in horn_audio_file_before.items():
+            if chunk_id == b'fmt ':
+                tag, channels, rate, _, _, bits = struct.unpack_from('<HHIIHH', mm, body)
+                if tag == 0xFFFE and chunk_size >= 26:
+                    tag = struct.unpack_from('<H', mm, body + 24)[0]  # WAVE_FORMAT_EXTENSIBLE 的子格式
+                if tag != 1:
+                    mm.close()
+                    return None
+                fmt = (channels, rate, (bits + 7) // 8)
+            elif chunk_id == b'data' and fmt is not None:
+                channels, rate, width = fmt
+                # 錄音中斷的檔案長度欄位可能不正確，以實際檔案大小為準
+                size = min(chunk_size, len(mm) - body)
+                size -= size % (width * channels)
+                return {
+                    'format': width,
+                    'channels': channels,
+                    'rate': rate,
+                    'frames': memoryview(mm)[body:body + size],
+                    'mmap': mm
+                }
+            
+            offset = body + chunk_size + (chunk_size & 1)
+        
+        raise ValueError("找不到 fmt 或 data 區段")
+    except Exception:
+        mm.close()
+        raise
+
+def release_audio_asset(file_path, timeout=ASSET_RELEASE_TIMEOUT):
+    """從音效儲存區移除檔案並釋放記憶體映射 (覆寫檔案之前呼叫，丟棄舊的內容)
+    
+    內容相同的其他路徑也會一起移除，之後使用時會重新載入。使用這份內容的語音會立即移除，
+    再等待混音器回調與背景渲染丟棄手上的樣本視圖後關閉映射。映射已關閉 (或沒有映射) 時回傳 True。
+    """
+    with asset_registry_lock:
+        audio_data = loaded_audio_data.get(file_path)
+        if audio_data is not None and 'hash' in audio_data:
+            _drop_asset_content(audio_data['hash'])
+        else:
+            loaded_audio_data.pop(file_path, None)
+    evict_speed_variants(file_path)
+    if audio_data is None:
+        return True
+    
+    # 移除仍在使用這份內容的語音，語音中的樣本陣列是映射的視圖
+    paths = audio_data.get('paths', {file_path})
+    with mixer_lock:
+        for voice_id in [voice_id for voice_id, voice in mixer_voices.items() if voice['file_path'] in paths]:
+            del mixer_voices[voice_id]
+            mixer_stats["voices_finished"] += 1
+    
+    mm = audio_data.get('mmap')
+    frames = audio_data.get('frames')
+    audio_data.clear()
+    if mm is None:
+        return True
+    
+    # 正在執行的混音器回調最多再使用一個區塊，之後就沒有任何視圖
+    deadline = time.monotonic() + timeout
+    while True:
         try:
-            wf = wave.open(file_path, 'rb')
-            audio_data = {
-                'format': wf.getsampwidth(),
-                'channels': wf.getnchannels(),
-                'rate': wf.getframerate(),
-                'frames': wf.readframes(wf.getnframes())
-            }
-            loaded_audio_data[file_path] = audio_data
-            wf.close()
-            print(f"已加載 horn_before_{key}: {file_path}")
+            frames.release()
+            mm.close()
+            return True
+        except BufferError:
+            if time.monotonic() >= deadline:
+                log_message(f"{file_path} 的樣本仍在使用中，無法釋放記憶體映射")
+                return False
+            time.sleep(MIXER_BLOCK_SIZE / MIXER_RATE)
+
+def _build_sound_from_audio_data(file_path, audio_data):
+    """由共用儲存區中的 PCM 資料建立 pygame Sound"""
+    mixer_rate, mixer_size, mixer_channels = audio_mixer.get_init()
+    
+    if (audio_data['rate'] == mixer_rate and
+            audio_data['format'] * 8 == abs(mixer_size) and
+            audio_data['channels'] == mixer_channels):
+        # 格式與混音器相同：直接用已解碼的 PCM 建立 Sound
+        sound = audio_mixer.Sound(buffer=audio_data['frames'])
+        
+        # pygame 會把資料複製到自己的緩衝區，之後改用 Sound 緩衝區的唯讀視圖並關閉記憶體映射，
+        # 讓同一份樣本只在記憶體中存在一次 (pygame 備援模式不會使用 NumPy 混音器的樣本陣列)
+        try:
+            view = memoryview(sound.get_view()).cast('B').toreadonly()
         except Exception as e:
-            print(f"加載 {file_path} 時發生錯誤: {e}")
+            log_message(f"無法共用 {file_path} 的 Sound 緩衝區，保留原始資料: {e}")
+        else:
+            _close_asset_mapping(audio_data)
+            audio_data['frames'] = view
+            audio_data['mmap'] = None
+    else:
+        # 格式不同時交給 pygame 轉換，只會在載入時執行一次
+        sound = audio_mixer.Sound(audio_data.get('pcm_path', file_path))
+    
+    return sound
+
+def get_audio_sound(file_path):
+    """取得音效的 pygame Sound 物件 (pygame 備援模式)，觸發時不會再讀取磁碟或重新解碼"""
+    ensure_audio_system()
+    
+    audio_data = wait_for_asset(file_path)
+    
+    if audio_data['sound'] is None:
+        audio_data['sound'] = _build_sound_from_audio_data(file_path, audio_data)
+    
+    return audio_data['sound']
+
+# ========== 背景重新載入服務 ==========
+# UI 重新指定的路徑與被修改的檔案都在背景執行緒中載入，完全準備好之後才替換，
+# 正在播放的語音仍持有舊的樣本陣列，會在舊緩衝區 (快取中的快照，不受來源檔改寫影響) 上播放完畢。
 
-    # 加載 horn_after 音效集
-    for key, file_path in horn_audio_file_after.items():
+ASSET_WATCH_INTERVAL = 2.0    # 檢查設定中的檔案是否被修改的間隔 (秒)
+
+asset_reload_queue = queue.Queue()
+asset_reload_thread = None
+asset_watch_thread = None
+asset_watch_state = {}        # 檔案路徑 -> 監看到的 (大小, 修改時間)
+asset_reload_status_lock = threading.Lock()   # pending 會被 UI、監看與背景執行緒同時修改
+asset_reload_status = {
+    "pending": 0,
+    "reloaded": 0,
+    "failed": 0,
+    "last_error": None
+}
+
+def start_asset_reload_service():
+    """啟動背景重新載入與檔案監看執行緒 (重複呼叫不會重複啟動)"""
+    global asset_reload_thread, asset_watch_thread
+    
+    if asset_reload_thread is None:
+        asset_reload_thread = threading.Thread(target=_asset_reload_worker, daemon=True)
+        asset_reload_thread.start()
+    if asset_watch_thread is None:
+        asset_watch_thread = threading.Thread(target=_asset_watch_loop, daemon=True)
+        asset_watch_thread.start()
+
+def request_asset_path(group, key, new_path, callback=None):
+    """排程重新指定音效路徑，立即返回 (UI 執行緒可以直接呼叫)
+    
+    新檔案在背景載入完成後才會替換，檔案不存在時回傳 False。
+    callback(檔案路徑, 錯誤) 在背景執行緒中於載入結束時呼叫，成功時錯誤為 None。
+    """
+    if group not in _asset_groups() or not os.path.exists(new_path):
+        return False
+    
+    start_asset_reload_service()
+    with asset_reload_status_lock:
+        asset_reload_status["pending"] += 1
+    asset_reload_queue.put((group, key, new_path, callback))
+    return True
+
+def _asset_reload_worker():
+    """依序處理重新載入的請求"""
+    while True:
+        group, key, file_path, callback = asset_reload_queue.get()
+        error = None
         try:
-            wf = wave.open(file_path, 'rb')
-            audio_data = {
-                'format': wf.getsampwidth(),
-                'channels': wf.getnchannels(),
-                'rate': wf.getframerate(),
-                'frames': wf.readframes(wf.getnframes())
-            }
-            loaded_audio_data[file_path] = audio_data
-            wf.close()
-            print(f"已加載 horn_after_{key}: {file_path}")
+            if group is None:
+                # 檔案內容被修改：重新載入後把指向該路徑的名稱改指到新內容
+                load_audio_asset(file_path, reload=True)
+                for group_name, files in _asset_groups().items():
+                    for name_key, path in list(files.items()):
+                        if path == file_path:
+                            register_asset(f"{group_name}:{name_key}", file_path)
+                log_message(f"偵測到檔案修改，已重新載入: {file_path}")
+            else:
+                # set_asset_path 先完整載入新檔案，最後才替換設定中的路徑
+                if not set_asset_path(group, key, file_path):
+                    raise ValueError(f"無法載入 {file_path}")
+            asset_reload_status["reloaded"] += 1
         except Exception as e:
-            print(f"加載 {file_path} 時發生錯誤: {e}")
+            error = e
+            asset_reload_status["failed"] += 1
+            asset_reload_status["last_error"] = str(e)
+            log_message(f"背景重新載入 {file_path} 失敗: {e}")
+        finally:
+            with asset_reload_status_lock:
+                asset_reload_status["pending"] -= 1
+            if asset_reload_queue.empty():
+                flush_transcode_index()
+        
+        if callback is not None:
+            try:
+                callback(file_path, error)
+            except Exception as e:
+                log_message(f"重新載入完成通知發生錯誤: {e}")
+
+def _asset_watch_loop():
+    """定期檢查設定中的檔案，大小或修改時間改變時排程重新載入"""
+    while True:
+        time.sleep(ASSET_WATCH_INTERVAL)
+        
+        watched = set()
+        for files in _asset_groups().values():
+            watched.update(files.values())
+        
+        for file_path in watched:
+            cached = asset_hash_cache.get(file_path)
+            if cached is None or file_path not in loaded_audio_data:
+                continue
+            try:
+                stat = os.stat(file_path)
+            except OSError:
+                continue  # 檔案暫時不存在 (例如正在被覆寫)
+            
+            current = (stat.st_size, stat.st_mtime_ns)
+            if current != asset_watch_state.get(file_path, cached[:2]):
+                asset_watch_state[file_path] = current  # 同一次修改只排程一次
+                with asset_reload_status_lock:
+                    asset_reload_status["pending"] += 1
+                asset_reload_queue.put((None, None, file_path, None))
+
+def get_asset_reload_status():
+    """取得背景重新載入的狀態"""
+    with asset_reload_status_lock:
+        return dict(asset_reload_status)
+
+# ========== 平行預加載 ==========
+# 音效在執行緒池中載入，可以與藍牙搜尋同時進行；觸發時音效還沒載入完成會等待該檔案
+
+PRELOAD_WORKERS = 4           # 預加載執行緒數
+PRELOAD_WAIT_TIMEOUT = 2.0    # 觸發時等待音效載入的最長時間 (秒)
+
+preload_executor = None
+asset_load_futures = {}       # 檔案路徑 -> 載入中的 Future
+asset_load_lock = threading.Lock()
+preload_asset_timings = {}    # 檔案路徑 -> 在執行緒池中載入的耗時 (秒)
+preload_progress = {
+    "total": 0,
+    "loaded": 0,
+    "failed": 0,
+    "current": None,          # 最近完成的音效
+    "started_at": None,
+    "finished_at": None
+}
+
+def _preload_order():
+    """依觸發時的重要性排列要預加載的音效，喇叭與 RDP 的 before/after 最先載入，整首音樂最後"""
+    rdp_hot = {key: path for key, path in rdp_audio_files.items() if key.endswith(("_before", "_after"))}
+    rdp_other = {key: path for key, path in rdp_audio_files.items() if key not in rdp_hot}
+    
+    audio_groups = [
+        ("horn_before", horn_audio_file_before),
+        ("horn_after", horn_audio_file_after),
+        ("RDP 音效", rdp_hot),
+        ("輪子音效", wheel_audio_file),
+        ("RDP 音效", rdp_other),
+        ("音樂", music_files)
+    ]
+    
+    ordered = []
+    seen = set()
+    for label, files in audio_groups:
+        for key, file_path in files.items():
+            # 同一個檔案可能出現在多個鍵 (例如 RDP.wav)，只載入一次
+            if file_path in seen:
+                continue
+            seen.add(file_path)
+            ordered.append((f"{label}_{key}", file_path))
+    return ordered
+
+def _submit_asset_load(file_path):
+    """排程在執行緒池中載入音效，已載入時回傳 None，已排程時回傳原本的 Future"""
+    with asset_load_lock:
+        if file_path in loaded_audio_data:
+            return None
+        future = asset_load_futures.get(file_path)
+        if future is None:
+            future = _get_preload_executor().submit(_load_asset_timed, file_path)
+            asset_load_futures[file_path] = future
+        return future
+
+def _load_asset_timed(file_path):
+    """在執行緒池中載入音效並記錄耗時"""
+    started = time.perf_counter()
+    try:
+        return load_audio_asset(file_path)
+    finally:
+        preload_asset_timings[file_path] = time.perf_counter() - started
+
+def _get_preload_executor():
+    """取得 (必要時建立) 預加載用的執行緒池 (呼叫前須持有 asset_load_lock)"""
+    global preload_executor
+    if preload_executor is None:
+        preload_executor = ThreadPoolExecutor(max_workers=PRELOAD_WORKERS, thread_name_prefix="preload")
+    return preload_executor
+
+def _finish_preload(build_variants):
+    """所有檔案都處理完畢後：記錄耗時、同步登錄表、寫回索引並排程速度版本"""
+    preload_progress["finished_at"] = time.time()
+    elapsed = preload_progress["finished_at"] - preload_progress["started_at"]
+    log_message(f"音效預加載完成: {preload_progress['loaded']} 個成功, "
+                f"{preload_progress['failed']} 個失敗, 耗時 {elapsed:.2f} 秒")
+    record_startup_stage("preload_audio_files", elapsed)
+    
+    # 所有檔案都已載入，登錄邏輯名稱只需要查表
+    sync_asset_registry()
+    flush_transcode_index()
+    
+    # 常用速度的版本在背景行程中產生，不阻塞預加載
+    if build_variants and SPEED_VARIANT_LADDER:
+        count = build_speed_variants(list(loaded_audio_data))
+        print(f"已排程 {count} 個速度版本在背景產生")
+
+def preload_audio_files(build_variants=True, wait=True):
+    """在執行緒池中預加載所有音效檔案，並依 SPEED_VARIANT_LADDER 在背景產生速度版本
+    
+    wait 為 False 時立即返回，可以與藍牙搜尋同時進行，進度可用 get_preload_progress() 查詢。
+    """
+    print("預加載音效檔案...")
+    
+    # 先初始化音訊系統，pygame 備援模式下每個音效會在載入時就建立好 Sound 物件
+    ensure_audio_system()
+    
+    ordered = _preload_order()
+    preload_progress.update({
+        "total": len(ordered),
+        "loaded": 0,
+        "failed": 0,
+        "current": None,
+        "started_at": time.time(),
+        "finished_at": None
+    })
+    # 最後一個檔案的完成處理 (登錄表同步、寫回索引、排程速度版本) 結束後才設定
+    finished = threading.Event()
+    if not ordered:
+        finished.set()
+    
+    def on_done(label, file_path, future):
+        error = None
+        if future is not None:
+            try:
+                future.result()
+            except Exception as e:
+                error = e
+        
+        with asset_load_lock:
+            asset_load_futures.pop(file_path, None)
+            preload_progress["failed" if error else "loaded"] += 1
+            preload_progress["current"] = label
+            done = preload_progress["loaded"] + preload_progress["failed"]
+        
+        if error:
+            print(f"加載 {file_path} 時發生錯誤: {error}")
+        else:
+            print(f"已加載 {label}: {file_path}")
+        
+        if done == preload_progress["total"]:
+            try:
+                _finish_preload(build_variants)
+            finally:
+                finished.set()
+    
+    # 依順序排入執行緒池，先排入的先載入
+    for label, file_path in ordered:
+        future = _submit_asset_load(file_path)
+        if future is None:
+            on_done(label, file_path, None)
+        else:
+            future.add_done_callback(lambda f, label=label, file_path=file_path: on_done(label, file_path, f))
+    
+    if wait:
+        finished.wait()
+
+def get_preload_progress():
+    """取得預加載的進度"""
+    progress = dict(preload_progress)
+    total = progress["total"]
+    progress["percent"] = 100.0 * (progress["loaded"] + progress["failed"]) / total if total else 100.0
+    return progress
+
+def wait_for_asset(file_path, timeout=None):
+    """取得音效資料：正在預加載時等待該檔案載入完成，沒有排程時直接載入
+    
+    超過 timeout (預設 PRELOAD_WAIT_TIMEOUT) 仍未載入完成時拋出 TimeoutError。
+    """
+    audio_data = loaded_audio_data.get(file_path)
+    if audio_data is not None:
+        return audio_data
+    
+    with asset_load_lock:
+        future = asset_load_futures.get(file_path)
+    
+    if future is None:
+        log_message(f"音效尚未預加載，立即載入: {file_path}")
+        return load_audio_asset(file_path)
+    
+    log_message(f"音效仍在預加載中，等待載入完成: {file_path}")
+    try:
+        return future.result(timeout=PRELOAD_WAIT_TIMEOUT if timeout is None else timeout)
+    except concurrent.futures.TimeoutError:
+        raise TimeoutError(f"等待 {file_path} 載入逾時")
 
 def play_audio_loop(device_name, file_path, initial_speed=1.0):
-    """使用預加載的資料循環播放音訊，支援速度控制"""
+    """使用預加載的資料循環播放音訊，速度可即時平滑變化而不需要重開串流"""
     global device_stop_flags, device_playback_speeds
     global audio_buffer
     
-    if file_path not in loaded_audio_data:
-        print(f"錯誤: 找不到預加載的音效檔案 {file_path}")
+    try:
+        audio_data = wait_for_asset(file_path)
+    except Exception as e:
+        print(f"錯誤: 無法取得音效檔案 {file_path}: {e}")
         return
     
     device_playback_speeds[device_name] = initial_speed
-    audio_data = loaded_audio_data[file_path]
-    p = pyaudio.PyAudio()
-    
-    # 取得原始資料
-    original_frames = audio_data['frames']
-    original_rate = audio_data['rate']
+    channels = audio_data['channels']
+    rate = audio_data['rate']
     
     device_stop_flags[device_name] = False
-    last_speed = device_playback_speeds[device_name]
-    
-    # 循環播放
-    while not device_stop_flags[device_name]:
-        # 根據當前速度計算新的播放率
-        adjusted_rate = int(original_rate * device_playback_speeds[device_name])
-        
-        # 開啟新的音訊流，使用調整後的播放率
-        stream = p.open(format=p.get_format_from_width(audio_data['format']),
-                       channels=audio_data['channels'],
-                       rate=adjusted_rate,
-                       output=True)
-                       
-        print(f"{device_name} 播放速度已設定為: {device_playback_speeds[device_name]}, 調整後播放率: {adjusted_rate}")
-        
-        # 分段播放整個檔案
-        chunk = 512
-        for i in range(0, len(original_frames), chunk * audio_data['format'] * audio_data['channels']):
-            if device_stop_flags[device_name] or last_speed != device_playback_speeds[device_name]:
-                break
-                
-            chunk_data = original_frames[i:i + chunk * audio_data['format'] * audio_data['channels']]
-            if len(chunk_data) > 0:
-                # 這裡直接使用原始數據，因為已經通過調整採樣率來改變播放速度
-                stream.write(chunk_data)
-                
-                # 在錄音模式下收集音訊數據
-                # 修改 play_audio_loop 函數中的這部分代碼
+    
+    # 串流固定使用原始採樣率，變速交給重取樣階段處理
+    voice = {
+        'samples': _get_mixer_samples(audio_data),
+        'rate_ratio': 1.0,
+        'position': 0.0,
+        'loop': True,
+        'speed': initial_speed,
+        'target_speed': initial_speed
+    }
+    stream = borrow_output_stream(2, channels, rate)
+    print(f"{device_name} 開始循環播放，初始速度: {initial_speed}")
+    
+    chunk = 512
+    try:
+        while not device_stop_flags[device_name]:
+            # 每個區塊讀取一次目前的速度
+            voice['target_speed'] = device_playback_speeds[device_name]
+            block, valid, finished = _render_voice(voice, chunk)
+            
+            chunk_data = np.clip(block, -32768, 32767).astype(np.int16).tobytes()
+            stream.write(chunk_data)
+            
+            # 在錄音模式下收集音訊數據
             if is_recording:
-                # 直接添加原始音訊數據，不做任何處理或壓縮
-                # 重要：確保完全相同的複製
-                audio_buffer_copy = chunk_data[:]  # 創建完整副本，避免引用問題
-                audio_buffer.append(audio_buffer_copy)
+                audio_buffer.append(chunk_data)
                 audio_last_update_time = time.time()
-        
-        # 關閉流，準備下一次迭代
-        stream.stop_stream()
-        stream.close()
-        
-        # 更新上次速度
-        last_speed = device_playback_speeds[device_name]
-    
-    # 清理資源
-    p.terminate()
-    print(f"{device_name} 音訊播放停止")
+    except Exception as e:
+        print(f"播放音訊時出錯: {e}")
+    finally:
+        # 歸還串流，留給下一次播放使用
+        return_output_stream(stream, 2, channels, rate)
+        print(f"{device_name} 音訊播放停止")
 
 def play_wheel_music_without_stopping(file_path, loop=False, speed=1.0):
     """不中斷先前音訊，為輪子裝置播放新的音效"""
@@ -1317,107 +3222,95 @@ def play_wheel_music_without_stopping(file_path, loop=False, speed=1.0):
     # 設定初始速度
     device_playback_speeds[device_name] = speed
     
-    # 初始化 pygame.mixer (如果還沒初始化)
-    if audio_mixer is None:
-        initialize_audio_system()
+    ensure_audio_system()
     
     # 載入並播放新的音效
     try:
-        sound = audio_mixer.Sound(file_path)
-        
-        # 獲取輪子裝置的固定頻道編號
-        wheel_channel_num = device_channel_mapping.get(device_name, 2)  # 預設使用頻道2
+        if mixer_stream is not None:
+            # 混音器可同時播放多個語音，不停止同一裝置先前的聲音
+            voice_id = mixer_play(device_name, file_path, loop=loop, speed=speed, exclusive=False)
+            log_message(f"不中斷先前播放，為 {device_name} 播放: {file_path}, 速度: {speed}")
+            return voice_id is not None
         
-        # 使用第二個輪子頻道 (假設我們為輪子裝置分配兩個頻道)
-        wheel_effect_channel_num = wheel_channel_num + 7  # 使用更高頻道號碼，避免與主頻道衝突
+        sound = get_audio_sound(file_path)
         
-        # 獲取指定頻道
-        channel = audio_mixer.Channel(wheel_effect_channel_num)
-        
-        # 在該頻道上播放音效
+        # 由語音分配器取得頻道，同時發聲數超過上限時搶走最舊的輪子音效
+        channel = allocate_pygame_channel(device_name, exclusive=False)
+        if channel is None:
+            log_message(f"沒有可用的頻道，放棄 {device_name} 的音效: {file_path}")
+            return False
         channel.play(sound, -1 if loop else 0)
+        trace = mark_latency_play()
+        if trace is not None:
+            finish_latency_trace(trace)
         
-        # 不存儲到 device_audio_channels 中，讓它獨立播放
-        
-        log_message(f"不中斷先前播放，為 {device_name} 播放: {file_path}, 速度: {speed}, 頻道: {wheel_effect_channel_num}")
+        log_message(f"不中斷先前播放，為 {device_name} 播放: {file_path}, 速度: {speed}")
         return True
     except Exception as e:
         log_message(f"播放輪子音效失敗: {e}")
         return False
 
 def play_audio_once(device_name, file_path, speed=1.0):
-    """使用預加載的資料播放音訊一次，支援即時速度控制"""
+    """使用預加載的資料播放音訊一次，變速由重取樣階段處理"""
     global device_stop_flags
     global audio_buffer
     
-    if file_path not in loaded_audio_data:
-        print(f"錯誤: 找不到預加載的音效檔案 {file_path}")
+    try:
+        audio_data = wait_for_asset(file_path)
+    except Exception as e:
+        print(f"錯誤: 無法取得音效檔案 {file_path}: {e}")
         return
     
     # 提前檢查停止標誌
     if device_stop_flags[device_name]:
         print(f"{device_name} 播放被停止標誌阻止")
         return
+
+    channels = audio_data['channels']
+    rate = audio_data['rate']
     
-    audio_data = loaded_audio_data[file_path]
-    p = pyaudio.PyAudio()
-    
-    # 取得原始資料
-    original_format = audio_data['format']
-    original_channels = audio_data['channels']
-    original_rate = audio_data['rate']
-    frames = audio_data['frames']
-    
-    # 調整播放速率根據速度參數
-    adjusted_rate = int(original_rate * speed)
+    voice = {
+        'samples': _get_mixer_samples(audio_data),
+        'rate_ratio': 1.0,
+        'position': 0.0,
+        'loop': False,
+        'speed': speed,
+        'target_speed': speed
+    }
     
-    # 開啟音訊流，使用調整後的播放率
-    stream = p.open(format=p.get_format_from_width(original_format),
-                   channels=original_channels,
-                   rate=adjusted_rate,  # 使用調整後的播放率
-                   output=True)
+    # 從串流池借用原始採樣率的輸出串流
+    stream = borrow_output_stream(2, channels, rate)
     
-    print(f"{device_name} 單次播放速度設定為: {speed}, 調整後播放率: {adjusted_rate}")
+    print(f"{device_name} 單次播放速度設定為: {speed}")
     
     # 使用適中的塊大小
     chunk = 256
     
     try:
-        # 分段播放整個檔案
-        for i in range(0, len(frames), chunk * original_format * original_channels):
+        finished = False
+        while not finished:
             # 檢查停止標誌
             if device_stop_flags[device_name]:
                 print(f"{device_name} 播放被中途停止")
                 break
-                
-            # 獲取當前塊的數據
-            chunk_data = frames[i:i + chunk * original_format * original_channels]
-            if len(chunk_data) == 0:
+            
+            block, valid, finished = _render_voice(voice, chunk)
+            if valid == 0:
                 break
             
             # 播放音頻塊
+            chunk_data = np.clip(block, -32768, 32767).astype(np.int16).tobytes()
             stream.write(chunk_data)
             
             # 在錄音模式下收集音訊數據
             if is_recording:
-                # 直接添加原始音訊數據，不做任何處理或壓縮
-                # 重要：確保完全相同的複製
-                audio_buffer_copy = chunk_data[:]  # 創建完整副本，避免引用問題
-                audio_buffer.append(audio_buffer_copy)
+                audio_buffer.append(chunk_data)
                 audio_last_update_time = time.time()
     except Exception as e:
         print(f"播放音訊時出錯: {e}")
     finally:
-        # 釋放資源
-        try:
-            stream.stop_stream()
-            stream.close()
-        except:
-            pass
-        try:
-            p.terminate()
-        except:
-            pass
+        # 歸還串流，不關閉裝置
+        return_output_stream(stream, 2, channels, rate)
         print(f"{device_name} 單次音訊播放完成")
 
 def stop_device_audio(device_name):
@@ -1432,9 +3325,14 @@ def stop_device_audio(device_name):
         device_audio_threads[device_name].join(timeout=1.0)
         print(f"已停止 {device_name} 的音訊播放")
     
-    # 如果使用 pygame 混音系統，停止音訊通道
+    # 如果使用 NumPy 混音器，淡出該裝置的所有語音
+    if mixer_stream is not None:
+        mixer_stop(device_name)
+    
+    # 如果使用 pygame 混音系統，停止該裝置佔用的所有頻道
+    if audio_mixer is not None:
+        stop_pygame_channels(device_name)
     if device_name in device_audio_channels and device_audio_channels[device_name]:
-        device_audio_channels[device_name].stop()
         device_audio_channels[device_name] = None
         print(f"已停止 {device_name} 的 pygame 音訊播放")
     
@@ -1447,16 +3345,10 @@ def stop_device_audio(device_name):
         device_audio_threads[device_name] = None
 
 def songlist_play_music_dedicated(index, loop=True, speed=1.0):
-    """專用於歌單控制器的播放函數，使用獨立的 pygame 引擎"""
+    """專用於歌單控制器的播放函數，與其他裝置共用同一個混音器"""
     global songlist_current_playing_music
-    
+
     try:
-        # 確保 pygame 已初始化
-        if 'pygame' not in sys.modules:
-            import pygame
-            pygame.mixer.init(frequency=44100, size=-16, channels=2, buffer=512)
-            log_message("為歌單控制器初始化獨立 pygame 混音器")
-        
         # 停止當前播放的音樂
         if hasattr(songlist_play_music_dedicated, 'channel') and songlist_play_music_dedicated.channel:
             songlist_play_music_dedicated.channel.stop()
@@ -1472,9 +3364,14 @@ def songlist_play_music_dedicated(index, loop=True, speed=1.0):
         songlist_current_playing_music = index
         log_message(f"歌單控制器: 開始播放音樂 {index}")
         
-        # 載入並播放音樂
-        import pygame
-        sound = pygame.mixer.Sound(file_path)
+        # 使用 NumPy 混音器時與其他裝置共用同一個輸出串流
+        ensure_audio_system()
+        if mixer_stream is not None:
+            mixer_play("ESP32_MusicSensor_BLE", file_path, loop=loop, speed=speed)
+            return True
+        
+        # 從共用音效儲存區取得 Sound 並播放
+        sound = get_audio_sound(file_path)
         channel = sound.play(-1 if loop else 0)
         
         # 保存引用以便後續控制
@@ -1495,6 +3392,8 @@ def songlist_stop_music_dedicated():
     
     try:
         # 停止播放
+        if mixer_stream is not None:
+            mixer_stop("ESP32_MusicSensor_BLE")
         if hasattr(songlist_play_music_dedicated, 'channel') and songlist_play_music_dedicated.channel:
             songlist_play_music_dedicated.channel.stop()
             
@@ -1509,621 +3408,1090 @@ def songlist_stop_music_dedicated():
 def play_device_music(device_name, file_path, loop=True, speed=1.0):
     global device_audio_channels, audio_mixer
     
-    # 初始化 pygame.mixer (如果還沒初始化)
-    if audio_mixer is None:
-        initialize_audio_system()
+    ensure_audio_system()
     
-    # 停止該裝置先前的音效 (只停止同一裝置的音效，不影響其他裝置)
-    if device_name in device_audio_channels and device_audio_channels[device_name]:
-        device_audio_channels[device_name].stop()
-        time.sleep(0.05)
+    # 使用 NumPy 混音器：同一裝置的舊聲音會在下一個區塊淡出，不需要等待
+    if mixer_stream is not None:
+        try:
+            voice_id = mixer_play(device_name, file_path, loop=loop, speed=speed)
+            log_message(f"開始為 {device_name} 播放: {file_path}, 循環: {loop}, 語音: {voice_id}")
+            return voice_id is not None
+        except Exception as e:
+            log_message(f"播放音效失敗: {e}")
+            return False
     
-    # 載入並播放新的音效
+    # 從共用音效儲存區取得已建立的 Sound 並播放
     try:
-        sound = audio_mixer.Sound(file_path)
-        
-        # 獲取裝置的固定頻道編號，如果沒有則使用下一個可用頻道
-        channel_num = device_channel_mapping.get(device_name, -1)
+        sound = get_audio_sound(file_path)
         
-        if channel_num >= 0:
-            # 使用固定頻道
-            channel = audio_mixer.Channel(channel_num)
-            channel.play(sound, -1 if loop else 0)
-        else:
-            # 使用任意可用頻道
-            channel = sound.play(-1 if loop else 0)
+        # 由語音分配器取得頻道，會先停止該裝置先前的音效 (不影響其他裝置)
+        channel = allocate_pygame_channel(device_name, exclusive=True)
+        if channel is None:
+            log_message(f"沒有可用的頻道，放棄 {device_name} 的音效: {file_path}")
+            return False
+        channel.play(sound, -1 if loop else 0)
+        channel.set_volume(1.0)
+        trace = mark_latency_play()
+        if trace is not None:
+            finish_latency_trace(trace)
         
         device_audio_channels[device_name] = channel
         
-        # 設定音量和速度
-        if channel:
-            channel.set_volume(1.0)
-        
-        log_message(f"開始為 {device_name} 播放: {file_path}, 循環: {loop}, 頻道: {channel_num if channel_num >= 0 else '自動'}")
+        log_message(f"開始為 {device_name} 播放: {file_path}, 循環: {loop}")
         return True
     except Exception as e:
         log_message(f"播放音效失敗: {e}")
         return False
 
-# 處理來自ESP32的資料
-def process_data(device_name, data):
-    global stop_recording, start_recording, hornPlayed, horn_mode_switched, is_recording_devices
+# ========== 命令分派表 ==========
+# (裝置, 命令) -> 動作 的對應寫在 command_map.json，啟動時編譯成一個字典，
+# 收到命令時只做一次解碼和一次查表。檔案修改後會自動重新載入。
+
+COMMAND_MAP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "command_map.json")
+COMMAND_MAP_CHECK_INTERVAL = 1.0   # 檢查對應檔是否修改的間隔 (秒)
+
+command_table = {}            # (裝置名稱, 命令) -> (動作函數, 參數, 訊息)
+device_command_encodings = {} # 裝置名稱 -> "text" 或 "byte"
+device_event_commands = {}    # (裝置名稱, 操作碼, 數值) -> 命令 (二進位事件對應到的命令)
+device_position_actions = {}  # 裝置名稱 -> (動作函數, 參數, 位置最大值)
+command_supersedes = {}       # (裝置名稱, 停止命令) -> 收到時可以捨棄的佇列中命令 (同一組的開始命令)
+command_map_mtime = None
+command_map_last_check = 0.0
+command_toggle_states = {}    # 切換型命令的狀態 (例如測試遙控器的錄音按鈕)
+command_stats = {
+    "dispatched": 0,
+    "positions": 0,
+    "unknown": 0,
+    "reloads": 0
+}
+
+def _action_play_music(device_name, index):
+    """播放指定編號的音樂 (循環)"""
+    play_device_music(device_name, music_files[index], loop=True)
+
+def _action_play_file(device_name, file, loop=False):
+    """播放指定路徑的音效"""
+    play_device_music(device_name, file, loop=loop)
+
+def _action_stop_audio(device_name):
+    """停止裝置的聲音"""
+    stop_device_audio(device_name)
+
+def _action_horn_start(device_name, horn_set, scrub=False):
+    """喇叭開始彎曲：切換到指定組別並播放 before 音效 (scrub 為 True 時改由位置拖曳)"""
+    global hornPlayed
+    
+    current_horn_set[device_name] = horn_set
+    hornPlayed = False
+    
+    # 先徹底停止任何可能正在播放的音效
+    stop_device_audio(device_name)
+    
+    # 強制終止其他可能存在的播放線程
+    thread = device_audio_threads.get(device_name)
+    if thread and thread.is_alive():
+        device_stop_flags[device_name] = True
+        print("喇叭控制器: 等待先前的音效停止...")
+        thread.join(timeout=0.3)
+        device_audio_threads[device_name] = None
+    
+    device_stop_flags[device_name] = False
+    
+    horn_file = horn_audio_file_before[horn_set]
+    if scrub and mixer_stream is not None:
+        # 讀取頭停在開頭，之後跟著彎曲的位置移動
+        success = mixer_play_scrub(device_name, horn_file) is not None
+    else:
+        success = play_device_music(device_name, horn_file, loop=False)
+    print(f"喇叭控制器: 播放開始音效 {horn_file} 結果: {success}")
+    hornPlayed = True
+    horn_mode_switched[device_name] = False
+
+def _action_horn_stop(device_name):
+    """喇叭停止彎曲：停止目前的音效並播放目前組別的 after 音效"""
+    device_stop_flags[device_name] = True
+    
+    # 舊的播放線程最多等待 0.5 秒
+    thread = device_audio_threads.get(device_name)
+    if thread and thread.is_alive():
+        thread.join(timeout=0.5)
+        if thread.is_alive():
+            print("喇叭控制器: 先前的音效仍未停止")
+    
+    horn_file = horn_audio_file_after[current_horn_set[device_name]]
+    play_device_music(device_name, horn_file, loop=False)
+
+def _action_horn_scrub(device_name, position):
+    """喇叭彎曲中：把拖曳語音的讀取頭移到目前的位置"""
+    mixer_set_position(device_name, position)
+
+def _action_wheel_play(device_name, key):
+    """播放輪子音效 (不停止正在播放的聲音)"""
+    play_wheel_music_without_stopping(wheel_audio_file[key], loop=False)
+
+def _action_song_effect(device_name, sounds, default, loop=False, stop_first=False):
+    """依歌單控制器目前播放的音樂選擇 RDP 音效並播放"""
+    current_song = songlist_current_playing_music
+    
+    if stop_first:
+        stop_device_audio(device_name)
+    
+    key = sounds.get(current_song, default) if current_song else default
+    sound_file = rdp_audio_files.get(key, rdp_audio_files.get(default))
+    
+    if sound_file and os.path.exists(sound_file):
+        play_device_music(device_name, sound_file, loop=loop)
+    else:
+        log_message(f"找不到音效檔案: {sound_file}")
+
+def _action_rdp_effect(device_name, key, loop=False):
+    """播放指定鍵值的 RDP 音效"""
+    if key in rdp_audio_files:
+        play_device_music(device_name, rdp_audio_files[key], loop=loop)
+    else:
+        print(f"找不到 {key} 音效檔案")
+
+def _action_toggle_recording(device_name):
+    """第一次按下開始錄音，第二次按下停止錄音"""
+    if command_toggle_states.get((device_name, "recording")):
+        stop_recording()
+        command_toggle_states[(device_name, "recording")] = False
+    else:
+        start_recording()
+        command_toggle_states[(device_name, "recording")] = True
+
+# 對應檔中可以使用的動作名稱
+COMMAND_ACTIONS = {
+    "play_music": _action_play_music,
+    "play_file": _action_play_file,
+    "stop_audio": _action_stop_audio,
+    "horn_start": _action_horn_start,
+    "horn_stop": _action_horn_stop,
+    "horn_scrub": _action_horn_scrub,
+    "wheel_play": _action_wheel_play,
+    "song_effect": _action_song_effect,
+    "rdp_effect": _action_rdp_effect,
+    "toggle_recording": _action_toggle_recording,
+    "songlist_play": lambda device_name, index: songlist_play_music(index, loop=True),
+    "songlist_stop": lambda device_name: songlist_stop_music(),
+    "start_recording": lambda device_name: start_recording(),
+    "stop_recording": lambda device_name: stop_recording(),
+    "start_rdp_recording": lambda device_name: start_rdp_recording(),
+    "stop_rdp_recording": lambda device_name: stop_rdp_recording(),
+    "start_device_recording": lambda device_name: start_device_recording(),
+    "stop_device_recording_and_play": lambda device_name: stop_device_recording_and_play()
+}
+
+def compile_command_map(command_map):
+    """把對應檔內容編譯成 (分派表, 裝置編碼, 事件對應表, 位置動作表, 停止命令表)，格式錯誤時拋出 ValueError"""
+    table = {}
+    encodings = {}
+    events = {}
+    positions = {}
+    supersedes = {}
+    
+    for device_name, device_config in command_map.get("devices", {}).items():
+        encoding = device_config.get("encoding", "text")
+        if encoding not in ("text", "byte"):
+            raise ValueError(f"{device_name} 的編碼 {encoding} 不正確")
+        encodings[device_name] = encoding
+        
+        commands = device_config.get("commands", {})
+        aliases = device_config.get("aliases", {})
+        for command, target in list(commands.items()) + [(alias, commands.get(target)) for alias, target in aliases.items()]:
+            if target is None:
+                raise ValueError(f"{device_name} 的別名 {command} 指向不存在的命令")
+            action = COMMAND_ACTIONS.get(target.get("action"))
+            if action is None:
+                raise ValueError(f"{device_name} 的命令 {command} 使用了未知的動作 {target.get('action')}")
+            
+            key = int(command) if encoding == "byte" else command
+            table[(device_name, key)] = (action, target.get("args", {}), target.get("message"))
+        
+        # 停止命令只捨棄同一組的開始命令 (包含指向這些命令的別名)
+        for command, target in list(commands.items()) + [(alias, commands.get(target)) for alias, target in aliases.items()]:
+            cancelled = set(target.get("supersedes", []))
+            if not cancelled:
+                continue
+            for name in cancelled:
+                if name not in commands:
+                    raise ValueError(f"{device_name} 的命令 {command} 要捨棄的命令 {name} 不存在")
+            cancelled |= {alias for alias, target in aliases.items() if target in cancelled}
+            key = int(command) if encoding == "byte" else command
+            supersedes[(device_name, key)] = frozenset(int(name) if encoding == "byte" else name for name in cancelled)
+        
+        # 二進位事件 "操作碼名稱:數值" -> 命令 (或別名)
+        for event, command in device_config.get("events", {}).items():
+            opcode_name, _, value = event.partition(":")
+            opcode = EVENT_OPCODES.get(opcode_name)
+            if opcode is None or not value.isdigit():
+                raise ValueError(f"{device_name} 的事件 {event} 格式不正確")
+            key = int(command) if encoding == "byte" else command
+            if (device_name, key) not in table:
+                raise ValueError(f"{device_name} 的事件 {event} 指向不存在的命令 {command}")
+            events[(device_name, opcode, int(value))] = key
+        
+        # 連續的位置值 (二進位 POSITION 事件，或 byte 編碼中沒有對應命令的數值)
+        position = device_config.get("position")
+        if position is not None:
+            action = COMMAND_ACTIONS.get(position.get("action"))
+            if action is None:
+                raise ValueError(f"{device_name} 的位置使用了未知的動作 {position.get('action')}")
+            position_range = position.get("range", 255)
+            if not isinstance(position_range, int) or position_range <= 0:
+                raise ValueError(f"{device_name} 的位置範圍 {position_range} 不正確")
+            positions[device_name] = (action, position.get("args", {}), position_range)
+    
+    return table, encodings, events, positions, supersedes
+
+def reload_command_map(path=None):
+    """重新載入命令對應檔，成功時回傳 True，失敗時保留原本的分派表"""
+    global command_table, device_command_encodings, device_event_commands, device_position_actions
+    global command_supersedes, command_map_mtime
+    
+    path = path or COMMAND_MAP_PATH
+    try:
+        mtime = os.path.getmtime(path)
+        with open(path, 'r', encoding='utf-8') as f:
+            table, encodings, events, positions, supersedes = compile_command_map(json.load(f))
+    except Exception as e:
+        log_message(f"載入命令對應檔 {path} 失敗: {e}")
+        return False
+    
+    # 一次替換整個字典，分派執行緒不會看到一半的表
+    command_table = table
+    device_command_encodings = encodings
+    device_event_commands = events
+    device_position_actions = positions
+    command_supersedes = supersedes
+    command_map_mtime = mtime
+    command_stats["reloads"] += 1
+    log_message(f"已載入命令對應檔，共 {len(table)} 個命令")
+    return True
+
+def _check_command_map_reload():
+    """每隔一段時間檢查對應檔是否被修改"""
+    global command_map_last_check
+    
+    now = time.monotonic()
+    if now - command_map_last_check < COMMAND_MAP_CHECK_INTERVAL:
+        return
+    command_map_last_check = now
+    
+    try:
+        mtime = os.path.getmtime(COMMAND_MAP_PATH)
+    except OSError:
+        return
+    if mtime != command_map_mtime:
+        reload_command_map()
+
+# ========== 二進位事件協定 ==========
+# 固定格式的事件封包，一個通知可以包含多個事件 (小端序):
+#   標頭 <BBB: 魔術數字 0xA5, 版本, 事件數
+#   事件 <BBHI: 操作碼, 數值, 序號 (每個裝置遞增，16 位元循環), 裝置端 millis() 時間戳
+# 舊版的文字命令與單一位元組命令仍然照常處理
+
+EVENT_FRAME_MAGIC = 0xA5
+EVENT_FRAME_VERSION = 1
+EVENT_FRAME_HEADER = struct.Struct('<BBB')
+EVENT_FRAME_EVENT = struct.Struct('<BBHI')
+EVENT_JITTER_SMOOTHING = 1 / 16  # 抖動估計的平滑係數 (同 RFC 3550)
+
+# 操作碼名稱 -> 操作碼，對應檔的 "events" 以 "名稱:數值" 表示事件
+EVENT_OPCODES = {
+    "BUTTON_DOWN": 0x01,   # 數值為按鈕編號
+    "BUTTON_UP": 0x02,
+    "WHEEL_STEP": 0x10,    # 數值 0 為順時針，1 為逆時針
+    "BEND_START": 0x20,    # 數值為感測器編號
+    "BEND_END": 0x21,
+    "POSITION": 0x22       # 數值為位置 0-100
+}
+
+event_sequence_state = {}  # 裝置名稱 -> 序號、時間與統計
+
+def decode_event_frame(data):
+    """解析二進位事件封包，回傳 [(操作碼, 數值, 序號, 裝置時間戳)]，不是事件封包時回傳 None"""
+    if len(data) < EVENT_FRAME_HEADER.size + EVENT_FRAME_EVENT.size:
+        return None  # 舊版的單一位元組命令不會被誤認
+    
+    magic, version, count = EVENT_FRAME_HEADER.unpack_from(data)
+    if magic != EVENT_FRAME_MAGIC or version != EVENT_FRAME_VERSION:
+        return None
+    if len(data) != EVENT_FRAME_HEADER.size + count * EVENT_FRAME_EVENT.size:
+        return None
+    
+    return [EVENT_FRAME_EVENT.unpack_from(data, EVENT_FRAME_HEADER.size + i * EVENT_FRAME_EVENT.size)
+            for i in range(count)]
+
+def _get_event_sequence_state(device_name):
+    """取得 (必要時建立) 裝置的序號追蹤狀態"""
+    state = event_sequence_state.get(device_name)
+    if state is None:
+        state = {
+            "last_seq": None,
+            "last_transit": None,
+            "frames": 0,
+            "events": 0,
+            "legacy": 0,          # 舊版格式的命令數
+            "lost": 0,            # 依序號缺口推算的遺失事件數
+            "duplicates": 0,
+            "late": 0,            # 序號比已收到的還舊 (順序錯亂)
+            "jitter_ms": 0.0      # 到達時間抖動估計 (毫秒)
+        }
+        event_sequence_state[device_name] = state
+    return state
+
+def reset_event_sequence(device_name):
+    """裝置重新連線後序號與時鐘可能重新開始，清除上次的序號與時間"""
+    state = _get_event_sequence_state(device_name)
+    state["last_seq"] = None
+    state["last_transit"] = None
+
+def track_event_sequence(device_name, seq, device_ms, received_at):
+    """更新遺失、重複與抖動統計，重複的事件回傳 False"""
+    state = _get_event_sequence_state(device_name)
+    state["events"] += 1
+    
+    # 以到達時間與裝置時間戳的差估計抖動
+    transit = received_at * 1000.0 - device_ms
+    if state["last_transit"] is not None:
+        delta = abs(transit - state["last_transit"])
+        state["jitter_ms"] += EVENT_JITTER_SMOOTHING * (delta - state["jitter_ms"])
+    state["last_transit"] = transit
+    
+    last_seq = state["last_seq"]
+    if last_seq is not None:
+        gap = (seq - last_seq) & 0xFFFF
+        if gap == 0:
+            state["duplicates"] += 1
+            return False
+        if gap >= 0x8000:
+            state["late"] += 1
+            return True
+        state["lost"] += gap - 1
+    state["last_seq"] = seq
+    return True
+
+def get_event_protocol_stats():
+    """取得各裝置的封包、事件、遺失、重複與抖動統計"""
+    stats = {}
+    for device_name, state in list(event_sequence_state.items()):
+        received = state["events"] - state["duplicates"]
+        expected = received + state["lost"]
+        stats[device_name] = {
+            "frames": state["frames"],
+            "events": state["events"],
+            "legacy": state["legacy"],
+            "lost": state["lost"],
+            "duplicates": state["duplicates"],
+            "late": state["late"],
+            "loss_rate": state["lost"] / expected if expected else 0.0,
+            "jitter_ms": state["jitter_ms"]
+        }
+    return stats
+
+def accept_events(device_name, events, received_at):
+    """追蹤封包中事件的序號與抖動，回傳去除重複後的事件"""
+    _get_event_sequence_state(device_name)["frames"] += 1
+    return [event for event in events
+            if track_event_sequence(device_name, event[2], event[3], received_at)]
+
+def dispatch_events(device_name, events):
+    """依對應檔執行已解碼的二進位事件"""
+    _check_command_map_reload()
+    
+    for opcode, value, seq, device_ms in events:
+        if opcode == EVENT_OPCODES["POSITION"]:
+            # 位置以舊版的單一位元組格式記錄與分派
+            _dispatch_command(device_name, value, bytes([value]))
+            continue
+        command = device_event_commands.get((device_name, opcode, value))
+        if command is None:
+            command_stats["unknown"] += 1
+            continue
+        # 以舊版格式記錄，裝置命令錄製與重放不需要認得新格式
+        raw = bytes([command]) if isinstance(command, int) else command.encode('utf-8')
+        _dispatch_command(device_name, command, raw)
+
+def decode_legacy_command(device_name, data):
+    """依裝置的編碼把舊版格式的資料解碼成命令，空資料回傳 None"""
+    if device_command_encodings.get(device_name) == "byte":
+        if len(data) == 0:
+            return None
+        return data[0]
+    if isinstance(data, (bytes, bytearray)):
+        try:
+            return data.decode('utf-8')
+        except UnicodeDecodeError:
+            # 如果不是有效的 UTF-8 編碼，那麼可能是二進制數據
+            return str(data)
+    return str(data)
+
+# 處理來自ESP32的資料
+def process_data(device_name, data):
+    """解碼裝置資料一次，查表並執行對應的動作 (支援二進位事件封包與舊版格式)"""
+    events = decode_event_frame(data) if isinstance(data, (bytes, bytearray)) else None
+    if events is not None:
+        trace = getattr(latency_context, 'trace', None)
+        received_at = trace['received'] if trace is not None else time.perf_counter()
+        dispatch_events(device_name, accept_events(device_name, events, received_at))
+        return
+    
+    _check_command_map_reload()
+    if isinstance(data, (bytes, bytearray)):
+        _get_event_sequence_state(device_name)["legacy"] += 1
+    
+    # 依裝置的編碼解碼一次
+    command = decode_legacy_command(device_name, data)
+    if command is None:
+        return
+    
+    _dispatch_command(device_name, command, data)
+
+def _dispatch_command(device_name, command, data):
+    """記錄並執行一個已解碼的命令"""
+    # 記錄處理
+    if is_recording_devices and device_name in ["ESP32_RDP_BLE", "ESP32_Wheelspeed2_BLE", "ESP32_HornBLE", "ESP32_HornBLE_2"]:
+        record_device_command(device_name, data)
+    
+    # 沒有對應命令的數值視為位置 (例如喇叭的彎曲程度)，不寫入訊息記錄
+    entry = command_table.get((device_name, command))
+    if entry is None:
+        position = device_position_actions.get(device_name)
+        if position is not None and isinstance(command, int):
+            action, args, position_range = position
+            action(device_name, min(command, position_range) / position_range, **args)
+            command_stats["positions"] += 1
+        else:
+            command_stats["unknown"] += 1
+        return
+    
+    log_message(f"{device_name}: 收到命令 {command}")
+    action, args, message = entry
+    if message:
+        print(message)
+    action(device_name, **args)
+    command_stats["dispatched"] += 1
+
+# 回調函數，處理來自裝置的通知
+# ========== 觸發延遲量測 ==========
+# 記錄一個命令從 BLE 通知收到、開始分派、呼叫播放到第一次被混進輸出區塊的時間，
+# 依裝置與階段保留最近的樣本，用來調整緩衝區大小和檢查效能退步。
+#   queue:    通知收到 -> 分派執行緒開始處理
+#   dispatch: 開始處理 -> 呼叫播放
+#   mix:      呼叫播放 -> 第一次混進輸出區塊 (只有 NumPy 混音器)
+#   total:    通知收到 -> 第一次混進輸出區塊 (pygame 模式為呼叫播放)
+
+LATENCY_HISTORY_SIZE = 1000   # 每個裝置每個階段保留的樣本數
+LATENCY_STAGES = ("queue", "dispatch", "mix", "total")
+
+latency_samples = {}          # (裝置名稱, 階段) -> 最近的延遲樣本 (毫秒)
+latency_context = threading.local()  # 分派執行緒目前處理中的命令
+
+def _record_latency(device_name, stage, seconds):
+    """加入一個延遲樣本"""
+    samples = latency_samples.get((device_name, stage))
+    if samples is None:
+        samples = latency_samples.setdefault((device_name, stage), deque(maxlen=LATENCY_HISTORY_SIZE))
+    samples.append(seconds * 1000.0)
+
+def begin_latency_trace(device_name, received_at):
+    """分派執行緒開始處理一個命令時建立追蹤資料"""
+    latency_context.trace = {
+        'device': device_name,
+        'received': received_at,
+        'dispatched': time.perf_counter()
+    }
+
+def end_latency_trace():
+    """命令處理完畢，清除追蹤資料"""
+    latency_context.trace = None
+
+def mark_latency_play():
+    """在呼叫播放時記錄時間，回傳目前命令的追蹤資料 (沒有或已記錄過時回傳 None)"""
+    trace = getattr(latency_context, 'trace', None)
+    if trace is None or 'played' in trace:
+        return None
+    
+    trace['played'] = time.perf_counter()
+    _record_latency(trace['device'], "queue", trace['dispatched'] - trace['received'])
+    _record_latency(trace['device'], "dispatch", trace['played'] - trace['dispatched'])
+    return trace
+
+def finish_latency_trace(trace, mixed_at=None):
+    """聲音第一次被混進輸出區塊時記錄 (pygame 模式不傳 mixed_at，以呼叫播放的時間為終點)"""
+    if mixed_at is None:
+        _record_latency(trace['device'], "total", trace['played'] - trace['received'])
+    else:
+        _record_latency(trace['device'], "mix", mixed_at - trace['played'])
+        _record_latency(trace['device'], "total", mixed_at - trace['received'])
+
+def get_latency_stats():
+    """取得各裝置各階段的延遲統計 (毫秒)：{裝置: {階段: {count, p50, p95, p99, max}}}"""
+    stats = {}
+    for (device_name, stage), samples in list(latency_samples.items()):
+        values = np.array(samples, dtype=np.float64)
+        if len(values) == 0:
+            continue
+        p50, p95, p99 = np.percentile(values, [50, 95, 99])
+        stats.setdefault(device_name, {})[stage] = {
+            'count': len(values),
+            'p50': float(p50),
+            'p95': float(p95),
+            'p99': float(p99),
+            'max': float(values.max())
+        }
+    return stats
+
+def reset_latency_stats():
+    """清除所有延遲樣本"""
+    latency_samples.clear()
+
+# ========== 命令分派佇列 ==========
+# BLE 回調只把資料放進對應裝置的佇列，實際的 process_data 由每個裝置專屬的分派執行緒執行，
+# 喇叭停止流程中的 sleep 或 join 不會再卡住事件迴圈和其他裝置。
+# 同一個裝置的命令依收到的順序處理。
+# 排入佇列前先合併：連續值 (例如喇叭的位置) 只保留最新的一筆，離散命令可依裝置限制頻率，
+# 收到停止命令時只捨棄佇列中同一組尚未處理的開始命令 (對應檔中的 supersedes)，
+# 錄音、切換等其他命令不受影響。
+
+# 每個裝置佇列的長度上限。滿了時先丟棄最舊的連續值，沒有連續值時拒絕新的可丟棄命令；
+# 開始、停止等控制命令不會被擠出佇列，新的控制命令會擠掉最舊的可丟棄命令，
+# 佇列中全是控制命令時 (例如韌體錯誤不斷送出開始/停止) 拒絕新的控制命令並計數
+DISPATCH_QUEUE_MAXLEN = 64
+# 執行這些動作的命令是瞬間音效，佇列已滿時可以拒絕
+DISPATCH_DROPPABLE_ACTIONS = ("wheel_play",)
+
+# 裝置名稱 -> 同一個離散命令的最小間隔 (秒)，間隔內重複的命令會被捨棄
+COALESCE_RATE_LIMITS = {
+    "ESP32_Wheelspeed2_BLE": 0.05,
+}
+
+dispatch_lanes = {}          # 裝置名稱 -> 分派通道
+dispatch_lanes_lock = threading.Lock()  # 只在建立新通道時使用
+
+def _get_dispatch_lane(device_name):
+    """取得 (必要時建立) 裝置的分派通道與執行緒"""
+    lane = dispatch_lanes.get(device_name)
+    if lane is not None:
+        return lane
+    
+    with dispatch_lanes_lock:
+        lane = dispatch_lanes.get(device_name)
+        if lane is None:
+            lane = {
+                'queue': deque(),        # 長度由 enqueue_device_data 控制，控制命令不會被擠掉
+                'lock': threading.Lock(),
+                'event': threading.Event(),
+                'pending': {},           # 合併鍵 -> 佇列中尚未處理的連續值
+                'last_accepted': {},     # 命令 -> 上次接受的時間 (頻率限制用)
+                'enqueued': 0,
+                'dispatched': 0,
+                'dropped': 0,            # 佇列已滿時被丟棄或拒絕的連續值與可丟棄命令
+                'overflows': 0,          # 佇列已滿且全是控制命令時被拒絕的控制命令
+                'merged': 0,             # 被較新的連續值取代的命令
+                'rate_limited': 0,       # 超過頻率限制被捨棄的命令
+                'superseded': 0,         # 因停止命令被捨棄的命令
+                'errors': 0,
+                'max_depth': 0,
+                'wait_time_last': 0.0,   # 最近一個命令在佇列中等待的時間 (秒)
+                'wait_time_max': 0.0
+            }
+            lane['thread'] = threading.Thread(target=_dispatch_worker, args=(device_name, lane), daemon=True)
+            lane['thread'].start()
+            dispatch_lanes[device_name] = lane
+    return lane
+
+def _classify_device_data(device_name, data, events):
+    """判斷資料的合併類別，回傳 (類別, 鍵)，類別為 continuous / stop / control / discrete (可丟棄)"""
+    if events is not None:
+        if all(event[0] == EVENT_OPCODES["POSITION"] for event in events):
+            return "continuous", "position"
+        commands = [device_event_commands.get((device_name, event[0], event[1])) for event in events]
+    else:
+        command = decode_legacy_command(device_name, data)
+        if (command is not None and device_command_encodings.get(device_name) == "byte"
+                and (device_name, command) not in command_table):
+            # 舊版喇叭韌體把位置當成單一位元組送出
+            return "continuous", "position"
+        commands = [command]
     
-    # 保存原始數據用於記錄
-    command_data = data
+    for command in commands:
+        if (device_name, command) in command_supersedes:
+            return "stop", command
     
-    # 處理數據解碼
-    if isinstance(data, bytes):
-        try:
-            command_str = data.decode('utf-8')
-        except UnicodeDecodeError:
-            # 如果不是有效的 UTF-8 編碼，那麼可能是二進制數據
-            command_str = str(data)
-    else:
-        command_str = str(data)
+    droppable_actions = [COMMAND_ACTIONS[name] for name in DISPATCH_DROPPABLE_ACTIONS]
+    for command in commands:
+        entry = command_table.get((device_name, command))
+        if entry is None or entry[0] not in droppable_actions:
+            return "control", commands[0]
+    return "discrete", commands[0]
+
+def enqueue_device_data(device_name, data):
+    """把裝置資料合併後放入分派佇列，立即返回，可以在 BLE 事件迴圈中呼叫"""
+    lane = _get_dispatch_lane(device_name)
+    received_at = time.perf_counter()
     
-    # 記錄處理
-    if is_recording_devices and device_name in ["ESP32_RDP_BLE", "ESP32_Wheelspeed2_BLE", "ESP32_HornBLE", "ESP32_HornBLE_2"]:
-        record_device_command(device_name, command_data)
+    events = None
+    if isinstance(data, (bytes, bytearray)):
+        # bleak 傳入的 bytearray 可能被重複使用，先複製一份
+        data = bytes(data)
+        events = decode_event_frame(data)
+        if events is not None:
+            # 序號依到達順序追蹤，之後被合併或捨棄的事件不會被算成遺失
+            events = accept_events(device_name, events, received_at)
+            if not events:
+                return
     
-    log_message(f"{device_name}: 收到命令 {command_str}")
+    kind, key = _classify_device_data(device_name, data, events)
+    item = (received_at, data, events, kind, key)
     
-    # 處理來自有線裝置的命令（與RFID裝置邏輯相同）
-    if device_name == "Serial_Device":
-        if command_str == "PLAY_MUSIC_1":
-            print("開始播放音樂1")
-            play_device_music(device_name, music_files["1"], loop=True)
+    with lane['lock']:
+        queue = lane['queue']
         
-        elif command_str == "PLAY_MUSIC_2":
-            print("開始播放音樂2")
-            play_device_music(device_name, music_files["2"], loop=True)
+        if kind == "continuous":
+            # 只保留最新的值，舊值從佇列中移除，新值排在最後以維持順序
+            previous = lane['pending'].get(key)
+            if previous is not None:
+                try:
+                    queue.remove(previous)
+                    lane['merged'] += 1
+                except ValueError:
+                    pass  # 已經被分派執行緒取出或被擠出佇列
+        elif kind == "stop":
+            cancelled = command_supersedes.get((device_name, key), ())
+            kept = [queued for queued in queue if queued[3] not in ("control", "discrete") or queued[4] not in cancelled]
+            superseded = len(queue) - len(kept)
+            if superseded:
+                queue.clear()
+                queue.extend(kept)
+                lane['superseded'] += superseded
+        elif kind == "discrete":
+            interval = COALESCE_RATE_LIMITS.get(device_name, 0.0)
+            if interval > 0:
+                last = lane['last_accepted'].get(key)
+                if last is not None and received_at - last < interval:
+                    lane['rate_limited'] += 1
+                    return
+                lane['last_accepted'][key] = received_at
+        
+        if len(queue) >= DISPATCH_QUEUE_MAXLEN:
+            # 佇列已滿：先丟棄最舊的連續值，否則拒絕新的連續值或可丟棄命令；
+            # 新的控制命令擠掉最舊的可丟棄命令，沒有可擠掉的命令時拒絕
+            evicted = next((queued for queued in queue if queued[3] == "continuous"), None)
+            if evicted is None and kind in ("continuous", "discrete"):
+                lane['dropped'] += 1
+                return
+            if evicted is None:
+                evicted = next((queued for queued in queue if queued[3] == "discrete"), None)
+            if evicted is None:
+                lane['overflows'] += 1
+                return
+            queue.remove(evicted)
+            if lane['pending'].get(evicted[4]) is evicted:
+                del lane['pending'][evicted[4]]
+            lane['dropped'] += 1
         
-        elif command_str == "PLAY_MUSIC_3":
-            print("開始播放音樂3")
-            play_device_music(device_name, music_files["3"], loop=True)
-        elif command_str == "STOP_MUSIC":
-            print("停止播放音樂zzz")
-            stop_device_audio(device_name)
+        queue.append(item)
+        if kind == "continuous":
+            lane['pending'][key] = item
+        lane['enqueued'] += 1
+        
+        depth = len(queue)
+        if depth > lane['max_depth']:
+            lane['max_depth'] = depth
+    
+    lane['event'].set()
 
-    elif device_name == "ESP32_HornBLE":
-    # 處理喇叭控制器資料
+def _dispatch_worker(device_name, lane):
+    """裝置專屬的分派執行緒：依序處理佇列中的命令"""
+    queue = lane['queue']
+    event = lane['event']
+    
+    while True:
+        event.wait()
+        event.clear()
         
-        if data[0] == 254:  # 播放指令 (開始彎曲)
-            print(f"喇叭控制器: 偵測到彎曲開始, hornPlayed={hornPlayed}")
-            current_horn_set[device_name] = "1"  # 設置為第一組
-            
-            # 重置標誌，強制播放
-            hornPlayed = False  # 將此標誌設為 False，確保音效會播放
-            
-            # 先徹底停止任何可能正在播放的音效
-            stop_device_audio(device_name)
-            
-            # 強制終止其他可能存在的播放線程
-            if device_audio_threads[device_name] and device_audio_threads[device_name].is_alive():
-                device_stop_flags[device_name] = True
-                print("喇叭控制器: 等待先前的音效停止...")
-                device_audio_threads[device_name].join(timeout=0.3)  # 等待線程結束
-                device_audio_threads[device_name] = None  # 明確釋放線程引用
-            
-            # 確保標誌正確設置後再播放
-            device_stop_flags[device_name] = False
+        while True:
+            with lane['lock']:
+                if not queue:
+                    break
+                item = queue.popleft()
+                if item[3] == "continuous" and lane['pending'].get(item[4]) is item:
+                    del lane['pending'][item[4]]
+            received_at, data, events, kind, key = item
             
-            # 選擇對應組別的 before 音效
-            horn_file = horn_audio_file_before[current_horn_set[device_name]]
-            print(f"喇叭控制器: 嘗試播放開始音效 {horn_file}")
+            waited = time.perf_counter() - received_at
+            lane['wait_time_last'] = waited
+            if waited > lane['wait_time_max']:
+                lane['wait_time_max'] = waited
             
-            # 直接使用 pygame 播放
+            begin_latency_trace(device_name, received_at)
             try:
-                if audio_mixer is None:
-                    initialize_audio_system()
-                
-                sound = audio_mixer.Sound(horn_file)
-                channel = audio_mixer.Channel(0)  # 使用頻道0
-                channel.play(sound)
-                print("喇叭控制器: 已使用 pygame 播放開始音效")
-                hornPlayed = True
-            except Exception as e:
-                print(f"喇叭控制器: pygame 播放開始音效失敗 {e}")
-                # 如果 pygame 播放失敗，嘗試使用原始方法
-                success = play_device_music(device_name, horn_file, loop=False)
-                print(f"喇叭控制器: 使用原始方法播放結果: {success}")
-                hornPlayed = True
-            
-            # 初始化最後的位置值
-            process_data.last_position = 0
-            # 重置模式切換狀態
-            horn_mode_switched = False
-                    
-        elif data[0] == 253:  # 停止指令 (停止彎曲) - 使用第一組對應的 after
-            print(f"喇叭控制器: 偵測到彎曲結束")
-            
-            # 設置停止標誌
-            device_stop_flags[device_name] = True
-            
-            # 最多嘗試5次停止
-            for attempt in range(5):
-                # 設置停止標誌
-                device_stop_flags[device_name] = True
-                
-                # 等待一小段時間
-                time.sleep(0.1)
-                
-                # 檢查線程是否還在運行
-                if device_audio_threads[device_name] and device_audio_threads[device_name].is_alive():
-                    print(f"喇叭控制器: 停止嘗試 {attempt+1}/5")
+                if events is not None:
+                    dispatch_events(device_name, events)
                 else:
-                    print("喇叭控制器: 音效已成功停止")
-                    break
+                    process_data(device_name, data)
+            except Exception as e:
+                lane['errors'] += 1
+                log_message(f"處理 {device_name} 的命令時發生錯誤: {e}")
+            finally:
+                end_latency_trace()
+            lane['dispatched'] += 1
 
-            # 播放對應組別的 after 音效
-            horn_file = horn_audio_file_after[current_horn_set[device_name]]
-            play_device_music(device_name, horn_file, loop=False)
+def get_dispatch_queue_stats():
+    """取得每個裝置分派佇列的統計資料"""
+    stats = {}
+    for device_name, lane in list(dispatch_lanes.items()):
+        stats[device_name] = {
+            'depth': len(lane['queue']),
+            'max_depth': lane['max_depth'],
+            'enqueued': lane['enqueued'],
+            'dispatched': lane['dispatched'],
+            'dropped': lane['dropped'],
+            'overflows': lane['overflows'],
+            'merged': lane['merged'],
+            'rate_limited': lane['rate_limited'],
+            'superseded': lane['superseded'],
+            'errors': lane['errors'],
+            'wait_time_last': lane['wait_time_last'],
+            'wait_time_max': lane['wait_time_max']
+        }
+    return stats
 
-        elif data[0] == 252:  # 播放指令 (開始彎曲)
-            print(f"喇叭控制器: 偵測到彎曲開始, hornPlayed={hornPlayed}")
-            current_horn_set[device_name] = "2"  # 設置為第2組
-            
-            # 重置標誌，強制播放
-            hornPlayed = False  # 將此標誌設為 False，確保音效會播放
-            
-            # 先徹底停止任何可能正在播放的音效
-            stop_device_audio(device_name)
-            
-            # 強制終止其他可能存在的播放線程
-            if device_audio_threads[device_name] and device_audio_threads[device_name].is_alive():
-                device_stop_flags[device_name] = True
-                print("喇叭控制器: 等待先前的音效停止...")
-                device_audio_threads[device_name].join(timeout=0.3)  # 等待線程結束
-                device_audio_threads[device_name] = None  # 明確釋放線程引用
-            
-            # 確保標誌正確設置後再播放
-            device_stop_flags[device_name] = False
-            
-            # 選擇對應組別的 before 音效
-            horn_file = horn_audio_file_before[current_horn_set[device_name]]
-            print(f"喇叭控制器: 嘗試播放開始音效 {horn_file}")
-            
-            # 直接使用 pygame 播放
-            try:
-                if audio_mixer is None:
-                    initialize_audio_system()
-                
-                sound = audio_mixer.Sound(horn_file)
-                channel = audio_mixer.Channel(0)  # 使用頻道0
-                channel.play(sound)
-                print("喇叭控制器: 已使用 pygame 播放開始音效")
-                hornPlayed = True
-            except Exception as e:
-                print(f"喇叭控制器: pygame 播放開始音效失敗 {e}")
-                # 如果 pygame 播放失敗，嘗試使用原始方法
-                success = play_device_music(device_name, horn_file, loop=False)
-                print(f"喇叭控制器: 使用原始方法播放結果: {success}")
-                hornPlayed = True
-            
-            # 初始化最後的位置值
-            process_data.last_position = 0
-            # 重置模式切換狀態
-            horn_mode_switched = False
-                    
-        elif data[0] == 251:  # 停止指令 (停止彎曲) - 使用第二組對應的 after
-            print(f"喇叭控制器: 偵測到彎曲結束")
-            
-            # 設置停止標誌
-            device_stop_flags[device_name] = True
-            
-            # 最多嘗試5次停止
-            for attempt in range(5):
-                # 設置停止標誌
-                device_stop_flags[device_name] = True
-                
-                # 等待一小段時間
-                time.sleep(0.1)
-                
-                # 檢查線程是否還在運行
-                if device_audio_threads[device_name] and device_audio_threads[device_name].is_alive():
-                    print(f"喇叭控制器: 停止嘗試 {attempt+1}/5")
-                else:
-                    print("喇叭控制器: 音效已成功停止")
-                    break
+def notification_handler(uuid):
+    def handler(_, data):
+        # 只排入佇列，不在事件迴圈中處理
+        adapter = device_adapter_assignments.get(uuid)
+        if adapter is not None:
+            adapter_stats[adapter]["notifications"] += 1
+        enqueue_device_data(uuid, data)
+    return handler
 
-            # 播放第二組的 after 音效
-            horn_file = horn_audio_file_after[current_horn_set[device_name]]
-            play_device_music(device_name, horn_file, loop=False)
+# ========== 藍牙適配器排程 ==========
+# 依各適配器目前的連線數、通知流量與連線耗時挑選適配器，DEVICE_ADAPTER_MAP 只是偏好；
+# 連續失敗的適配器暫停使用一段時間，裝置重新連線時會自動改用其他健康的適配器。
+# 只有適配器本身的錯誤 (搜尋失敗、找不到適配器) 或多個不同裝置都連不上才算適配器失敗，
+# 單一裝置沒開機或不在範圍內只記在該裝置的健康狀態中。
 
-    elif device_name == "ESP32_HornBLE_2":
-        # 在 process_data 函數中修改 254 指令的處理部分：
-        if data[0] == 254:  # 播放指令 (開始彎曲)
-            print(f"喇叭控制器: 偵測到彎曲開始, hornPlayed={hornPlayed}")
-            current_horn_set[device_name] = "3"  # 設置為第一組
-            
-            # 重置標誌，強制播放
-            hornPlayed = False  # 將此標誌設為 False，確保音效會播放
-            
-            # 先徹底停止任何可能正在播放的音效
-            stop_device_audio(device_name)
-            
-            # 強制終止其他可能存在的播放線程
-            if device_audio_threads[device_name] and device_audio_threads[device_name].is_alive():
-                device_stop_flags[device_name] = True
-                print("喇叭控制器: 等待先前的音效停止...")
-                device_audio_threads[device_name].join(timeout=0.3)  # 等待線程結束
-                device_audio_threads[device_name] = None  # 明確釋放線程引用
-            
-            # 確保標誌正確設置後再播放
-            device_stop_flags[device_name] = False
-            
-            # 選擇對應組別的 before 音效
-            horn_file = horn_audio_file_before[current_horn_set[device_name]]
-            print(f"喇叭控制器: 嘗試播放開始音效 {horn_file}")
-            
-            # 直接使用 pygame 播放
-            try:
-                if audio_mixer is None:
-                    initialize_audio_system()
-                
-                sound = audio_mixer.Sound(horn_file)
-                channel = audio_mixer.Channel(1)  # 使用頻道0
-                channel.play(sound)
-                print("喇叭控制器: 已使用 pygame 播放開始音效")
-                hornPlayed = True
-            except Exception as e:
-                print(f"喇叭控制器: pygame 播放開始音效失敗 {e}")
-                # 如果 pygame 播放失敗，嘗試使用原始方法
-                success = play_device_music(device_name, horn_file, loop=False)
-                print(f"喇叭控制器: 使用原始方法播放結果: {success}")
-                hornPlayed = True
-            
-            # 初始化最後的位置值
-            process_data.last_position = 0
-            # 重置模式切換狀態
-            horn_mode_switched = False
-                    
-        elif data[0] == 253:  # 停止指令 (停止彎曲) - 使用第一組對應的 after
-            print(f"喇叭控制器: 偵測到彎曲結束")
-            
-            # 設置停止標誌
-            device_stop_flags[device_name] = True
-            
-            # 最多嘗試5次停止
-            for attempt in range(5):
-                # 設置停止標誌
-                device_stop_flags[device_name] = True
-                
-                # 等待一小段時間
-                time.sleep(0.1)
-                
-                # 檢查線程是否還在運行
-                if device_audio_threads[device_name] and device_audio_threads[device_name].is_alive():
-                    print(f"喇叭控制器: 停止嘗試 {attempt+1}/5")
-                else:
-                    print("喇叭控制器: 音效已成功停止")
-                    break
+ADAPTER_MAX_CONNECTIONS = 5          # 每個適配器的連線上限
+ADAPTER_FAILURE_THRESHOLD = 2        # 連續幾次適配器錯誤後暫停使用該適配器
+ADAPTER_DEVICE_FAILURE_THRESHOLD = 3 # 上次成功連線後有幾個不同的裝置連線失敗時，視為適配器錯誤
+# 錯誤訊息包含這些字串時視為適配器本身的錯誤 (比對時不分大小寫)
+ADAPTER_ERROR_MARKERS = ("adapter", "not ready", "notready", "no bluetooth")
+ADAPTER_COOLDOWN = 30.0              # 暫停使用的時間 (秒)
+ADAPTER_NOTIFY_CAPACITY = 200.0      # 通知流量的參考值 (則/秒)，流量達到此值時相當於多一個連線的負載
+ADAPTER_CONNECT_LATENCY_REF = 5.0    # 連線耗時的參考值 (秒)，耗時達到此值時相當於多一個連線的負載
+ADAPTER_PREFERENCE_BONUS = 0.5       # 偏好適配器的分數優勢
+ADAPTER_RATE_SMOOTHING = 0.3         # 流量與耗時的指數平滑係數
 
-            # 播放對應組別的 after 音效
-            horn_file = horn_audio_file_after[current_horn_set[device_name]]
-            play_device_music(device_name, horn_file, loop=False)
-            
-    elif device_name == "ESP32_Wheelspeed2_BLE":
-        # 處理輪子速度控制器資料
-        speed_str = data.decode('utf-8')
-        try:
-            if speed_str == "gjp4":
-                print("開始順時針")
-                #stop_device_audio(device_name)
-                play_wheel_music_without_stopping(wheel_audio_file["1"], loop=False)
-            elif speed_str == "su4":
-                print("開始逆時針")
-                #stop_device_audio(device_name)
-                play_wheel_music_without_stopping(wheel_audio_file["2"], loop=False)
-        except ValueError:
-            print(f"輪子速度控制器: 無法解析資料 {speed_str}")
-        
-    elif device_name == "ESP32_RDP_BLE":
-    # 處理輪子觸發控制器資料
-        command_str = data.decode('utf-8')
-        print(f"輪子觸發控制器: 收到命令 {command_str}")
-        current_song = songlist_current_playing_music
-        # 按鈕3處理邏輯 (會根據當前播放音樂調整行為)
-        if command_str == "BUTTON3_PRESSED":
-            print("按鈕3已按下，根據目前播放的音樂選擇音效")
-            
-            # 選擇對應的音效和播放方式
-            sound_file = rdp_audio_files.get("RDP_3_before")  # 預設音效
-            should_loop = True  # 預設循環播放
-            
-            if current_song:
-                print(f"歌單控制器正在播放音樂: {current_song}")
-                
-                # 根據不同的音樂選擇不同的音效
-                if current_song == "1":
-                    sound_file = rdp_audio_files.get("RDP_1_before", sound_file)
-                elif current_song == "2":
-                    sound_file = rdp_audio_files.get("RDP_2_before", sound_file)
-                elif current_song == "3":
-                    sound_file = rdp_audio_files.get("city_2_before", sound_file)
-            else:
-                print("歌單控制器未播放音樂，使用預設音效")
-                sound_file = rdp_audio_files.get("RDP_3_before", sound_file)
-            
-            # 播放選定的音效
-            if os.path.exists(sound_file):
-                play_device_music(device_name, sound_file, loop=should_loop)
-            else:
-                log_message(f"找不到音效檔案: {sound_file}")
-            
-        elif command_str == "BUTTON3_RELEASED":
-            print("按鈕3已放開，停止循環並播放 RDP_3_after 音效")
-            # 先停止循環播放
-            stop_device_audio(device_name)
-            # 播放結束音效
-            if (current_song == "2"):
-                if "RDP_2_after" in rdp_audio_files:
-                    play_device_music(device_name, rdp_audio_files["RDP_2_after"], loop=False)
-                else:
-                    print("找不到 RDP_2_after 音效檔案")
-            elif(current_song == "3"):
-                if "city_1_after" in rdp_audio_files:
-                    play_device_music(device_name, rdp_audio_files["city_2_after"], loop=False)
-            elif(current_song == "1"):
-                if "city_1_after" in rdp_audio_files:
-                    play_device_music(device_name, rdp_audio_files["RDP_1_after"], loop=False)
-            else:
-                if "RDP_3_after" in rdp_audio_files:
-                    play_device_music(device_name, rdp_audio_files["RDP_3_after"], loop=False)
-        elif command_str == "BUTTON_PRESSED":
-            print("按鈕3已按下，根據目前播放的音樂選擇音效")
-            
-            # 選擇對應的音效和播放方式
-            sound_file = rdp_audio_files.get("RDP_3_before")  # 預設音效
-            should_loop = True  # 預設循環播放
-            
-            if current_song:
-                print(f"歌單控制器正在播放音樂: {current_song}")
-                
-                # 根據不同的音樂選擇不同的音效
-                if current_song == "1":
-                    sound_file = rdp_audio_files.get("RDP_1_before", sound_file)
-                elif current_song == "2":
-                    sound_file = rdp_audio_files.get("RDP_2_before", sound_file)
-                elif current_song == "3":
-                    sound_file = rdp_audio_files.get("city_2_before", sound_file)
-            else:
-                print("歌單控制器未播放音樂，使用預設音效")
-                sound_file = rdp_audio_files.get("RDP_3_before", sound_file)
-            
-            # 播放選定的音效
-            if os.path.exists(sound_file):
-                play_device_music(device_name, sound_file, loop=should_loop)
-            else:
-                log_message(f"找不到音效檔案: {sound_file}")
-            
-        elif command_str == "BUTTON_RELEASED":
-            print("按鈕3已放開，停止循環並播放 RDP_3_after 音效")
-            # 先停止循環播放
-            stop_device_audio(device_name)
-            # 播放結束音效
-            if (current_song == "2"):
-                if "RDP_2_after" in rdp_audio_files:
-                    play_device_music(device_name, rdp_audio_files["RDP_2_after"], loop=False)
-                else:
-                    print("找不到 RDP_2_after 音效檔案")
-            elif(current_song == "3"):
-                if "city_1_after" in rdp_audio_files:
-                    play_device_music(device_name, rdp_audio_files["city_2_after"], loop=False)
-            elif(current_song == "1"):
-                if "city_1_after" in rdp_audio_files:
-                    play_device_music(device_name, rdp_audio_files["RDP_1_after"], loop=False)
-            else:
-                if "RDP_3_after" in rdp_audio_files:
-                    play_device_music(device_name, rdp_audio_files["RDP_3_after"], loop=False)
-        elif command_str == "BUTTON2_PRESSED":
-            print("按鈕3已按下，根據目前播放的音樂選擇音效")
-            
-            # 選擇對應的音效和播放方式
-            sound_file = rdp_audio_files.get("RDP_3_before")  # 預設音效
-            should_loop = True  # 預設循環播放
-            
-            if current_song:
-                print(f"歌單控制器正在播放音樂: {current_song}")
-                
-                # 根據不同的音樂選擇不同的音效
-                if current_song == "1":
-                    sound_file = rdp_audio_files.get("RDP_1_before", sound_file)
-                elif current_song == "2":
-                    sound_file = rdp_audio_files.get("RDP_2_before", sound_file)
-                elif current_song == "3":
-                    sound_file = rdp_audio_files.get("city_2_before", sound_file)
-            else:
-                print("歌單控制器未播放音樂，使用預設音效")
-                sound_file = rdp_audio_files.get("RDP_3_before", sound_file)
-            
-            # 播放選定的音效
-            if os.path.exists(sound_file):
-                play_device_music(device_name, sound_file, loop=should_loop)
-            else:
-                log_message(f"找不到音效檔案: {sound_file}")
-            
-        elif command_str == "BUTTON2_RELEASED":
-            print("按鈕3已放開，停止循環並播放 RDP_3_after 音效")
-            # 先停止循環播放
-            stop_device_audio(device_name)
-            # 播放結束音效
-            if (current_song == "2"):
-                if "RDP_2_after" in rdp_audio_files:
-                    play_device_music(device_name, rdp_audio_files["RDP_2_after"], loop=False)
-                else:
-                    print("找不到 RDP_2_after 音效檔案")
-            elif(current_song == "3"):
-                if "city_1_after" in rdp_audio_files:
-                    play_device_music(device_name, rdp_audio_files["city_2_after"], loop=False)
-            elif(current_song == "1"):
-                if "city_1_after" in rdp_audio_files:
-                    play_device_music(device_name, rdp_audio_files["RDP_1_after"], loop=False)
-            else:
-                if "RDP_3_after" in rdp_audio_files:
-                    play_device_music(device_name, rdp_audio_files["RDP_3_after"], loop=False)
-
-    elif device_name == "ESP32_MusicSensor_BLE":
-        # 處理歌單控制器資料
-        command = data.decode('utf-8')
-        print(f"歌單控制器: 收到命令 {command}")
-        
-        # 根據命令選擇並播放對應的音樂
-        if command == "PLAY_MUSIC_1":
-            print("開始播放音樂1")
-            songlist_play_music("1", loop=True)
-        elif command == "STOP_MUSIC_1":
-            print("停止播放音樂1")
-            songlist_stop_music()
-        
-        elif command == "PLAY_MUSIC_2":
-            print("開始播放音樂2")
-            songlist_play_music("2", loop=True)
-        elif command == "STOP_MUSIC_2":
-            print("停止播放音樂2")
-            songlist_stop_music()
-        
-        elif command == "PLAY_MUSIC_3":
-            print("開始播放音樂3")
-            songlist_play_music("3", loop=True)
-        elif command == "STOP_MUSIC_3":
-            print("停止播放音樂3")
-            songlist_stop_music()
-
-        elif command == "START_RECORDING":
-            print("開始錄音")
-            start_recording()
-        elif command == "STOP_RECORDING":
-            print("停止錄音")
-            stop_recording()
-        elif command == "START_RDP_RECORDING":
-            print("開始RDP錄音")
-            start_rdp_recording()
-        elif command == "STOP_RDP_RECORDING":
-            print("停止RDP錄音")
-            stop_rdp_recording()
-        elif command == "START_DEVICE_RECORDING":
-            print("開始錄製設備音效")
-            start_device_recording()
-        
-        elif command == "STOP_DEVICE_RECORDING_AND_PLAY":
-            print("停止錄製並循環播放設備音效")
-            stop_device_recording_and_play()
-    elif device_name == "ESP32_test_remote":
-        # 處理測試遙控器資料
-        command = data.decode('utf-8')
-        print(f"測試遙控器: 收到命令 {command}")
-        test_audio_file2 = "C:/Users/maboo/yzu_2025/yzu_2025_2/audio/3.wav"
-        test_audio_file = "C:/Users/maboo/yzu_2025/yzu_2025_2/audio/RDP_2_before.wav"
-        
-        if command == "BUTTON_13_PRESSED":
-            # 記錄按鈕13的狀態，用於切換錄音
-            if hasattr(process_data, 'button_13_state') and process_data.button_13_state:
-                # 如果已經在錄音，則停止錄音
-                print("按鈕13第二次按下，停止錄音")
-                stop_recording()
-                process_data.button_13_state = False
-            else:
-                # 開始錄音
-                print("按鈕13第一次按下，開始錄音")
-                start_recording()
-                process_data.button_13_state = True
-        
-        elif command == "BUTTON_12_PRESSED":
-            print("按鈕2已按下，播放 RDP_2_before 音效")
-            # 確保有此音效文件
-            if "RDP_2_before" in rdp_audio_files:
-                play_device_music(device_name, rdp_audio_files["RDP_2_before"], loop=False)
-            else:
-                print("找不到 RDP_2_before 音效檔案")
-        elif command == "BUTTON_14_PRESSED":
-                    print("開始播放音樂1")
-                    play_device_music(device_name, test_audio_file2, loop=True)
-        elif command == "BUTTON_14_UNPRESSED":
-            print("停止播放音樂1")
-            stop_device_audio(device_name)
-
-def connect_serial_device(port, baudrate=9600):
-    """連接有線RFID裝置"""
-    global serial_device, serial_connected
+adapter_stats = {
+    adapter: {
+        "notifications": 0,          # 累計通知數
+        "notify_rate": 0.0,          # 平滑後的通知流量 (則/秒)
+        "rate_sampled_at": time.time(),
+        "rate_sampled_count": 0,
+        "connect_latency": 0.0,      # 平滑後的連線耗時 (秒)
+        "failures": 0,               # 連續的適配器錯誤次數
+        "total_failures": 0,
+        "failed_devices": set(),     # 上次成功連線後連線失敗的裝置
+        "cooldown_until": 0.0,
+        "last_error": None
+    }
+    for adapter in BT_ADAPTERS
+}
+device_adapter_assignments = {}  # 已連線的裝置 -> 使用中的適配器
+device_last_adapter = {}         # 裝置 -> 上次使用的適配器 (用來記錄搬移)
+
+def _update_adapter_rates(now):
+    """以距上次取樣的通知數更新各適配器的平滑通知流量"""
+    for stats in adapter_stats.values():
+        elapsed = now - stats["rate_sampled_at"]
+        if elapsed < 1.0:
+            continue
+        rate = (stats["notifications"] - stats["rate_sampled_count"]) / elapsed
+        stats["notify_rate"] += ADAPTER_RATE_SMOOTHING * (rate - stats["notify_rate"])
+        stats["rate_sampled_at"] = now
+        stats["rate_sampled_count"] = stats["notifications"]
+
+def _adapter_connections(adapter):
+    """適配器目前的連線數"""
+    return sum(1 for assigned in device_adapter_assignments.values() if assigned == adapter)
+
+def is_adapter_healthy(adapter, now=None):
+    """適配器是否可以使用 (不在暫停期間)"""
+    now = time.time() if now is None else now
+    return adapter_stats[adapter]["cooldown_until"] <= now
+
+def _adapter_score(adapter, preferred):
+    """適配器的負載分數，越低越優先"""
+    stats = adapter_stats[adapter]
+    score = (_adapter_connections(adapter)
+             + stats["notify_rate"] / ADAPTER_NOTIFY_CAPACITY
+             + stats["connect_latency"] / ADAPTER_CONNECT_LATENCY_REF)
+    if adapter == preferred:
+        score -= ADAPTER_PREFERENCE_BONUS
+    return score
+
+def choose_adapter(device_name, candidates=None):
+    """為裝置挑選適配器，candidates 為可用的適配器 (例如搜尋時看到該裝置的適配器)"""
+    now = time.time()
+    _update_adapter_rates(now)
+    pool = [adapter for adapter in (candidates or BT_ADAPTERS) if adapter in adapter_stats]
+    if not pool:
+        return DEVICE_ADAPTER_MAP.get(device_name, BT_ADAPTERS[0])
+    
+    usable = [adapter for adapter in pool
+              if is_adapter_healthy(adapter, now) and _adapter_connections(adapter) < ADAPTER_MAX_CONNECTIONS]
+    if not usable:
+        # 全部暫停或已滿時，選最快恢復的適配器
+        usable = [min(pool, key=lambda adapter: adapter_stats[adapter]["cooldown_until"])]
+    
+    preferred = DEVICE_ADAPTER_MAP.get(device_name)
+    adapter = min(usable, key=lambda candidate: _adapter_score(candidate, preferred))
+    
+    previous = device_last_adapter.get(device_name)
+    if previous is not None and previous != adapter:
+        log_message(f"將 {device_name} 從適配器 {previous} 移到 {adapter}")
+    device_last_adapter[device_name] = adapter
+    return adapter
+
+def record_adapter_success(adapter, device_name, seconds):
+    """記錄連線成功：清除連續失敗次數並更新連線耗時"""
+    stats = adapter_stats.get(adapter)
+    if stats is None:
+        return
+    stats["failures"] = 0
+    stats["failed_devices"].clear()
+    stats["cooldown_until"] = 0.0
+    stats["connect_latency"] += ADAPTER_RATE_SMOOTHING * (seconds - stats["connect_latency"])
+    device_adapter_assignments[device_name] = adapter
+
+def is_adapter_error(error):
+    """錯誤是否來自適配器本身，而不是單一裝置"""
+    message = str(error).lower()
+    return any(marker in message for marker in ADAPTER_ERROR_MARKERS)
+
+def record_device_connect_failure(adapter, device_name, error):
+    """記錄裝置經由適配器連線失敗，只有適配器錯誤或多個不同裝置都失敗時才算適配器失敗"""
+    stats = adapter_stats.get(adapter)
+    if stats is None:
+        return
+    if is_adapter_error(error):
+        record_adapter_failure(adapter, error)
+        return
+    
+    stats["failed_devices"].add(device_name)
+    if len(stats["failed_devices"]) >= ADAPTER_DEVICE_FAILURE_THRESHOLD:
+        devices = ", ".join(sorted(stats["failed_devices"]))
+        stats["failed_devices"].clear()
+        record_adapter_failure(adapter, f"多個裝置連線失敗 ({devices}): {error}")
+
+def record_adapter_failure(adapter, error):
+    """記錄適配器錯誤，連續失敗達門檻時暫停使用"""
+    stats = adapter_stats.get(adapter)
+    if stats is None:
+        return
+    stats["failures"] += 1
+    stats["total_failures"] += 1
+    stats["last_error"] = str(error)
+    if stats["failures"] >= ADAPTER_FAILURE_THRESHOLD:
+        stats["cooldown_until"] = time.time() + ADAPTER_COOLDOWN
+        log_message(f"適配器 {adapter} 連續失敗 {stats['failures']} 次，暫停使用 {ADAPTER_COOLDOWN:.0f} 秒")
+
+def release_adapter(device_name):
+    """裝置斷線時釋放它佔用的適配器"""
+    device_adapter_assignments.pop(device_name, None)
+
+def get_adapter_stats():
+    """取得各適配器的連線數、通知流量、連線耗時與健康狀態"""
+    now = time.time()
+    _update_adapter_rates(now)
+    result = {}
+    for adapter, stats in adapter_stats.items():
+        result[adapter] = {
+            "healthy": is_adapter_healthy(adapter, now),
+            "connections": _adapter_connections(adapter),
+            "devices": sorted(name for name, assigned in device_adapter_assignments.items() if assigned == adapter),
+            "notifications": stats["notifications"],
+            "notify_rate": stats["notify_rate"],
+            "connect_latency": stats["connect_latency"],
+            "failures": stats["failures"],
+            "total_failures": stats["total_failures"],
+            "failed_devices": sorted(stats["failed_devices"]),
+            "cooldown_remaining": max(0.0, stats["cooldown_until"] - now),
+            "last_error": stats["last_error"]
+        }
+    return result
+
+# ========== 藍牙搜尋與連線 ==========
+# 所有健康的適配器各做一次搜尋，同時比對所有裝置的名稱 (或已知位址)，
+# 找到後以 asyncio.gather 同時連線，每個適配器同時進行的連線數有上限
+
+BLE_SCAN_TIMEOUT = 10.0              # 搜尋逾時 (秒)，所有裝置都找到時提早結束
+BLE_MAX_CONNECTS_PER_ADAPTER = 2     # 每個適配器同時進行的連線數
+
+# 裝置名稱 -> 已知的藍牙位址，有設定時以位址比對 (裝置沒有廣播名稱時也找得到)
+DEVICE_ADDRESS_MAP = {}
+
+ble_discovery_results = {}  # 裝置名稱 -> {"adapter", "address", "seconds"} (最近一次搜尋最先找到的時間)
+ble_adapter_semaphores = {}  # 適配器 -> (事件迴圈, 連線信號量)
+ble_scan_waiters = {}        # 裝置名稱 -> 等待共用搜尋結果的 Future 清單
+ble_shared_scan = None       # (事件迴圈, 共用搜尋任務)，重新連線時找不到位址的裝置共用
+
+def _match_ble_device(ble_device, advertisement_data, wanted):
+    """比對廣播封包，回傳符合的裝置名稱 (沒有符合時回傳 None)"""
+    address = (ble_device.address or "").upper()
+    names = {ble_device.name, getattr(advertisement_data, 'local_name', None)}
+    for device_name in wanted:
+        known_address = DEVICE_ADDRESS_MAP.get(device_name)
+        if known_address:
+            if known_address.upper() == address:
+                return device_name
+        elif device_name in names:
+            return device_name
+    return None
+
+async def _scan_adapter(bleak, adapter, wanted, found, all_found, timeout, started, on_sighting=None):
+    """在一個適配器上做一次搜尋，看到的裝置寫入 found[裝置名稱][適配器]，全部找到時提早結束"""
+    def on_detect(ble_device, advertisement_data):
+        device_name = _match_ble_device(ble_device, advertisement_data, wanted)
+        if device_name is None or adapter in found.get(device_name, {}):
+            return
+        first_sighting = device_name not in found
+        found.setdefault(device_name, {})[adapter] = ble_device
+        if first_sighting:
+            seconds = time.perf_counter() - started
+            ble_discovery_results[device_name] = {
+                "adapter": adapter,
+                "address": ble_device.address,
+                "seconds": seconds
+            }
+            log_message(f"適配器 {adapter} 找到 {device_name} ({ble_device.address})，耗時 {seconds:.2f} 秒")
+            if on_sighting is not None:
+                on_sighting(device_name, found[device_name])
+        if all(name in found for name in wanted):
+            all_found.set()
     
+    scanner = bleak.BleakScanner(detection_callback=on_detect, adapter=adapter)
     try:
-        serial_device = serial.Serial(port, baudrate, timeout=1)
-        serial_connected = True
-        log_message(f"已連接到有線RFID裝置，端口: {port}")
-        
-        # 啟動監聽線程
-        threading.Thread(target=listen_serial_device, daemon=True).start()
-        return True
+        async with scanner:
+            await asyncio.wait_for(all_found.wait(), timeout)
+    except asyncio.TimeoutError:
+        pass
     except Exception as e:
-        log_message(f"連接有線RFID裝置失敗: {e}")
-        return False
+        log_message(f"適配器 {adapter} 搜尋時發生錯誤: {e}")
+        record_adapter_failure(adapter, e)
 
-def listen_serial_device():
-    """監聽有線裝置傳來的訊息"""
-    global serial_device, serial_connected
+async def discover_devices(device_names, timeout=BLE_SCAN_TIMEOUT, on_sighting=None):
+    """一次搜尋找出所有裝置，回傳 {裝置名稱: {適配器: BLEDevice}}，找不到的裝置不在結果中
     
-    while serial_connected and serial_device:
-        try:
-            if serial_device.in_waiting > 0:
-                line = serial_device.readline().decode('utf-8').strip()
-                log_message(f"有線RFID裝置: {line}")
-                
-                # 處理命令
-                if line.startswith("PLAY_MUSIC") or line.startswith("STOP_MUSIC"):
-                    # 使用與其他裝置相同的邏輯處理命令
-                    process_data("Serial_Device", line)
-        except Exception as e:
-            log_message(f"讀取有線RFID裝置數據時發生錯誤: {e}")
-        time.sleep(0.1)
+    on_sighting(裝置名稱, {適配器: BLEDevice}) 在每個裝置第一次被看到時呼叫，不必等搜尋結束。
+    """
+    bleak = lazy_import("bleak")
+    started = time.perf_counter()
     
-    log_message("有線RFID裝置監聽已停止")
+    adapters = [adapter for adapter in BT_ADAPTERS if is_adapter_healthy(adapter)] or list(BT_ADAPTERS)
+    log_message(f"開始搜尋 {len(device_names)} 個藍牙裝置 (使用適配器: {', '.join(adapters)})")
+    found = {}
+    all_found = asyncio.Event()
+    await asyncio.gather(*(_scan_adapter(bleak, adapter, device_names, found, all_found, timeout, started, on_sighting)
+                           for adapter in adapters))
+    
+    for device_name in device_names:
+        if device_name not in found:
+            log_message(f"搜尋逾時，找不到裝置 {device_name}")
+    record_startup_stage("ble_discovery", time.perf_counter() - started)
+    return found
 
-def disconnect_serial_device():
-    """斷開有線RFID裝置連接"""
-    global serial_device, serial_connected
+async def wait_for_sighting(device_name):
+    """等待共用搜尋看到裝置，回傳 {適配器: BLEDevice} (搜尋結束仍找不到時回傳 None)
     
-    if serial_device:
+    同時重試的裝置共用同一次搜尋，不會各自進行一次完整的搜尋。
+    """
+    global ble_shared_scan
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+    ble_scan_waiters.setdefault(device_name, []).append(future)
+    if ble_shared_scan is None or ble_shared_scan[0] is not loop or ble_shared_scan[1].done():
+        ble_shared_scan = (loop, asyncio.ensure_future(_run_shared_scan()))
+    return await future
+
+def _resolve_scan_waiters(device_name, sightings):
+    """把搜尋結果交給等待該裝置的監督任務"""
+    for future in ble_scan_waiters.pop(device_name, []):
+        if not future.done():
+            future.set_result(sightings)
+
+async def _run_shared_scan():
+    """為所有正在等待的裝置搜尋，看到裝置時立即通知；搜尋期間才開始等待的裝置由下一輪搜尋"""
+    while ble_scan_waiters:
+        wanted = list(ble_scan_waiters)
         try:
-            serial_connected = False
-            serial_device.close()
-            serial_device = None
-            log_message("已斷開有線RFID裝置連接")
+            await discover_devices(wanted, on_sighting=_resolve_scan_waiters)
         except Exception as e:
-            log_message(f"斷開有線RFID裝置時發生錯誤: {e}")
+            log_message(f"共用藍牙搜尋失敗: {e}")
+        for device_name in wanted:
+            _resolve_scan_waiters(device_name, None)
 
-# 回調函數，處理來自裝置的通知
-def notification_handler(uuid):
-    def handler(_, data):
-        process_data(uuid, data)
-    return handler
+def _get_adapter_semaphore(adapter):
+    """取得適配器的連線信號量 (信號量屬於目前的事件迴圈，換迴圈時重新建立)"""
+    loop = asyncio.get_running_loop()
+    entry = ble_adapter_semaphores.get(adapter)
+    if entry is None or entry[0] is not loop:
+        entry = (loop, asyncio.Semaphore(BLE_MAX_CONNECTS_PER_ADAPTER))
+        ble_adapter_semaphores[adapter] = entry
+    return entry[1]
 
-# 連接到一個ESP32
-async def connect_to_device(device_name):
-    # 獲取該裝置應該使用的適配器
-    adapter = DEVICE_ADAPTER_MAP.get(device_name, "hci0")
+async def connect_devices(device_names):
+    """搜尋所有裝置並為每個裝置啟動連線監督任務，第一次連線嘗試都結束後回傳已連線的客戶端"""
+    found = await discover_devices(device_names)
     
-    # 使用指定的適配器查找裝置
-    log_message(f"使用藍牙適配器 {adapter} 搜尋 {device_name}")
+    # 搜尋不到的裝置也啟動監督任務，由它在退避後重試
+    ready_events = [start_device_supervisor(device_name, found.get(device_name))
+                    for device_name in device_names]
+    await asyncio.gather(*(event.wait() for event in ready_events))
+    return [device_clients[device_name] for device_name in device_names if device_name in device_clients]
+
+# 連接到一個ESP32 (沒有傳入搜尋結果或位址時單獨搜尋該裝置)
+async def connect_to_device(device_name, sightings=None, address=None, disconnected_callback=None):
+    """連接裝置並訂閱通知，回傳客戶端 (失敗時回傳 None)
+    
+    sightings 為搜尋結果 {適配器: BLEDevice}；只有 address 時直接以位址連線；兩者都沒有時先搜尋。
+    """
+    bleak = lazy_import("bleak")
+    started = time.perf_counter()
     
-    # 在指定適配器上搜尋裝置
-    device = await BleakScanner.find_device_by_name(
-        device_name, 
-        adapter=adapter
-    )
+    if sightings is None and address is None:
+        log_message(f"搜尋 {device_name}")
+        found = await discover_devices([device_name])
+        sightings = found.get(device_name)
     
-    if device is None:
-        log_message(f"在適配器 {adapter} 上找不到裝置 {device_name}")
+    # 由適配器排程挑選適配器，只考慮搜尋時看得到該裝置的適配器
+    if sightings:
+        adapter = choose_adapter(device_name, list(sightings))
+        device = sightings[adapter]
+    elif address is not None:
+        adapter = choose_adapter(device_name)
+        device = address
+    else:
+        log_message(f"找不到裝置 {device_name}")
         return None
     
     # 連接裝置並返回客戶端
-    client = BleakClient(device, adapter=adapter)
+    client = bleak.BleakClient(device, disconnected_callback=disconnected_callback, adapter=adapter)
     try:
-        await client.connect()
+        connect_started = time.perf_counter()
+        async with _get_adapter_semaphore(adapter):
+            await client.connect()
+        record_adapter_success(adapter, device_name, time.perf_counter() - connect_started)
         log_message(f"已透過適配器 {adapter} 連接到 {device_name}")
         
         # 更新連接狀態
         device_connection_status[device_name] = True
+        reset_event_sequence(device_name)
+        record_startup_stage(f"connect {device_name}", time.perf_counter() - started)
+        record_startup_stage("first_device_connected", time.perf_counter() - _import_started)
         
         # 訂閱通知
         await client.start_notify(CHARACTERISTIC_UUID, notification_handler(device_name))
@@ -2132,15 +4500,191 @@ async def connect_to_device(device_name):
     except Exception as e:
         log_message(f"通過適配器 {adapter} 連接到 {device_name} 失敗: {e}")
         device_connection_status[device_name] = False
+        _get_device_health(device_name)["last_error"] = str(e)
+        record_device_connect_failure(adapter, device_name, e)
+        release_adapter(device_name)
+        # 已連上但訂閱失敗時也要斷線，避免留下沒有通知的連線
+        await _disconnect_device(client)
         return None
 
+# ========== 藍牙重新連線監督 ==========
+# 每個裝置一個監督任務：偵測斷線後以帶隨機抖動的指數退避重新連線，
+# 重新連線時直接使用上次連線的位址，不需要重新搜尋；從未連線過的裝置等待共用搜尋看到它
+
+BLE_RECONNECT_BASE_DELAY = 1.0   # 第一次重試前的等待時間 (秒)
+BLE_RECONNECT_MAX_DELAY = 60.0   # 退避等待時間上限 (秒)
+BLE_RECONNECT_JITTER = 0.3       # 隨機抖動比例，避免多個裝置同時重試
+
+ble_loop = None                  # 藍牙服務的事件迴圈，監督任務都在這個迴圈中執行
+ble_supervisor_tasks = {}        # 裝置名稱 -> 監督任務
+ble_supervisor_stopping = False  # 為 True 時斷線後不再重新連線
+device_health = {}               # 裝置名稱 -> 連線健康狀態
+
+def _get_device_health(device_name):
+    """取得 (必要時建立) 裝置的連線健康狀態"""
+    health = device_health.get(device_name)
+    if health is None:
+        health = {
+            "state": "idle",          # idle / scanning / connecting / connected / backoff / stopped
+            "address": None,          # 上次連線的位址，重新連線時使用
+            "adapter": None,          # 目前 (或上次) 使用的適配器
+            "connected_since": None,
+            "total_uptime": 0.0,      # 之前各次連線的累計時間 (秒)
+            "connects": 0,
+            "reconnects": 0,
+            "disconnects": 0,
+            "failures": 0,
+            "last_error": None,
+            "next_retry_at": None
+        }
+        device_health[device_name] = health
+    return health
+
+def _reconnect_delay(attempt):
+    """第 attempt 次重試前的等待時間 (帶隨機抖動的指數退避)"""
+    delay = min(BLE_RECONNECT_MAX_DELAY, BLE_RECONNECT_BASE_DELAY * (2 ** attempt))
+    return delay * random.uniform(1.0 - BLE_RECONNECT_JITTER, 1.0 + BLE_RECONNECT_JITTER)
+
+def _mark_device_disconnected(device_name):
+    """清除裝置的連線狀態並累計連線時間"""
+    health = _get_device_health(device_name)
+    if health["connected_since"] is not None:
+        health["total_uptime"] += time.time() - health["connected_since"]
+        health["connected_since"] = None
+    device_clients.pop(device_name, None)
+    release_adapter(device_name)
+    device_connection_status[device_name] = False
+
+async def _supervise_device(device_name, sightings, ready):
+    """監督一個裝置的連線，斷線或連線失敗後退避並重試，直到被取消或服務停止"""
+    health = _get_device_health(device_name)
+    loop = asyncio.get_running_loop()
+    attempt = 0
+    client = None
+    
+    try:
+        while not ble_supervisor_stopping:
+            disconnected = asyncio.Event()
+            
+            def on_disconnect(_client, disconnected=disconnected):
+                # bleak 可能在其他執行緒呼叫斷線回調
+                loop.call_soon_threadsafe(disconnected.set)
+            
+            # 第一次使用搜尋結果，之後使用上次連線的位址 (適配器由排程重新挑選)
+            if sightings is None and health["address"] is None:
+                health["state"] = "scanning"
+                sightings = await wait_for_sighting(device_name)
+            
+            if sightings is None and health["address"] is None:
+                log_message(f"找不到裝置 {device_name}")
+                client = None
+            else:
+                health["state"] = "connecting"
+                client = await connect_to_device(device_name, sightings, health["address"], on_disconnect)
+            sightings = None
+            ready.set()
+            
+            if client is not None:
+                attempt = 0
+                health["connects"] += 1
+                if health["connects"] > 1:
+                    health["reconnects"] += 1
+                health.update(state="connected", address=client.address,
+                              adapter=device_adapter_assignments.get(device_name),
+                              connected_since=time.time(), last_error=None, next_retry_at=None)
+                device_clients[device_name] = client
+                
+                await disconnected.wait()
+                client = None
+                health["disconnects"] += 1
+                _mark_device_disconnected(device_name)
+                log_message(f"裝置 {device_name} 已斷線")
+                if ble_supervisor_stopping:
+                    break
+            else:
+                health["failures"] += 1
+            
+            delay = _reconnect_delay(attempt)
+            attempt += 1
+            health.update(state="backoff", next_retry_at=time.time() + delay)
+            log_message(f"{delay:.1f} 秒後重新連線 {device_name} (第 {attempt} 次重試)")
+            await asyncio.sleep(delay)
+    except asyncio.CancelledError:
+        if client is not None:
+            await _disconnect_device(client)
+        raise
+    finally:
+        ready.set()
+        _mark_device_disconnected(device_name)
+        health.update(state="stopped", next_retry_at=None)
+
+def start_device_supervisor(device_name, sightings=None):
+    """在目前的事件迴圈中啟動裝置的監督任務 (已在執行時不重複啟動)，回傳第一次連線嘗試結束的事件"""
+    ready = asyncio.Event()
+    task = ble_supervisor_tasks.get(device_name)
+    if task is not None and not task.done():
+        ready.set()
+        return ready
+    
+    ble_supervisor_tasks[device_name] = asyncio.ensure_future(_supervise_device(device_name, sightings, ready))
+    return ready
+
+async def stop_device_supervisors():
+    """停止所有監督任務並斷開連線"""
+    global ble_supervisor_stopping
+    ble_supervisor_stopping = True
+    tasks = [task for task in ble_supervisor_tasks.values() if not task.done()]
+    if ble_shared_scan is not None and not ble_shared_scan[1].done():
+        tasks.append(ble_shared_scan[1])
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    ble_supervisor_tasks.clear()
+
+def get_device_health():
+    """取得各裝置的連線健康狀態：目前狀態、本次與累計連線時間 (秒)、重新連線次數等"""
+    now = time.time()
+    result = {}
+    for device_name, health in list(device_health.items()):
+        uptime = now - health["connected_since"] if health["connected_since"] is not None else 0.0
+        result[device_name] = {
+            "state": health["state"],
+            "connected": health["connected_since"] is not None,
+            "address": health["address"],
+            "adapter": health["adapter"],
+            "uptime": uptime,
+            "total_uptime": health["total_uptime"] + uptime,
+            "connects": health["connects"],
+            "reconnects": health["reconnects"],
+            "disconnects": health["disconnects"],
+            "failures": health["failures"],
+            "last_error": health["last_error"],
+            "retry_in": max(0.0, health["next_retry_at"] - now) if health["next_retry_at"] else None
+        }
+    return result
+
 # 手動連接到指定設備
 async def connect_to_specific_device(device_name):
     if device_name not in ESP32_DEVICES:
         ESP32_DEVICES.append(device_name)
         device_connection_status[device_name] = False
+    
+    loop = ble_loop
+    if loop is not None and loop.is_running():
+        # 監督任務必須在藍牙服務的事件迴圈中執行，否則呼叫端的迴圈結束時會被取消
+        async def start_and_wait():
+            await start_device_supervisor(device_name).wait()
+            return device_connection_status.get(device_name, False)
         
+        if loop is asyncio.get_running_loop():
+            return await start_and_wait()
+        future = asyncio.run_coroutine_threadsafe(start_and_wait(), loop)
+        return await asyncio.wrap_future(future)
+    
+    # 藍牙服務尚未啟動時只連線一次
     client = await connect_to_device(device_name)
+    if client is not None:
+        device_clients[device_name] = client
     return client is not None
 
 # 更新設備連接狀態
@@ -2157,60 +4701,28 @@ def get_message_log():
 
 # 設置音樂檔案路徑
 def set_music_file_path(index, new_path):
-    global music_files
-    if index in music_files and os.path.exists(new_path):
-        music_files[index] = new_path
-        # 重新加載音頻文件
-        try:
-            wf = wave.open(new_path, 'rb')
-            audio_data = {
-                'format': wf.getsampwidth(),
-                'channels': wf.getnchannels(),
-                'rate': wf.getframerate(),
-                'frames': wf.readframes(wf.getnframes())
-            }
-            loaded_audio_data[new_path] = audio_data
-            wf.close()
-            log_message(f"已更新並加載音樂 {index}: {new_path}")
-            return True
-        except Exception as e:
-            log_message(f"加載 {new_path} 時發生錯誤: {e}")
-            return False
-    return False
+    if index not in music_files:
+        return False
+    # 透過音效登錄表載入新檔案，舊檔案沒有其他名稱使用時會被釋放
+    return set_asset_path("music", index, new_path)
 
 # 設置RDP音效文件路徑
 def set_rdp_audio_files_path(key, new_path):
     """設置特定 RDP 音效文件路徑"""
-    global rdp_audio_files
-    if os.path.exists(new_path):
-        rdp_audio_files[key] = new_path
-        # 重新加載音頻文件
-        try:
-            wf = wave.open(new_path, 'rb')
-            audio_data = {
-                'format': wf.getsampwidth(),
-                'channels': wf.getnchannels(),
-                'rate': wf.getframerate(),
-                'frames': wf.readframes(wf.getnframes())
-            }
-            loaded_audio_data[new_path] = audio_data
-            wf.close()
-            log_message(f"已更新並加載 RDP 音效 {key}: {new_path}")
-            return True
-        except Exception as e:
-            log_message(f"加載 {new_path} 時發生錯誤: {e}")
-            return False
-    return False
+    return set_asset_path("rdp", key, new_path)
 
 # 初始化並啟動藍牙服務
 async def start_bluetooth_service():
-    preload_audio_files()
-    # 連接到所有ESP32設備
-    clients = []
-    for device_name in ESP32_DEVICES:
-        client = await connect_to_device(device_name)
-        if client:
-            clients.append(client)
+    global ble_loop, ble_supervisor_stopping
+    ble_loop = asyncio.get_running_loop()
+    ble_supervisor_stopping = False
+    reload_command_map()
+    # 音效在背景執行緒池中載入，同時開始搜尋並連接裝置
+    preload_audio_files(wait=False)
+    start_asset_reload_service()
+    # 一次搜尋所有ESP32設備，再同時連線
+    clients = await connect_devices(ESP32_DEVICES)
+    log_startup_report()
     
     # 保持連接並處理資料
     try:
@@ -2218,12 +4730,8 @@ async def start_bluetooth_service():
             await asyncio.sleep(0.1)  # 小延遲，讓其他任務有機會執行
     except Exception as e:
         log_message(f"藍牙服務發生錯誤: {e}")
-        # 斷開所有連接
-        for client in clients:
-            try:
-                await client.disconnect()
-            except:
-                pass
+        # 停止監督任務並斷開所有連接
+        await stop_device_supervisors()
 
 # 啟動後端服務的函數 (用於從UI調用)
 def start_backend():
@@ -2235,9 +4743,8 @@ def start_backend():
     
     # 在新線程中啟動藍牙和串口服務
     def run_async_loop():
-        # 先嘗試自動連接串口裝置
-        # auto_connect_result = auto_connect_serial_device(preferred_ports=['COM11'])
-        # log_message(f"有線裝置自動連接結果: {auto_connect_result}")
+        # 串口裝置由背景串口管理連接，插拔後會自動重新連接
+        start_serial_manager(preferred_ports=['COM11'])
         
         # 然後啟動藍牙服務
         asyncio.run(start_bluetooth_service())
@@ -2297,6 +4804,10 @@ def stop_current_audio():
     for device_name in device_audio_threads.keys():
         stop_device_audio(device_name)
     
+    # 循環重放等裝置以外的語音也一併淡出
+    if mixer_stream is not None:
+        mixer_stop_all()
+    
     # 停止歌單控制器的音訊
     songlist_stop_music()
     
@@ -2315,22 +4826,27 @@ def get_songlist_controller_status():
     }
 
 def standardize_audio_file(input_file, output_file):
-    """使用標準格式處理音訊檔案，確保在不同裝置上播放速度一致"""
+    """使用 ffmpeg 把音訊檔案轉成標準格式，只用於行程內無法解碼的格式 (一般檔案請用 get_normalized_path)"""
     try:
         import subprocess
         
         # 使用 ffmpeg 將音訊檔案轉換為標準格式（44.1kHz、16位、立體聲）
-        subprocess.call([
-            'ffmpeg', '-i', input_file,
+        subprocess.run([
+            'ffmpeg', '-y', '-i', input_file,
             '-ar', '44100',  # 設定採樣率為 44.1kHz
             '-acodec', 'pcm_s16le',  # 16位編碼
             '-ac', '2',  # 立體聲
             output_file
-        ])
+        ], stdin=subprocess.DEVNULL, check=True)
         
         return output_file
     except Exception as e:
         log_message(f"標準化音訊檔案時發生錯誤: {e}")
+        # ffmpeg 失敗時可能留下不完整的檔案，不能被當成轉檔結果
+        try:
+            os.remove(output_file)
+        except OSError:
+            pass
         return input_file
 
 def start_recording(selected_device_index=None):
@@ -2724,7 +5240,130 @@ def record_audio_stream(filename):
         is_recording = False
         # 清空緩衝區，為下次錄音做準備
         audio_buffer = []
+# ========== 啟動效能分析 ==========
+# 不開 UI、不連線的啟動流程，量測各階段耗時並輸出 JSON 報告，用來比較不同版本與音效數量的開機時間
+# 使用方式: python backend.py --profile-startup [報告路徑] [--no-ble]
+
+PROFILE_REPORT_PATH = os.path.join(STORAGE_DIR, "startup_profile.json")
+PROFILE_SCAN_TIMEOUT = 10.0  # 藍牙搜尋逾時 (秒)
+
+async def _profile_ble_discovery():
+    """以一次共用搜尋找出所有裝置 (只搜尋不連線)，回傳各裝置被找到的時間"""
+    try:
+        found = await discover_devices(ESP32_DEVICES, timeout=PROFILE_SCAN_TIMEOUT)
+    except ImportError as e:
+        return [{"device": name, "error": f"bleak 未安裝: {e}"} for name in ESP32_DEVICES]
+    
+    results = []
+    for device_name in ESP32_DEVICES:
+        entry = {"device": device_name, "found": device_name in found}
+        if device_name in found:
+            entry.update(ble_discovery_results[device_name])
+            entry["adapters"] = sorted(found[device_name])
+        results.append(entry)
+    return results
+
+def _time_first_block(file_path):
+    """取得音效、建立語音並渲染第一個區塊，回傳 (耗時, 錯誤訊息)"""
+    started = time.perf_counter()
+    error = None
+    try:
+        voice = _build_mixer_voice("Profile", file_path)
+        if voice is None:
+            error = "無法建立語音"
+        else:
+            _render_voice(voice, MIXER_BLOCK_SIZE)
+    except Exception as e:
+        error = str(e)
+    return time.perf_counter() - started, error
+
+def _profile_first_trigger():
+    """模擬第一次觸發：先把音效移出儲存區，量測未快取時載入、建立語音並渲染第一個區塊的耗時，
+    再量測已快取時同樣流程的耗時
+    """
+    ordered = [(label, file_path) for label, file_path in _preload_order() if file_path in loaded_audio_data]
+    if not ordered:
+        return None
+    
+    label, file_path = ordered[0]
+    result = {"asset": label, "path": file_path}
+    
+    # 預加載已經把音效放進儲存區，先移除才能量測觸發時才載入的情況
+    release_audio_asset(file_path)
+    result["seconds"], error = _time_first_block(file_path)
+    if error is not None:
+        result["error"] = error
+        return result
+    
+    result["cached_seconds"], error = _time_first_block(file_path)
+    if error is not None:
+        result["error"] = error
+    return result
+
+def profile_startup(report_path=None, discover_ble=True):
+    """執行不開 UI 的啟動流程並寫出 JSON 報告，回傳報告內容"""
+    report_path = report_path or PROFILE_REPORT_PATH
+    log_message("開始啟動效能分析...")
+    
+    initialize_audio_system()
+    
+    # 速度版本在背景行程中產生，不在開機的關鍵路徑上，這裡不量測
+    started = time.perf_counter()
+    preload_audio_files(build_variants=False, wait=True)
+    preload_seconds = time.perf_counter() - started
+    
+    assets = []
+    for label, file_path in _preload_order():
+        audio_data = loaded_audio_data.get(file_path)
+        assets.append({
+            "asset": label,
+            "path": file_path,
+            "loaded": audio_data is not None,
+            "seconds": preload_asset_timings.get(file_path),
+            "bytes": len(audio_data['frames']) if audio_data is not None else None
+        })
+    
+    ble = asyncio.run(_profile_ble_discovery()) if discover_ble else []
+    first_trigger = _profile_first_trigger()
+    
+    audio_backend = "numpy_mixer" if mixer_stream is not None else ("pygame" if audio_mixer is not None else None)
+    if mixer_stream is not None:
+        stop_audio_mixer()
+    
+    report = {
+        "generated_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "platform": sys.platform,
+        "audio_backend": audio_backend,
+        "startup": get_startup_report(),
+        "preload": {
+            "seconds": preload_seconds,
+            "workers": PRELOAD_WORKERS,
+            "loaded": sum(1 for asset in assets if asset["loaded"]),
+            "failed": sum(1 for asset in assets if not asset["loaded"]),
+            "assets": assets
+        },
+        "ble_discovery": ble,
+        "first_trigger": first_trigger
+    }
+    
+    with open(report_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    log_message(f"啟動效能報告已寫入: {report_path}")
+    return report
+
+record_startup_stage("import backend", time.perf_counter() - _import_started)
+
 if __name__ == "__main__":
+    if "--profile-startup" in sys.argv:
+        # 啟動效能分析模式，--profile-startup 後面可接報告路徑
+        index = sys.argv.index("--profile-startup")
+        path_arg = sys.argv[index + 1] if index + 1 < len(sys.argv) else None
+        if path_arg is not None and path_arg.startswith("--"):
+            path_arg = None
+        profile_startup(path_arg, discover_ble="--no-ble" not in sys.argv)
+        sys.exit(0)
+    
     # 執行主函數
     asyncio.run(start_bluetooth_service())
     
\ No newline at end of file
@@ -3,10 +3,13 @@ import numpy as np
 from bleak import BleakClient, BleakScanner
 import pyaudio
 import wave
+import mmap
+import struct
 import threading
 import os
 import time
-from scipy import signal
+from numpy.lib.stride_tricks import sliding_window_view
+from fractions import Fraction
 import json
 import tempfile
 
@@ -30,6 +33,12 @@ loaded_audio_data = {}
 is_connected = False
 client = None
 
+# PyAudio 主機與輸出串流池 (整個程式只初始化一次 PyAudio)
+OUTPUT_STREAM_POOL_MAX_IDLE = 2  # 每種格式最多保留的閒置串流數
+pyaudio_host = None
+output_stream_pool = {}  # (取樣寬度, 聲道數, 採樣率) -> 閒置串流列表
+output_stream_pool_lock = threading.Lock()
+
 COMM_FILE = os.path.join(tempfile.gettempdir(), "songlist_controller_comm.json")
 STATUS_FILE = COMM_FILE + ".status"
 
@@ -138,15 +147,7 @@ def update_config(config_data):
                     
                     # 重新載入音訊檔案
                     try:
-                        wf = wave.open(path, 'rb')
-                        audio_data = {
-                            'format': wf.getsampwidth(),
-                            'channels': wf.getnchannels(),
-                            'rate': wf.getframerate(),
-                            'frames': wf.readframes(wf.getnframes())
-                        }
-                        loaded_audio_data[path] = audio_data
-                        wf.close()
+                        loaded_audio_data[path] = load_audio_file(path)
                         log_message(f"已重新載入音訊檔案: {path}")
                     except Exception as e:
                         log_message(f"載入音訊檔案失敗: {e}")
@@ -163,6 +164,113 @@ def log_message(message):
     formatted_message = f"[{timestamp}] {message}"
     print(formatted_message)
 
+def get_pyaudio_host():
+    """取得共用的 PyAudio 主機"""
+    global pyaudio_host
+    with output_stream_pool_lock:
+        if pyaudio_host is None:
+            pyaudio_host = pyaudio.PyAudio()
+        return pyaudio_host
+
+def borrow_output_stream(sample_width, channels, rate):
+    """從串流池借出一個已開啟的輸出串流，沒有閒置串流時才開新的"""
+    stream = None
+    with output_stream_pool_lock:
+        idle_streams = output_stream_pool.get((sample_width, channels, rate))
+        if idle_streams:
+            stream = idle_streams.pop()
+    
+    if stream is None:
+        host = get_pyaudio_host()
+        stream = host.open(format=host.get_format_from_width(sample_width),
+                           channels=channels,
+                           rate=rate,
+                           output=True)
+    elif stream.is_stopped():
+        stream.start_stream()
+    return stream
+
+def return_output_stream(stream, sample_width, channels, rate):
+    """把輸出串流歸還到串流池，超過保留數量時才關閉"""
+    with output_stream_pool_lock:
+        idle_streams = output_stream_pool.setdefault((sample_width, channels, rate), [])
+        if len(idle_streams) < OUTPUT_STREAM_POOL_MAX_IDLE:
+            idle_streams.append(stream)
+            return
+    try:
+        stream.stop_stream()
+        stream.close()
+    except Exception as e:
+        log_message(f"關閉輸出串流時發生錯誤: {e}")
+
+def map_wav_file(file_path):
+    """以記憶體映射開啟 WAV 檔，frames 是 PCM 資料區段的唯讀 memoryview，不會複製資料
+    
+    作業系統的頁面快取會與主程式共用。不是 PCM 格式或無法映射時回傳 None。
+    """
+    with open(file_path, 'rb') as f:
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            return None  # 空檔案無法映射
+    
+    try:
+        if mm[0:4] != b'RIFF' or mm[8:12] != b'WAVE':
+            raise ValueError("不是 RIFF/WAVE 檔案")
+        
+        fmt = None
+        offset = 12
+        while offset + 8 <= len(mm):
+            chunk_id = mm[offset:offset + 4]
+            chunk_size = struct.unpack_from('<I', mm, offset + 4)[0]
+            body = offset + 8
+            
+            if chunk_id == b'fmt ':
+                tag, channels, rate, _, _, bits = struct.unpack_from('<HHIIHH', mm, body)
+                if tag == 0xFFFE and chunk_size >= 26:
+                    tag = struct.unpack_from('<H', mm, body + 24)[0]  # WAVE_FORMAT_EXTENSIBLE 的子格式
+                if tag != 1:
+                    mm.close()
+                    return None
+                fmt = (channels, rate, (bits + 7) // 8)
+            elif chunk_id == b'data' and fmt is not None:
+                channels, rate, width = fmt
+                # 錄音中斷的檔案長度欄位可能不正確，以實際檔案大小為準
+                size = min(chunk_size, len(mm) - body)
+                size -= size % (width * channels)
+                return {
+                    'format': width,
+                    'channels': channels,
+                    'rate': rate,
+                    'frames': memoryview(mm)[body:body + size],
+                    'mmap': mm
+                }
+            
+            offset = body + chunk_size + (chunk_size & 1)
+        
+        raise ValueError("找不到 fmt 或 data 區段")
+    except Exception:
+        mm.close()
+        raise
+
+def load_audio_file(file_path):
+    """載入音效檔案，優先使用記憶體映射，播放時切片不會複製資料"""
+    audio_data = map_wav_file(file_path)
+    if audio_data is not None:
+        return audio_data
+    
+    wf = wave.open(file_path, 'rb')
+    try:
+        return {
+            'format': wf.getsampwidth(),
+            'channels': wf.getnchannels(),
+            'rate': wf.getframerate(),
+            'frames': wf.readframes(wf.getnframes()),  # 讀取整個檔案
+            'mmap': None
+        }
+    finally:
+        wf.close()
+
 def preload_audio_files():
     """預先加載所有音效檔案到記憶體中"""
     global loaded_audio_data
@@ -172,34 +280,138 @@ def preload_audio_files():
     # 加載音樂檔案
     for key, file_path in music_files.items():
         try:
-            wf = wave.open(file_path, 'rb')
-            audio_data = {
-                'format': wf.getsampwidth(),
-                'channels': wf.getnchannels(),
-                'rate': wf.getframerate(),
-                'frames': wf.readframes(wf.getnframes())  # 讀取整個檔案
-            }
-            loaded_audio_data[file_path] = audio_data
-            wf.close()
+            loaded_audio_data[file_path] = load_audio_file(file_path)
             log_message(f"已加載: {file_path}")
         except Exception as e:
             log_message(f"加載 {file_path} 時發生錯誤: {e}")
+    
+    # 依已載入音樂的格式預先開啟輸出串流，第一次播放時不必等待裝置初始化
+    formats = {(data['format'], data['channels'], data['rate']) for data in loaded_audio_data.values()}
+    for sample_width, channels, rate in formats:
+        try:
+            return_output_stream(borrow_output_stream(sample_width, channels, rate), sample_width, channels, rate)
+        except Exception as e:
+            log_message(f"預先開啟輸出串流失敗: {e}")
 
-def change_playback_speed(audio_data, speed):
-    """改變音訊資料的播放速度"""
+# ========== 多相重取樣器 ==========
+# 以視窗化 sinc 設計的多相濾波器組做變速，各聲道分開處理，可一次處理整首或分區塊串流處理
+
+RESAMPLE_HALF_TAPS = 16          # 濾波器單側長度 (輸入樣本數)
+RESAMPLE_MAX_DENOMINATOR = 100   # 速度比例化為分數時允許的最大分母
+
+resample_filter_cache = {}       # (up, down) -> (濾波器組, 單側長度)
+resample_filter_cache_lock = threading.Lock()
+
+def _get_resample_filter_bank(up, down):
+    """取得 (並快取) 指定比例的多相濾波器組，形狀為 (up, 濾波器長度)"""
+    key = (up, down)
+    with resample_filter_cache_lock:
+        cached = resample_filter_cache.get(key)
+    if cached is not None:
+        return cached
+    
+    # 降低採樣率時截止頻率跟著降低，濾波器加長以維持相同的過渡帶
+    cutoff = min(1.0, up / down)
+    half = int(np.ceil(RESAMPLE_HALF_TAPS / cutoff))
+    
+    # 第 p 個相位對應輸出位置的小數部分 p / up，濾波器覆蓋 base-half+1 ~ base+half
+    offsets = np.arange(up)[:, None] / up - np.arange(-half + 1, half + 1)[None, :]
+    window = 0.42 + 0.5 * np.cos(np.pi * offsets / half) + 0.08 * np.cos(2 * np.pi * offsets / half)
+    window[np.abs(offsets) >= half] = 0.0
+    bank = cutoff * np.sinc(cutoff * offsets) * window
+    # 每個相位正規化為單位直流增益
+    bank /= bank.sum(axis=1, keepdims=True)
+    
+    cached = (bank.astype(np.float32), half)
+    with resample_filter_cache_lock:
+        resample_filter_cache[key] = cached
+    return cached
+
+def create_resampler(speed, channels):
+    """建立串流重取樣器狀態，speed > 1 時加速 (樣本數變少)"""
+    ratio = Fraction(speed).limit_denominator(RESAMPLE_MAX_DENOMINATOR)
+    up, down = ratio.denominator, ratio.numerator
+    bank, half = _get_resample_filter_bank(up, down)
+    return {
+        'up': up,
+        'down': down,
+        'bank': bank,
+        'half': half,
+        'channels': channels,
+        # 緩衝區開頭補上 half - 1 個靜音，讓第一個輸出樣本也有完整的歷史資料
+        'buffer': np.zeros((half - 1, channels), dtype=np.float32),
+        'buffer_start': -(half - 1),  # 緩衝區第一個樣本的絕對輸入索引
+        'next_output': 0,             # 下一個輸出樣本的絕對索引
+        'input_total': 0              # 已輸入的幀數
+    }
+
+def resample_block(state, block):
+    """把一個區塊 (幀數 x 聲道) 送進重取樣器，回傳目前可以輸出的 float32 幀"""
+    up, down, half = state['up'], state['down'], state['half']
+    block = np.asarray(block, dtype=np.float32).reshape(-1, state['channels'])
+    state['input_total'] += len(block)
+    
+    buffer = np.concatenate((state['buffer'], block)) if len(block) else state['buffer']
+    buffer_start = state['buffer_start']
+    buffer_end = buffer_start + len(buffer)
+    
+    # 輸出 n 需要輸入索引 base-half+1 ~ base+half，其中 base = n * down // up
+    first = state['next_output']
+    last = ((buffer_end - half) * up - 1) // down
+    count = max(0, last - first + 1)
+    output = np.empty((count, state['channels']), dtype=np.float32)
+    
+    if count > 0:
+        # 每個輸入視窗都是緩衝區的視圖，不複製資料：(視窗數, 聲道, 濾波器長度)
+        windows = sliding_window_view(buffer, 2 * half, axis=0)
+        for residue in range(min(up, count)):
+            # 同一個相位的輸出彼此相隔 up 幀，對應的輸入視窗相隔 down 幀
+            n0 = first + residue
+            phase = (n0 * down) % up
+            start = (n0 * down) // up - half + 1 - buffer_start
+            selected = windows[start::down][:len(range(residue, count, up))]
+            output[residue::up] = selected @ state['bank'][phase]
+    
+    state['next_output'] = first + count
+    
+    # 只保留下一個輸出還需要用到的輸入樣本
+    keep_from = (state['next_output'] * down) // up - half + 1
+    drop = min(max(0, keep_from - buffer_start), len(buffer))
+    state['buffer'] = buffer[drop:]
+    state['buffer_start'] = buffer_start + drop
+    
+    return output
+
+def flush_resampler(state):
+    """輸入結束時補上靜音，輸出剩餘的樣本"""
+    input_total = state['input_total']
+    tail = resample_block(state, np.zeros((state['half'], state['channels']), dtype=np.float32))
+    
+    # 總輸出幀數 = ceil(輸入幀數 * up / down)
+    expected_total = -(-input_total * state['up'] // state['down'])
+    emitted_before = state['next_output'] - len(tail)
+    return tail[:max(0, expected_total - emitted_before)]
+
+def resample_frames(samples, speed):
+    """一次重取樣整段樣本 (幀數 x 聲道)，回傳 float32 陣列"""
+    state = create_resampler(speed, samples.shape[1])
+    head = resample_block(state, samples)
+    return np.concatenate((head, flush_resampler(state)))
+
+def change_playback_speed(audio_data, speed, channels=2):
+    """改變音訊資料 (16 位元 PCM bytes) 的播放速度，各聲道分開重取樣"""
     if speed == 1.0:
         return audio_data  # 速度不變，直接返回原始資料
-        
-    # 將位元組資料轉換為 numpy 陣列
+    
+    # 將位元組資料轉換為 (幀數 x 聲道) 的 numpy 陣列
     audio_array = np.frombuffer(audio_data, dtype=np.int16)
+    audio_array = audio_array[:len(audio_array) - len(audio_array) % channels].reshape(-1, channels)
     
-    # 使用 resample 函數來改變速度
     # 速度增加，樣本數減少；速度減少，樣本數增加
-    new_length = int(len(audio_array) / speed)
-    new_audio = signal.resample(audio_array, new_length)
+    new_audio = resample_frames(audio_array, speed)
     
     # 將處理後的資料轉回位元組格式
-    return new_audio.astype(np.int16).tobytes()
+    return np.clip(np.rint(new_audio), -32768, 32767).astype(np.int16).tobytes()
 
 def play_audio_loop(file_path, initial_speed=1.0):
     """使用預加載的資料循環播放音訊，支援速度控制"""
@@ -211,7 +423,6 @@ def play_audio_loop(file_path, initial_speed=1.0):
     
     playback_speed = initial_speed
     audio_data = loaded_audio_data[file_path]
-    p = pyaudio.PyAudio()
     
     # 取得原始資料
     original_frames = audio_data['frames']
@@ -219,37 +430,30 @@ def play_audio_loop(file_path, initial_speed=1.0):
     
     stop_flag = False
     
-    # 循環播放
-    while not stop_flag:
-        # 根據當前速度計算新的播放率
-        adjusted_rate = int(original_rate * playback_speed)
-        
-        # 開啟新的音訊流，使用調整後的播放率
-        stream = p.open(format=p.get_format_from_width(audio_data['format']),
-                       channels=audio_data['channels'],
-                       rate=adjusted_rate,
-                       output=True)
-                       
-        log_message(f"播放速度已設定為: {playback_speed}, 調整後播放率: {adjusted_rate}")
-        
-        # 分段播放整個檔案
-        chunk = 256
-        for i in range(0, len(original_frames), chunk * audio_data['format'] * audio_data['channels']):
-            if stop_flag:
-                break
-                
-            chunk_data = original_frames[i:i + chunk * audio_data['format'] * audio_data['channels']]
-            if len(chunk_data) > 0:
-                # 這裡直接使用原始數據，因為已經通過調整採樣率來改變播放速度
-                stream.write(chunk_data)
-        
-        # 關閉流，準備下一次迭代
-        stream.stop_stream()
-        stream.close()
+    # 根據當前速度計算新的播放率，整段循環期間共用同一個串流
+    adjusted_rate = int(original_rate * playback_speed)
+    stream = borrow_output_stream(audio_data['format'], audio_data['channels'], adjusted_rate)
+    log_message(f"播放速度已設定為: {playback_speed}, 調整後播放率: {adjusted_rate}")
     
-    # 清理資源
-    p.terminate()
-    log_message("音訊播放停止")
+    try:
+        # 循環播放
+        while not stop_flag:
+            # 分段播放整個檔案
+            chunk = 256
+            for i in range(0, len(original_frames), chunk * audio_data['format'] * audio_data['channels']):
+                if stop_flag:
+                    break
+                    
+                chunk_data = original_frames[i:i + chunk * audio_data['format'] * audio_data['channels']]
+                if len(chunk_data) > 0:
+                    # 這裡直接使用原始數據，因為已經通過調整採樣率來改變播放速度
+                    stream.write(chunk_data)
+    except Exception as e:
+        log_message(f"循環播放音訊時出錯: {e}")
+    finally:
+        # 歸還串流，留給下一次播放使用
+        return_output_stream(stream, audio_data['format'], audio_data['channels'], adjusted_rate)
+        log_message("音訊播放停止")
 
 def play_audio_once(file_path, speed=1.0):
     """使用預加載的資料播放音訊一次，支援即時速度控制"""
@@ -265,7 +469,6 @@ def play_audio_once(file_path, speed=1.0):
         return
     
     audio_data = loaded_audio_data[file_path]
-    p = pyaudio.PyAudio()
     
     # 取得原始資料
     original_format = audio_data['format']
@@ -276,11 +479,8 @@ def play_audio_once(file_path, speed=1.0):
     # 調整播放速率根據速度參數
     adjusted_rate = int(original_rate * speed)
     
-    # 開啟音訊流，使用調整後的播放率
-    stream = p.open(format=p.get_format_from_width(original_format),
-                   channels=original_channels,
-                   rate=adjusted_rate,  # 使用調整後的播放率
-                   output=True)
+    # 從串流池借用調整後播放率的輸出串流
+    stream = borrow_output_stream(original_format, original_channels, adjusted_rate)
     
     log_message(f"單次播放速度設定為: {speed}, 調整後播放率: {adjusted_rate}")
     
@@ -305,16 +505,8 @@ def play_audio_once(file_path, speed=1.0):
     except Exception as e:
         log_message(f"播放音訊時出錯: {e}")
     finally:
-        # 釋放資源
-        try:
-            stream.stop_stream()
-            stream.close()
-        except:
-            pass
-        try:
-            p.terminate()
-        except:
-            pass
+        # 歸還串流，不關閉裝置
+        return_output_stream(stream, original_format, original_channels, adjusted_rate)
         log_message("單次音訊播放完成")
 
 def stop_audio():